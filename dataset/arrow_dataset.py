@@ -0,0 +1,209 @@
+import contextlib
+import fcntl
+import functools
+import hashlib
+import inspect
+import json
+import os
+import time
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+def record_batch_chunks(reader, chunksize, columns=None):
+    """Iterate over DataFrames of chunksize rows converted from record batches of Arrow IPC
+    file reader. Only batches of current chunk are read and converted, so memory used by
+    every chunk doesn't depend on size of file"""
+
+    batches = []
+    rows = 0
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        if columns is not None:
+            batch = batch.select(columns)
+        offset = 0
+        while offset < batch.num_rows:
+            piece = batch.slice(offset, chunksize - rows)
+            batches.append(piece)
+            rows += piece.num_rows
+            offset += piece.num_rows
+            if rows == chunksize:
+                yield pa.Table.from_batches(batches).to_pandas(split_blocks=True)
+                batches = []
+                rows = 0
+    if batches:
+        yield pa.Table.from_batches(batches).to_pandas(split_blocks=True)
+
+@functools.lru_cache(maxsize=None)
+def reader_version(read_func):
+    """Hash of source code of read_func and of functions and values of module globals
+    it uses, e.g. names and dtypes of columns. Files converted by other version of
+    reader are stale"""
+
+    parts = []
+    visited = set()
+
+    def visit_code(code, module_globals, module_name):
+        for name in code.co_names:
+            value = module_globals.get(name)
+            if inspect.isfunction(value):
+                if value.__module__ == module_name:
+                    visit_function(value)
+            elif value is not None and not inspect.ismodule(value) and not inspect.isclass(value):
+                parts.append("%s=%r" % (name, value))
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                visit_code(const, module_globals, module_name)
+
+    def visit_function(func):
+        if func in visited:
+            return
+        visited.add(func)
+        try:
+            parts.append(inspect.getsource(func))
+        except (OSError, TypeError):
+            parts.append(func.__module__ + "." + func.__qualname__)
+        visit_code(func.__code__, func.__globals__, func.__module__)
+
+    visit_function(inspect.unwrap(read_func))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+class ArrowDataset:
+    """Directory of uncompressed Arrow IPC files converted from datafiles once and
+    memory-mapped by benchmarks. Manifest describes source of every file."""
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, dataset_dir):
+        if pa is None:
+            raise ImportError("pyarrow is required to use Arrow dataset in " + dataset_dir)
+        self._dataset_dir = dataset_dir
+        if not os.path.isdir(dataset_dir):
+            os.makedirs(dataset_dir)
+        self._manifest_path = os.path.join(dataset_dir, self.manifest_name)
+
+    @contextlib.contextmanager
+    def _locked_manifest(self):
+        # Datafiles can be converted concurrently by several processes
+        with open(self._manifest_path + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self._read_manifest()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, 'r') as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        tmp_path = "%s.%d" % (self._manifest_path, os.getpid())
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _arrow_file_name(self, file_name, dataset_name):
+        source = os.path.abspath(file_name)
+        digest = hashlib.sha1(source.encode()).hexdigest()[:16]
+        return "%s_%s_%s.arrow" % (dataset_name, os.path.basename(source).split('.')[0], digest)
+
+    def _entry(self, file_name, dataset_name, read_func):
+        "Return manifest entry for file if it is converted from current version of file by current version of read_func"
+
+        entry = self._read_manifest().get(self._arrow_file_name(file_name, dataset_name))
+        if entry is None:
+            return None
+        stat = os.stat(file_name)
+        if entry['source_size'] != stat.st_size or entry['source_mtime_ns'] != stat.st_mtime_ns:
+            return None
+        if entry.get('reader_version') != reader_version(read_func):
+            return None
+        return entry
+
+    def converted(self, file_name, dataset_name, read_func):
+        "Check that datafile is converted from its current version by current version of read_func"
+
+        return self._entry(file_name, dataset_name, read_func) is not None
+
+    def load(self, file_name, dataset_name, read_func, columns=None):
+        "Memory-map converted datafile and return DataFrame or None if file is not converted"
+
+        if self._entry(file_name, dataset_name, read_func) is None:
+            return None
+        arrow_path = os.path.join(self._dataset_dir, self._arrow_file_name(file_name, dataset_name))
+        print("Mapping datafile", file_name, "from", arrow_path)
+        table = pa.ipc.open_file(pa.memory_map(arrow_path, 'r')).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        # Columns without nulls are not copied, DataFrame references mapped pages
+        return table.to_pandas(split_blocks=True)
+
+    def load_chunks(self, file_name, dataset_name, read_func, chunksize, columns=None):
+        "Memory-map converted datafile and return iterator over DataFrames of chunksize rows or None if file is not converted"
+
+        if self._entry(file_name, dataset_name, read_func) is None:
+            return None
+        arrow_path = os.path.join(self._dataset_dir, self._arrow_file_name(file_name, dataset_name))
+        print("Mapping datafile by chunks", file_name, "from", arrow_path)
+        return record_batch_chunks(pa.ipc.open_file(pa.memory_map(arrow_path, 'r')), chunksize, columns)
+
+    def convert(self, file_name, dataset_name, read_func):
+        "Read datafile by read_func(file_name) and store it in Arrow IPC format, return manifest entry"
+
+        stat = os.stat(file_name)
+        t0 = time.time()
+        df = read_func(file_name)
+        t_read = time.time() - t0
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        del df
+        arrow_file_name = self._arrow_file_name(file_name, dataset_name)
+        arrow_path = os.path.join(self._dataset_dir, arrow_file_name)
+        tmp_path = "%s.%d" % (arrow_path, os.getpid())
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, arrow_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        entry = {
+            'source': os.path.abspath(file_name),
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'dataset': dataset_name,
+            'reader_version': reader_version(read_func),
+            'rows': table.num_rows,
+            'columns': table.schema.names,
+            'bytes': os.path.getsize(arrow_path),
+            'read_time': round(t_read, 3)
+        }
+        with self._locked_manifest() as manifest:
+            manifest[arrow_file_name] = entry
+            self._write_manifest(manifest)
+        print("Converted datafile", file_name, "to", arrow_path, "rows:", entry['rows'], "bytes:", entry['bytes'])
+        return entry
+
+    def read(self, file_name, dataset_name, read_func, columns=None):
+        "Return DataFrame memory-mapped from converted datafile, convert it first if necessary"
+
+        df = self.load(file_name, dataset_name, read_func, columns)
+        if df is None:
+            self.convert(file_name, dataset_name, read_func)
+            df = self.load(file_name, dataset_name, read_func, columns)
+        return df
+
+    def read_chunks(self, file_name, dataset_name, read_func, chunksize, columns=None):
+        "Return iterator over DataFrames of chunksize rows memory-mapped from converted datafile, convert it first if necessary"
+
+        chunks = self.load_chunks(file_name, dataset_name, read_func, chunksize, columns)
+        if chunks is None:
+            self.convert(file_name, dataset_name, read_func)
+            chunks = self.load_chunks(file_name, dataset_name, read_func, chunksize, columns)
+        return chunks
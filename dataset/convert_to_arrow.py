@@ -0,0 +1,44 @@
+from braceexpand import braceexpand
+import concurrent.futures
+import multiprocessing
+import argparse
+import time
+import glob
+import sys
+import os
+
+from arrow_dataset import ArrowDataset
+import datasets
+
+parser = argparse.ArgumentParser(description='Convert benchmark datafiles to Arrow IPC files that are memory-mapped by benchmarks.')
+
+parser.add_argument('-dataset', required=True, choices=sorted(datasets.readers.keys()), help="Name of dataset that defines schema of datafiles.")
+parser.add_argument('-dp', required=True, help="Wildcard pattern of datafiles that should be converted.")
+parser.add_argument('-o', dest="output", required=True, help="Directory of Arrow dataset. Benchmarks use it with -arrow-dir switch.")
+parser.add_argument('-workers', type=int, help="Number of processes that convert datafiles in parallel. By default number of CPUs is used.")
+parser.add_argument('-force', action='store_true', help="Convert datafiles that are already converted.")
+
+args = parser.parse_args()
+
+data_files_names = list(braceexpand(args.dp))
+data_files_names = sorted([x for f in data_files_names for x in glob.glob(f)])
+if len(data_files_names) == 0:
+    print("Could not find any data files matching", args.dp)
+    sys.exit(2)
+
+arrow_dataset = ArrowDataset(args.output)
+if not args.force:
+    data_files_names = [f for f in data_files_names if not arrow_dataset.converted(f, args.dataset, datasets.readers[args.dataset])]
+print("CONVERTING", len(data_files_names), "DATAFILES")
+
+def convert(file_name):
+    return arrow_dataset.convert(file_name, args.dataset, datasets.readers[args.dataset])
+
+t0 = time.time()
+workers = min(args.workers or os.cpu_count(), max(len(data_files_names), 1))
+with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+    entries = list(pool.map(convert, data_files_names))
+t_convert = time.time() - t0
+
+print("CONVERTED", len(entries), "DATAFILES,", sum(entry['rows'] for entry in entries), "ROWS,",
+      round(sum(entry['bytes'] for entry in entries) / 2**20, 1), "MB IN", round(t_convert, 1), "S")
@@ -0,0 +1,284 @@
+import time
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# Schemas and readers of benchmark datafiles shared by benchmark scripts and
+# conversion to Arrow datasets
+
+taxi_names = ['trip_id',
+              'vendor_id',
+              'pickup_datetime',
+              'dropoff_datetime',
+              'store_and_fwd_flag',
+              'rate_code_id',
+              'pickup_longitude',
+              'pickup_latitude',
+              'dropoff_longitude',
+              'dropoff_latitude',
+              'passenger_count',
+              'trip_distance',
+              'fare_amount',
+              'extra',
+              'mta_tax',
+              'tip_amount',
+              'tolls_amount',
+              'ehail_fee',
+              'improvement_surcharge',
+              'total_amount',
+              'payment_type',
+              'trip_type',
+              'pickup',
+              'dropoff',
+              'cab_type',
+              'precipitation',
+              'snow_depth',
+              'snowfall',
+              'max_temperature',
+              'min_temperature',
+              'average_wind_speed',
+              'pickup_nyct2010_gid',
+              'pickup_ctlabel',
+              'pickup_borocode',
+              'pickup_boroname',
+              'pickup_ct2010',
+              'pickup_boroct2010',
+              'pickup_cdeligibil',
+              'pickup_ntacode',
+              'pickup_ntaname',
+              'pickup_puma',
+              'dropoff_nyct2010_gid',
+              'dropoff_ctlabel',
+              'dropoff_borocode',
+              'dropoff_boroname',
+              'dropoff_ct2010',
+              'dropoff_boroct2010',
+              'dropoff_cdeligibil',
+              'dropoff_ntacode',
+              'dropoff_ntaname',
+              'dropoff_puma']
+
+timestamp_columns = ['pickup_datetime', 'dropoff_datetime']
+timestamp_format = '%Y-%m-%d %H:%M:%S'
+
+# Compact types of datafile columns. Integer columns have missing values in
+# some datafiles, so they are nullable and wide enough for all values in trips
+# data. Low cardinality strings are loaded as categories, timestamps are read
+# as strings and parsed after load.
+taxi_dtypes = {
+    'trip_id': 'Int64',
+    'vendor_id': 'category',
+    'pickup_datetime': 'str',
+    'dropoff_datetime': 'str',
+    'store_and_fwd_flag': 'category',
+    'rate_code_id': 'Int16',
+    'pickup_longitude': 'float32',
+    'pickup_latitude': 'float32',
+    'dropoff_longitude': 'float32',
+    'dropoff_latitude': 'float32',
+    'passenger_count': 'Int16',
+    'trip_distance': 'float32',
+    'fare_amount': 'float32',
+    'extra': 'float32',
+    'mta_tax': 'float32',
+    'tip_amount': 'float32',
+    'tolls_amount': 'float32',
+    'ehail_fee': 'float32',
+    'improvement_surcharge': 'float32',
+    'total_amount': 'float32',
+    'payment_type': 'category',
+    'trip_type': 'Int8',
+    'pickup': 'str',
+    'dropoff': 'str',
+    'cab_type': 'category',
+    'precipitation': 'float32',
+    'snow_depth': 'float32',
+    'snowfall': 'float32',
+    'max_temperature': 'Int16',
+    'min_temperature': 'Int16',
+    'average_wind_speed': 'float32',
+    'pickup_nyct2010_gid': 'Int32',
+    'pickup_ctlabel': 'category',
+    'pickup_borocode': 'Int8',
+    'pickup_boroname': 'category',
+    'pickup_ct2010': 'category',
+    'pickup_boroct2010': 'category',
+    'pickup_cdeligibil': 'category',
+    'pickup_ntacode': 'category',
+    'pickup_ntaname': 'category',
+    'pickup_puma': 'category',
+    'dropoff_nyct2010_gid': 'Int32',
+    'dropoff_ctlabel': 'category',
+    'dropoff_borocode': 'Int8',
+    'dropoff_boroname': 'category',
+    'dropoff_ct2010': 'category',
+    'dropoff_boroct2010': 'category',
+    'dropoff_cdeligibil': 'category',
+    'dropoff_ntacode': 'category',
+    'dropoff_ntaname': 'category',
+    'dropoff_puma': 'category'
+}
+
+def parse_timestamps(column):
+    try:
+        # Timestamps in datafiles are in ISO format which NumPy parses without format inference
+        return pd.Series(column.values.astype('datetime64[s]'), index=column.index, name=column.name)
+    except ValueError:
+        # Column has missing values or timestamps in other format. Result has the
+        # same second resolution as fast path, so dtype doesn't depend on input
+        return pd.to_datetime(column, format=timestamp_format, errors='coerce').astype('datetime64[s]')
+
+def read_taxi(file_name, columns=None):
+    "Read taxi trips datafile, only specified columns are read if columns is not None"
+
+    if columns is None:
+        columns = taxi_names
+    dtypes = {column: taxi_dtypes[column] for column in columns}
+    df = pd.read_csv(file_name, compression='gzip', header=None, names=taxi_names, usecols=columns, dtype=dtypes)
+    t1 = time.time()
+    for column in timestamp_columns:
+        if column in df.columns:
+            df[column] = parse_timestamps(df[column])
+    print("PARSING TIMESTAMPS TIME", int(round((time.time() - t1) * 1000)))
+    return df
+
+def read_taxi_chunks(file_name, columns=None, chunk_rows=None):
+    """Read taxi trips datafile by chunks of chunk_rows rows and yield them one by one,
+    whole datafile is one chunk if chunk_rows is None"""
+
+    if chunk_rows is None:
+        yield read_taxi(file_name, columns)
+        return
+    if columns is None:
+        columns = taxi_names
+    dtypes = {column: taxi_dtypes[column] for column in columns}
+    with pd.read_csv(file_name, compression='gzip', header=None, names=taxi_names, usecols=columns, dtype=dtypes,
+                     chunksize=chunk_rows) as reader:
+        for df in reader:
+            for column in timestamp_columns:
+                if column in df.columns:
+                    df[column] = parse_timestamps(df[column])
+            yield df
+            del df
+
+santander_train_names = ["ID_code", "target"] + ["var_" + str(index) for index in range(200)]
+
+def read_santander_train(file_name):
+    "Read Santander train datafile the same way Omnisci_server.import_data_by_ibis does"
+
+    return pd.read_csv(file_name, compression='gzip', header=0, names=santander_train_names, nrows=200000)
+
+def pd_load_performance_csv(performance_path, **kwargs):
+    """ Loads performance data
+
+    Returns
+    -------
+    PD DataFrame
+    """
+
+    cols = [
+        "loan_id", "monthly_reporting_period", "servicer", "interest_rate", "current_actual_upb",
+        "loan_age", "remaining_months_to_legal_maturity", "adj_remaining_months_to_maturity",
+        "maturity_date", "msa", "current_loan_delinquency_status", "mod_flag", "zero_balance_code",
+        "zero_balance_effective_date", "last_paid_installment_date", "foreclosed_after",
+        "disposition_date", "foreclosure_costs", "prop_preservation_and_repair_costs",
+        "asset_recovery_costs", "misc_holding_expenses", "holding_taxes", "net_sale_proceeds",
+        "credit_enhancement_proceeds", "repurchase_make_whole_proceeds", "other_foreclosure_proceeds",
+        "non_interest_bearing_upb", "principal_forgiveness_upb", "repurchase_make_whole_proceeds_flag",
+        "foreclosure_principal_write_off_amount", "servicing_activity_indicator"
+    ]
+    dtypes = {
+        "loan_id": np.int64,
+        "monthly_reporting_period": str,
+        "servicer": str,
+        "interest_rate": np.float64,
+        "current_actual_upb": np.float64,
+        "loan_age": np.float64,
+        "remaining_months_to_legal_maturity": np.float64,
+        "adj_remaining_months_to_maturity": np.float64,
+        "maturity_date": str,
+        "msa": np.float64,
+        "current_loan_delinquency_status": np.int32,
+        "mod_flag": CategoricalDtype(['N', 'Y']),
+        "zero_balance_code": CategoricalDtype(['01', '02', '06', '09', '03', '15', '16']),
+        "zero_balance_effective_date": str,
+        "last_paid_installment_date": str,
+        "foreclosed_after": str,
+        "disposition_date": str,
+        "foreclosure_costs": np.float64,
+        "prop_preservation_and_repair_costs": np.float64,
+        "asset_recovery_costs": np.float64,
+        "misc_holding_expenses": np.float64,
+        "holding_taxes": np.float64,
+        "net_sale_proceeds": np.float64,
+        "credit_enhancement_proceeds": np.float64,
+        "repurchase_make_whole_proceeds": np.float64,
+        "other_foreclosure_proceeds": np.float64,
+        "non_interest_bearing_upb": np.float64,
+        "principal_forgiveness_upb": np.float64,
+        "repurchase_make_whole_proceeds_flag": CategoricalDtype(['N', 'Y']),
+        "foreclosure_principal_write_off_amount": np.float64,
+        "servicing_activity_indicator": CategoricalDtype(['N', 'Y']),
+    }
+
+    return pd.read_csv(performance_path, names=cols, delimiter='|', dtype=dtypes, parse_dates=[1,8,13,14,15,16])
+
+def pd_load_acquisition_csv(acquisition_path, **kwargs):
+    """ Loads acquisition data
+
+    Returns
+    -------
+    PD DataFrame
+    """
+
+    columns = [
+        'loan_id', 'orig_channel', 'seller_name', 'orig_interest_rate', 'orig_upb', 'orig_loan_term',
+        'orig_date', 'first_pay_date', 'orig_ltv', 'orig_cltv', 'num_borrowers', 'dti', 'borrower_credit_score',
+        'first_home_buyer', 'loan_purpose', 'property_type', 'num_units', 'occupancy_status', 'property_state',
+        'zip', 'mortgage_insurance_percent', 'product_type', 'coborrow_credit_score', 'mortgage_insurance_type',
+        'relocation_mortgage_indicator', 'year_quarter'
+    ]
+    dtypes = {
+        'loan_id': np.int64,
+        'orig_channel': CategoricalDtype(['B', 'C', 'R']),
+        'seller_name': str,
+        'orig_interest_rate': np.float64,
+        'orig_upb': np.int64,
+        'orig_loan_term': np.int64,
+        'orig_date': str,
+        'first_pay_date': str,
+        'orig_ltv': np.float64,
+        'orig_cltv': np.float64,
+        'num_borrowers': np.float64,
+        'dti': np.float64,
+        'borrower_credit_score': np.float64,
+        'first_home_buyer': CategoricalDtype(['N', 'U', 'Y']),
+        'loan_purpose': CategoricalDtype(['C', 'P', 'R', 'U']),
+        'property_type': CategoricalDtype(['CO', 'CP', 'MH', 'PU', 'SF']),
+        'num_units': np.int64,
+        'occupancy_status': CategoricalDtype(['I', 'P', 'S']),
+        'property_state': CategoricalDtype(
+            ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI',
+            'IA', 'ID', 'IL', 'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN',
+            'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH',
+            'OK', 'OR', 'PA', 'PR', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VI',
+            'VT', 'WA', 'WI', 'WV', 'WY']),
+        'zip': np.int64,
+        'mortgage_insurance_percent': np.float64,
+        'product_type': CategoricalDtype(['FRM']),
+        'coborrow_credit_score': np.float64,
+        'mortgage_insurance_type': np.float64,
+        'relocation_mortgage_indicator': CategoricalDtype(['N', 'Y']),
+        'year_quarter': np.int64
+    }
+
+    a = pd.read_csv(acquisition_path, names=columns, delimiter='|', dtype=dtypes, parse_dates=[6,7], error_bad_lines=True, warn_bad_lines=True, na_filter=True)
+    return a
+
+# Readers of datasets by their names in Arrow dataset manifest
+readers = {
+    'taxi': read_taxi,
+    'santander_train': read_santander_train,
+    'mortgage_performance': pd_load_performance_csv,
+    'mortgage_acquisition': pd_load_acquisition_csv
+}
@@ -0,0 +1,178 @@
+import concurrent.futures
+import multiprocessing
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+def _scratch_dir():
+    # /dev/shm is memory backed, so decompressed files are never written to disk
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+class DecompressError(OSError):
+    "Datafile could not be decompressed by stage"
+
+def _estimated_size(file_name, ratio):
+    """Estimate decompressed size by compression ratio. Last 4 bytes of gzip file are size
+    of its last member modulo 2^32, so they are used only as lower bound of estimate"""
+
+    compressed_size = os.path.getsize(file_name)
+    try:
+        with open(file_name, "rb") as datafile:
+            datafile.seek(-4, os.SEEK_END)
+            trailer_size = struct.unpack("<I", datafile.read(4))[0]
+    except (OSError, struct.error):
+        trailer_size = 0
+    return max(int(compressed_size * ratio), trailer_size)
+
+def _decompress(file_name, target_name):
+    t1 = time.time()
+    with gzip.open(file_name, "rb") as source, open(target_name, "wb") as target:
+        shutil.copyfileobj(source, target, 2**20)
+    return os.path.getsize(target_name), time.time() - t1
+
+class DecompressStage:
+    """Decompress gzipped datafiles in worker processes into scratch directory ahead
+    of their import. Files are decompressed in order of file_names, while previous
+    files are imported, and total size of decompressed files that are not released yet
+    is kept below max_bytes. Size of file is reserved by compression_ratio until it is
+    decompressed, then reservation is changed to its real size and ratio is raised if
+    file is compressed better. Files that are not gzipped are used as is"""
+
+    def __init__(self, file_names, workers=None, scratch_dir=None, max_bytes=8*2**30, compression_ratio=8.0):
+        self.file_names = list(file_names)
+        self.workers = workers or os.cpu_count()
+        self.max_bytes = max_bytes
+        self.compression_ratio = compression_ratio
+        self.decompress_time = 0
+        self.wait_time = 0
+        self.bytes_decompressed = 0
+        self._dir = tempfile.mkdtemp(prefix="omniscripts_decompress_", dir=scratch_dir or _scratch_dir())
+        self._pool = None
+        self._pending = [f for f in self.file_names if f.endswith(".gz")]
+        self._futures = {}
+        self._sizes = {}
+        self._targets = {}
+        self._scratch_bytes = 0
+        self._condition = threading.Condition()
+
+    def start(self):
+        self._pool = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        with self._condition:
+            self._submit()
+        return self
+
+    def _submit(self):
+        # Called with condition held on the thread of acquire or release, never from a done callback.
+        # At least one file is decompressed even if it doesn't fit, otherwise import would stop
+        while self._pending and len(self._futures) < 2 * self.workers:
+            file_name = self._pending[0]
+            size = _estimated_size(file_name, self.compression_ratio)
+            if self._futures and self._scratch_bytes + size > self.max_bytes:
+                break
+            target_name = os.path.join(self._dir, "%d_%s" % (len(self._targets), os.path.basename(file_name)[:-len(".gz")]))
+            try:
+                future = self._pool.submit(_decompress, file_name, target_name)
+            except RuntimeError:
+                # Pool is shut down, files which are not submitted yet are never decompressed
+                self._pending = []
+                self._condition.notify_all()
+                return
+            self._pending.pop(0)
+            self._targets[file_name] = target_name
+            self._sizes[file_name] = size
+            self._scratch_bytes += size
+            self._futures[file_name] = future
+            future.add_done_callback(lambda future, file_name=file_name: self._decompressed(file_name, future))
+
+    def _decompressed(self, file_name, future):
+        # Runs on executor thread, so it only replaces reservation of decompressed file by its real size
+        # and wakes up waiters, which submit next files themselves
+        with self._condition:
+            if not future.cancelled() and future.exception() is None and file_name in self._sizes:
+                size = future.result()[0]
+                self._scratch_bytes += size - self._sizes[file_name]
+                self._sizes[file_name] = size
+                compressed_size = os.path.getsize(file_name)
+                if compressed_size > 0:
+                    self.compression_ratio = max(self.compression_ratio, size / compressed_size)
+            self._condition.notify_all()
+
+    def acquire(self, file_name):
+        "Wait until datafile is decompressed and return name of file to import, it should be released after import"
+
+        if not file_name.endswith(".gz"):
+            return file_name
+        t1 = time.time()
+        with self._condition:
+            while file_name not in self._futures:
+                if file_name not in self._pending:
+                    raise DecompressError("Datafile %s is not decompressed by stage" % file_name)
+                self._submit()
+                if file_name not in self._futures:
+                    self._condition.wait()
+            future = self._futures[file_name]
+        try:
+            size, decompress_time = future.result()
+        except (OSError, EOFError, concurrent.futures.BrokenExecutor) as err:
+            raise DecompressError("Failed to decompress datafile %s: %s" % (file_name, err)) from err
+        finally:
+            with self._condition:
+                self.wait_time += time.time() - t1
+        with self._condition:
+            self.decompress_time += decompress_time
+            self.bytes_decompressed += size
+        return self._targets[file_name]
+
+    def release(self, file_name):
+        "Remove decompressed datafile and start decompression of next ones"
+
+        with self._condition:
+            future = self._futures.pop(file_name, None)
+            if future is None:
+                return
+            if future.done() and future.exception() is None and os.path.exists(self._targets[file_name]):
+                os.remove(self._targets[file_name])
+            self._scratch_bytes -= self._sizes.pop(file_name)
+            self._submit()
+            self._condition.notify_all()
+
+    def __iter__(self):
+        "Iterate over pairs of datafile and name of file to import, previous file is released on every step"
+
+        for file_name in self.file_names:
+            import_name = self.acquire(file_name)
+            try:
+                yield file_name, import_name
+            finally:
+                self.release(file_name)
+
+    def report_values(self, ingest_time, importers=1):
+        "Return how import time of ingest_time seconds summed over importers threads was spent, in seconds per importer"
+
+        return {
+            'DecompressTime': round(self.decompress_time, 3),
+            'DecompressWaitTime': round(self.wait_time / importers, 3),
+            'IngestTime': round(ingest_time / importers, 3),
+            'DecompressedMB': round(self.bytes_decompressed / 2**20, 1)
+        }
+
+    def close(self):
+        "Stop worker processes and remove scratch directory"
+
+        with self._condition:
+            self._pending = []
+            self._condition.notify_all()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
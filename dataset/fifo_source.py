@@ -0,0 +1,89 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+def _open_datafile(file_name):
+    if file_name.endswith(".gz"):
+        return gzip.open(file_name, "rb")
+    return open(file_name, "rb")
+
+class FifoSource:
+    """Named pipe that streams concatenated contents of datafiles, gzipped ones are
+    decompressed on the fly. Reader gets all files every time it opens the pipe, so
+    data is never copied to disk and decompression overlaps with reading of data"""
+
+    def __init__(self, file_names, fifo_dir=None, buffer_size=2**20):
+        self.file_names = list(file_names)
+        self.buffer_size = buffer_size
+        self._dir = tempfile.mkdtemp(prefix="omniscripts_fifo_", dir=fifo_dir)
+        self.path = os.path.join(self._dir, "trips.csv")
+        os.mkfifo(self.path)
+        self.passes = 0
+        self.bytes_written = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        "Start writer thread, it waits for reader to open the pipe"
+
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            # Open blocks until reader opens the pipe, writer is armed again after every pass
+            try:
+                fifo = open(self.path, "wb", buffering=0)
+            except OSError as err:
+                self.error = str(err)
+                return
+            with fifo:
+                if self._stop.is_set():
+                    return
+                self._write_pass(fifo)
+
+    def _write_pass(self, fifo):
+        t1 = time.time()
+        written = 0
+        try:
+            for file_name in self.file_names:
+                with _open_datafile(file_name) as datafile:
+                    while True:
+                        buffer = datafile.read(self.buffer_size)
+                        if not buffer:
+                            break
+                        fifo.write(buffer)
+                        written += len(buffer)
+        except BrokenPipeError:
+            # Reader closed the pipe before end of data, e.g. it read just first rows
+            print("FIFO", self.path, "was closed by reader after", written, "bytes")
+        except OSError as err:
+            print("Failed to stream datafiles to FIFO", self.path, err)
+            self.error = str(err)
+        self.passes += 1
+        self.bytes_written += written
+        print("FIFO PASS", self.passes, "STREAMED", written, "BYTES IN", int(round((time.time() - t1) * 1000)), "MS")
+
+    def close(self):
+        "Stop writer thread and remove the pipe"
+
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            # Writer waiting for reader in open is woken up by opening the pipe for reading
+            try:
+                os.close(os.open(self.path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+            self._thread.join(5)
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
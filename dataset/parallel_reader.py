@@ -0,0 +1,128 @@
+import collections
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Function that reads one datafile in worker process. It is set by initializer of
+# forked worker, so it doesn't have to be picklable, e.g. it can be a bound method
+# or a closure.
+_read_func = None
+
+def _init_worker(read_func):
+    global _read_func
+    _read_func = read_func
+    # Worker is forked while other threads of parent, e.g. ones that print server
+    # output, can hold locks of standard streams. Worker gets its own stream objects
+    # over the same descriptors, so it never waits for locks inherited in held state.
+    sys.stdout = open(1, 'w', buffering=1, closefd=False)
+    sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+def _shared_memory_dir():
+    # /dev/shm is memory backed, so result files are never written to disk
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+def _read_to_shared_memory(file_name):
+    df = _read_func(file_name)
+    if pa is None or not isinstance(df, pd.DataFrame):
+        return None, df
+    # DataFrame is passed to parent as Arrow IPC file in shared memory
+    # instead of pickling it through the pipe
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    del df
+    fd, result_file_name = tempfile.mkstemp(prefix="omniscripts_reader_", suffix=".arrow", dir=_shared_memory_dir())
+    os.close(fd)
+    try:
+        with pa.OSFile(result_file_name, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    except Exception:
+        os.remove(result_file_name)
+        raise
+    return result_file_name, None
+
+def _load_from_shared_memory(result):
+    result_file_name, result = result
+    if result_file_name is None:
+        return result
+    try:
+        with pa.memory_map(result_file_name, 'r') as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+    finally:
+        os.remove(result_file_name)
+
+def _discard(futures):
+    # Shared memory of files that were read but not loaded is freed
+    for future in futures:
+        future.cancel()
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            continue
+        result_file_name, _ = future.result()
+        if result_file_name is not None and os.path.exists(result_file_name):
+            os.remove(result_file_name)
+
+def iter_files(read_func, file_names, workers=None, read_ahead=None):
+    """Read every file by read_func(file_name) in its own worker process and yield
+    results in order of file_names. At most read_ahead files (workers by default) are
+    read ahead of the consumer, so memory used by results doesn't grow with number of
+    files. DataFrames are passed through shared memory, other results are pickled"""
+
+    workers = min(workers or os.cpu_count(), len(file_names))
+    if workers <= 1:
+        for file_name in file_names:
+            yield read_func(file_name)
+        return
+
+    context = multiprocessing.get_context('fork')
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(read_func,)) as pool:
+        futures = collections.deque()
+        pending_files = iter(file_names)
+        try:
+            for file_name in itertools.islice(pending_files, max(read_ahead or workers, 1)):
+                futures.append(pool.submit(_read_to_shared_memory, file_name))
+            while futures:
+                result = _load_from_shared_memory(futures.popleft().result())
+                for file_name in itertools.islice(pending_files, 1):
+                    futures.append(pool.submit(_read_to_shared_memory, file_name))
+                yield result
+        except BaseException:
+            _discard(futures)
+            raise
+
+def read_files(read_func, file_names, workers=None):
+    """Read every file by read_func(file_name) in its own worker process and return
+    list of results in order of file_names. DataFrames are passed through shared
+    memory, other results are pickled"""
+
+    return list(iter_files(read_func, file_names, workers, read_ahead=len(file_names)))
+
+def concat_frames(dfs):
+    """Concatenate DataFrames, categorical columns stay categorical with union of categories.
+    Input DataFrames are not changed"""
+
+    if len(dfs) == 1:
+        return dfs[0]
+    # Categories are set in shallow copies, column data is not copied
+    dfs = [df.copy(deep=False) for df in dfs]
+    for column in dfs[0].columns:
+        if all(df[column].dtype.name == 'category' for df in dfs):
+            # Concatenation of categoricals with different categories converts them to objects
+            categories = union_categoricals([df[column] for df in dfs]).categories
+            for df in dfs:
+                df[column] = df[column].cat.set_categories(categories)
+    return pd.concat(dfs, ignore_index=True)
+
+def read_datafiles(read_func, file_names, workers=None):
+    "Read files in parallel processes by read_func(file_name) and return concatenated DataFrame"
+
+    return concat_frames(read_files(read_func, file_names, workers))
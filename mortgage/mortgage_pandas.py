@@ -1,167 +1,94 @@
 # Derived from https://github.com/fschlimb/scale-out-benchs
 
+import mysql.connector
 import numpy as np
 import pandas as pd
 from pymapd import connect
-from pandas.api.types import CategoricalDtype
 from io import StringIO
 from glob import glob
+import contextlib
 import os
 import time
 import pathlib
 import sys
 import argparse
 
-def run_pd_workflow(quarter=1, year=2000, perf_file="", **kwargs):
+def acquisition_file_name(quarter, year):
+    return os.path.join(data_directory, "acq", "Acquisition_" + str(year) + "Q" + str(quarter) + ".txt")
+
+def datafile_dataset(file_name):
+    "Return name of Arrow dataset of datafile and function to read it"
+
+    if os.path.basename(file_name).startswith("Acquisition_"):
+        return 'mortgage_acquisition', pd_load_acquisition_csv
+    return 'mortgage_performance', pd_load_performance_csv
+
+def convert_datafile(file_name):
+    return arrow_dataset.convert(file_name, *datafile_dataset(file_name))
+
+def read_datafile(file_name):
+    print("READING DATAFILE", file_name)
+    dataset_name, read_func = datafile_dataset(file_name)
+    if arrow_dataset is not None:
+        return arrow_dataset.read(file_name, dataset_name, read_func)
+    return read_func(file_name)
+
+def stage_profile(name):
+    "Account memory of workflow stage in profiled iteration"
+    if profiling:
+        return memory_profiler.profile(name)
+    return contextlib.nullcontext()
+
+def run_pd_workflow(quarter=1, year=2000, perf_file="", acq_pdf=None, perf_df_tmp=None, **kwargs):
     t1 = time.time()
     names = pd_load_names()
-    year_string = str(year) + "Q" + str(quarter) + ".txt"
-    acq_file = os.path.join(data_directory, "acq", "Acquisition_" + year_string)
-    print("READING DATAFILE", acq_file)
-    acq_pdf = pd_load_acquisition_csv(acq_file)
-
-    print("READING DATAFILE", perf_file)
-    perf_df_tmp = pd_load_performance_csv(perf_file)
+    if acq_pdf is None:
+        acq_pdf = read_datafile(acquisition_file_name(quarter, year))
+    if perf_df_tmp is None:
+        perf_df_tmp = read_datafile(perf_file)
     print("read time", (time.time() - t1) * 1000)
 
     t1 = time.time()
 
-    acq_pdf = acq_pdf.merge(names, how='left', on=['seller_name'])
-    acq_pdf.drop(columns=['seller_name'], inplace=True)
-    acq_pdf['seller_name'] = acq_pdf['new']
-    acq_pdf.drop(columns=['new'], inplace=True)
+    with stage_profile("merge_names"):
+        acq_pdf = acq_pdf.merge(names, how='left', on=['seller_name'])
+        acq_pdf.drop(columns=['seller_name'], inplace=True)
+        acq_pdf['seller_name'] = acq_pdf['new']
+        acq_pdf.drop(columns=['new'], inplace=True)
 
     pdf = perf_df_tmp
-    everdf = create_ever_features(pdf)
-    delinq_merge = create_delinq_features(pdf)
-    everdf = join_ever_delinq_features(everdf, delinq_merge)
+    with stage_profile("create_ever_features"):
+        everdf = create_ever_features(pdf)
+    with stage_profile("create_delinq_features"):
+        delinq_merge = create_delinq_features(pdf)
+    with stage_profile("join_ever_delinq_features"):
+        everdf = join_ever_delinq_features(everdf, delinq_merge)
     del(delinq_merge)
 
-    joined_df = create_joined_df(pdf, everdf)
-    testdf = create_12_mon_features(joined_df)
-    joined_df = combine_joined_12_mon(joined_df, testdf)
+    with stage_profile("create_joined_df"):
+        joined_df = create_joined_df(pdf, everdf)
+    with stage_profile("create_12_mon_features"):
+        testdf = create_12_mon_features(joined_df)
+    with stage_profile("combine_joined_12_mon"):
+        joined_df = combine_joined_12_mon(joined_df, testdf)
     del(testdf)
 
-    perf_df = final_performance_delinquency(pdf, joined_df)
+    with stage_profile("final_performance_delinquency"):
+        perf_df = final_performance_delinquency(pdf, joined_df)
     del(pdf, joined_df)
 
-    final_pdf = join_perf_acq_pdfs(perf_df, acq_pdf)
+    with stage_profile("join_perf_acq_pdfs"):
+        final_pdf = join_perf_acq_pdfs(perf_df, acq_pdf)
     del(perf_df)
     del(acq_pdf)
 
     print("compute time", (time.time() - t1) * 1000)
-    final_pdf = last_mile_cleaning(final_pdf)
+    with stage_profile("last_mile_cleaning"):
+        final_pdf = last_mile_cleaning(final_pdf)
     exec_time = (time.time() - t1) * 1000
     print("compute time with copy to host", exec_time)
     return final_pdf, exec_time
 
-def pd_load_performance_csv(performance_path, **kwargs):
-    """ Loads performance data
-
-    Returns
-    -------
-    PD DataFrame
-    """
-
-    cols = [
-        "loan_id", "monthly_reporting_period", "servicer", "interest_rate", "current_actual_upb",
-        "loan_age", "remaining_months_to_legal_maturity", "adj_remaining_months_to_maturity",
-        "maturity_date", "msa", "current_loan_delinquency_status", "mod_flag", "zero_balance_code",
-        "zero_balance_effective_date", "last_paid_installment_date", "foreclosed_after",
-        "disposition_date", "foreclosure_costs", "prop_preservation_and_repair_costs",
-        "asset_recovery_costs", "misc_holding_expenses", "holding_taxes", "net_sale_proceeds",
-        "credit_enhancement_proceeds", "repurchase_make_whole_proceeds", "other_foreclosure_proceeds",
-        "non_interest_bearing_upb", "principal_forgiveness_upb", "repurchase_make_whole_proceeds_flag",
-        "foreclosure_principal_write_off_amount", "servicing_activity_indicator"
-    ]
-    dtypes = {
-        "loan_id": np.int64,
-        "monthly_reporting_period": str,
-        "servicer": str,
-        "interest_rate": np.float64,
-        "current_actual_upb": np.float64,
-        "loan_age": np.float64,
-        "remaining_months_to_legal_maturity": np.float64,
-        "adj_remaining_months_to_maturity": np.float64,
-        "maturity_date": str,
-        "msa": np.float64,
-        "current_loan_delinquency_status": np.int32,
-        "mod_flag": CategoricalDtype(['N', 'Y']),
-        "zero_balance_code": CategoricalDtype(['01', '02', '06', '09', '03', '15', '16']),
-        "zero_balance_effective_date": str,
-        "last_paid_installment_date": str,
-        "foreclosed_after": str,
-        "disposition_date": str,
-        "foreclosure_costs": np.float64,
-        "prop_preservation_and_repair_costs": np.float64,
-        "asset_recovery_costs": np.float64,
-        "misc_holding_expenses": np.float64,
-        "holding_taxes": np.float64,
-        "net_sale_proceeds": np.float64,
-        "credit_enhancement_proceeds": np.float64,
-        "repurchase_make_whole_proceeds": np.float64,
-        "other_foreclosure_proceeds": np.float64,
-        "non_interest_bearing_upb": np.float64,
-        "principal_forgiveness_upb": np.float64,
-        "repurchase_make_whole_proceeds_flag": CategoricalDtype(['N', 'Y']),
-        "foreclosure_principal_write_off_amount": np.float64,
-        "servicing_activity_indicator": CategoricalDtype(['N', 'Y']),
-    }
-
-    return pd.read_csv(performance_path, names=cols, delimiter='|', dtype=dtypes, parse_dates=[1,8,13,14,15,16])
-
-def pd_load_acquisition_csv(acquisition_path, **kwargs):
-    """ Loads acquisition data
-
-    Returns
-    -------
-    PD DataFrame
-    """
-
-    columns = [
-        'loan_id', 'orig_channel', 'seller_name', 'orig_interest_rate', 'orig_upb', 'orig_loan_term',
-        'orig_date', 'first_pay_date', 'orig_ltv', 'orig_cltv', 'num_borrowers', 'dti', 'borrower_credit_score',
-        'first_home_buyer', 'loan_purpose', 'property_type', 'num_units', 'occupancy_status', 'property_state',
-        'zip', 'mortgage_insurance_percent', 'product_type', 'coborrow_credit_score', 'mortgage_insurance_type',
-        'relocation_mortgage_indicator', 'year_quarter'
-    ]
-    dtypes = {
-        'loan_id': np.int64,
-        'orig_channel': CategoricalDtype(['B', 'C', 'R']),
-        'seller_name': str,
-        'orig_interest_rate': np.float64,
-        'orig_upb': np.int64,
-        'orig_loan_term': np.int64,
-        'orig_date': str,
-        'first_pay_date': str,
-        'orig_ltv': np.float64,
-        'orig_cltv': np.float64,
-        'num_borrowers': np.float64,
-        'dti': np.float64,
-        'borrower_credit_score': np.float64,
-        'first_home_buyer': CategoricalDtype(['N', 'U', 'Y']),
-        'loan_purpose': CategoricalDtype(['C', 'P', 'R', 'U']),
-        'property_type': CategoricalDtype(['CO', 'CP', 'MH', 'PU', 'SF']),
-        'num_units': np.int64,
-        'occupancy_status': CategoricalDtype(['I', 'P', 'S']),
-        'property_state': CategoricalDtype(
-            ['AK', 'AL', 'AR', 'AZ', 'CA', 'CO', 'CT', 'DC', 'DE', 'FL', 'GA', 'HI',
-            'IA', 'ID', 'IL', 'IN', 'KS', 'KY', 'LA', 'MA', 'MD', 'ME', 'MI', 'MN',
-            'MO', 'MS', 'MT', 'NC', 'ND', 'NE', 'NH', 'NJ', 'NM', 'NV', 'NY', 'OH',
-            'OK', 'OR', 'PA', 'PR', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VA', 'VI',
-            'VT', 'WA', 'WI', 'WV', 'WY']),
-        'zip': np.int64,
-        'mortgage_insurance_percent': np.float64,
-        'product_type': CategoricalDtype(['FRM']),
-        'coborrow_credit_score': np.float64,
-        'mortgage_insurance_type': np.float64,
-        'relocation_mortgage_indicator': CategoricalDtype(['N', 'Y']),
-        'year_quarter': np.int64
-    }
-
-    a = pd.read_csv(acquisition_path, names=columns, delimiter='|', dtype=dtypes, parse_dates=[6,7], error_bad_lines=True, warn_bad_lines=True, na_filter=True)
-    return a
-
 def pd_load_names(**kwargs):
     """ Loads names used for renaming the banks
 
@@ -298,15 +225,26 @@ def last_mile_cleaning(df, **kwargs):
 # Load database reporting functions
 pathToReportDir = os.path.join(pathlib.Path(__file__).parent, "..", "report")
 print(pathToReportDir)
+pathToDatasetDir = os.path.join(pathlib.Path(__file__).parent, "..", "dataset")
 sys.path.insert(1, pathToReportDir)
+sys.path.insert(1, pathToDatasetDir)
 import report
+from parallel_reader import iter_files, read_files
+from arrow_dataset import ArrowDataset
+from datasets import pd_load_performance_csv, pd_load_acquisition_csv
+from memory_profile import MemoryProfiler, add_memory_arguments
+from measurement import Measurement, add_measurement_arguments
 
 parser = argparse.ArgumentParser(description='Run Mortgage benchmark using pandas')
 
 parser.add_argument('-r', default="report_pandas.csv", help="Report file name.")
 parser.add_argument('-df', default=1, type=int, help="Number of datafiles (quarters) to input into database for processing.")
 parser.add_argument('-dp', required=True, help="Path to root of mortgage datafiles directory (contains names.csv).")
-parser.add_argument('-i', dest="iterations", default=5, type=int, help="Number of iterations to run every benchmark. Best result is selected.")
+parser.add_argument('-i', dest="iterations", default=5, type=int, help="Minimum number of iterations to run benchmark. Iterations continue until confidence interval of median time is narrow enough.")
+parser.add_argument('-arrow-dir', help="Directory of Arrow dataset. Datafiles are converted to it on first read and memory-mapped from it later.")
+parser.add_argument('-read-workers', type=int, help="Number of processes that read datafiles in parallel ahead of processing, about this number of quarters is read ahead. By default number of CPUs is used.")
+add_measurement_arguments(parser)
+add_memory_arguments(parser)
 
 parser.add_argument("-db-server", default="localhost", help="Host name of MySQL server")
 parser.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server")
@@ -324,7 +262,8 @@ if args.df <= 0:
     sys.exit(1)
 
 if args.iterations < 1:
-    print("Bad number of iterations specified", args.t)
+    print("Bad number of iterations specified", args.iterations)
+    sys.exit(1)
 
 db_reporter = None
 if args.db_user is not "":
@@ -339,70 +278,113 @@ if args.db_user is not "":
         'WorstExecTimeMS': 'BIGINT UNSIGNED',
         'WorstTotalTimeMS': 'BIGINT UNSIGNED',
         'AverageExecTimeMS': 'BIGINT UNSIGNED',
-        'AverageTotalTimeMS': 'BIGINT UNSIGNED'
+        'AverageTotalTimeMS': 'BIGINT UNSIGNED',
+        **Measurement.metrics_fields,
+        **MemoryProfiler.metrics_fields
     }, {
         'ScriptName': 'mortgage_pandas.py',
         'CommitHash': args.commit
     })
 
 data_directory = args.dp
+arrow_dataset = None
+if args.arrow_dir is not None:
+    arrow_dataset = ArrowDataset(args.arrow_dir)
 benchName = "mortgage_pandas"
+memory_profiler = MemoryProfiler.from_args(args)
+profiling = False
 
 perf_data_path = os.path.join(data_directory, "perf")
 perf_format_path = os.path.join(perf_data_path, "Performance_%sQ%s.txt")
-bestExecTime = float("inf")
-bestTotalTime = float("inf")
-worstExecTime = 0
-worstTotalTime = 0
-avgExecTime = 0
-avgTotalTime = 0
-
-for iii in range(1, args.iterations + 1):
+dataFilesNumber = 0
+totalTimes = []
+
+def run_iteration():
+    global dataFilesNumber
     dataFilesNumber = 0
     time_ETL = time.time()
     exec_time_total = 0
-    print("RUNNING BENCHMARK NUMBER", benchName, "ITERATION NUMBER", iii)
+    workflows = []
     for quarter in range(0, args.df):
         year = 2000 + quarter // 4
         perf_file = perf_format_path % (str(year), str(quarter % 4 + 1))
 
         files = [f for f in pathlib.Path(perf_data_path).iterdir() if f.match('Performance_%sQ%s.txt*' % (str(year), str(quarter % 4 + 1)))]
-        for f in files:
-            dataframe, exec_time = run_pd_workflow(year = year, quarter = (quarter % 4 + 1), perf_file = str(f))
-            exec_time_total += exec_time
+        workflows += [(year, quarter % 4 + 1, str(f)) for f in files]
         dataFilesNumber += 1
+
+    # Datafiles are read in parallel processes ahead of processing of quarters, while
+    # previous quarters are processed. About read_workers quarters are read ahead
+    datafiles = [f for year, quarter, perf_file in workflows for f in (acquisition_file_name(quarter, year), perf_file)]
+    read_workers = args.read_workers or os.cpu_count()
+    if arrow_dataset is not None:
+        # Datafiles that are not converted yet are converted in parallel, mapping doesn't need it
+        read_files(convert_datafile, [f for f in datafiles if not arrow_dataset.converted(f, *datafile_dataset(f))], read_workers)
+        read_workers = 1
+    dataframes = iter_files(read_datafile, datafiles, read_workers, read_ahead=2 * read_workers)
+    for year, quarter, perf_file in workflows:
+        acq_pdf = next(dataframes)
+        perf_df_tmp = next(dataframes)
+        dataframe, exec_time = run_pd_workflow(year = year, quarter = quarter, perf_file = perf_file,
+                                               acq_pdf = acq_pdf, perf_df_tmp = perf_df_tmp)
+        del acq_pdf, perf_df_tmp
+        exec_time_total += exec_time
     time_ETL_end = time.time()
     ttt = (time_ETL_end - time_ETL) * 1000
-    print("ITERATION", iii, "EXEC TIME: ", exec_time_total, "TOTAL TIME: ", ttt)
-
-    if bestExecTime > exec_time_total:
-        bestExecTime = exec_time_total
-    if worstExecTime < exec_time_total:
-        worstExecTime = exec_time_total
-    avgExecTime += exec_time_total
-    if bestTotalTime > ttt:
-        bestTotalTime = ttt
-    if worstTotalTime < ttt:
-        bestTotalTime = ttt
-    avgTotalTime += ttt
-
-avgExecTime /= args.iterations
-avgTotalTime /= args.iterations
+    print("EXEC TIME: ", exec_time_total, "TOTAL TIME: ", ttt)
+    return exec_time_total, ttt
+
+def measured_iteration(iteration):
+    exec_time, total_time = run_iteration()
+    totalTimes.append(total_time)
+    return int(round(exec_time))
+
+def rounded(value):
+    return None if value is None else int(round(value))
+
+measurement = Measurement.from_args(args, args.iterations)
+result = measurement.run(measured_iteration, "BENCHMARK " + benchName)
+# Stages are profiled in additional iteration, so profiling doesn't affect measured iterations
+if memory_profiler.enabled:
+    profiling = True
+    run_iteration()
+    profiling = False
+
+bestExecTime = result.best
+worstExecTime = result.worst
+avgExecTime = rounded(result.average)
+# Total times are taken from the same accepted iterations as exec times
+acceptedTotalTimes = [totalTimes[i] for i in result.accepted]
+bestTotalTime = rounded(min(acceptedTotalTimes)) if acceptedTotalTimes else None
+worstTotalTime = rounded(max(acceptedTotalTimes)) if acceptedTotalTimes else None
+avgTotalTime = rounded(sum(acceptedTotalTimes) / len(acceptedTotalTimes)) if acceptedTotalTimes else None
 
 try:
     with open(args.r, "w") as report:
-        print("BENCHMARK", benchName, "EXEC TIME", bestExecTime, "TOTAL TIME", bestTotalTime)
-        print("datafiles,fragment_size,query,query_exec_min,query_total_min,query_exec_max,query_total_max,query_exec_avg,query_total_avg,query_error_info", file=report, flush=True)
+        print("BENCHMARK", benchName, "EXEC TIME", bestExecTime, "MEDIAN EXEC TIME", result.median, "TOTAL TIME", bestTotalTime)
+        print("datafiles,fragment_size,query,query_exec_min,query_total_min,query_exec_max,query_total_max,query_exec_avg,query_total_avg,query_error_info,"
+              "query_exec_median,query_exec_p90,query_exec_stddev,query_exec_ci_low,query_exec_ci_high,iterations,warmup_iterations,outlier_iterations,"
+              "query_exec_p95,query_exec_p99,query_exec_p999,query_exec_histogram,python_peak_mb,rss_peak_mb,rss_growth_mb", file=report, flush=True)
+        memoryStatistics = memory_profiler.report_values()
+        statistics = result.report_values()
         print(dataFilesNumber, ",",
               0, ",",
               benchName, ",",
-              bestExecTime, ",",
-              bestTotalTime, ",",
-              worstExecTime, ",",
-              worstTotalTime, ",",
-              avgExecTime, ",",
-              avgTotalTime, ",",
-              "", '\n', file=report, sep='', end='', flush=True)
+              "" if bestExecTime is None else bestExecTime, ",",
+              "" if bestTotalTime is None else bestTotalTime, ",",
+              "" if worstExecTime is None else worstExecTime, ",",
+              "" if worstTotalTime is None else worstTotalTime, ",",
+              "" if avgExecTime is None else avgExecTime, ",",
+              "" if avgTotalTime is None else avgTotalTime, ",",
+              result.error or "", ",",
+              ",".join("" if value is None else str(value) for value in statistics.values()), ",",
+              ",".join("" if value is None else str(value) for value in memoryStatistics.values()), '\n', file=report, sep='', end='', flush=True)
+        # Every profiled stage is reported in separate row without times
+        for stage in memory_profiler.profiles:
+            stageStatistics = memory_profiler.report_values(stage)
+            print(dataFilesNumber, ",", 0, ",", benchName + "." + stage, ",,,,,,,,,,,,,,,,,,,,",
+                  ",".join("" if value is None else str(value) for value in stageStatistics.values()), '\n',
+                  file=report, sep='', end='', flush=True)
         if db_reporter is not None:
             db_reporter.submit({
                 'FilesNumber': dataFilesNumber,
@@ -413,6 +395,14 @@ try:
                 'WorstExecTimeMS': worstExecTime,
                 'WorstTotalTimeMS': worstTotalTime,
                 'AverageExecTimeMS': avgExecTime,
-                'AverageTotalTimeMS': avgTotalTime})
+                'AverageTotalTimeMS': avgTotalTime,
+                **statistics,
+                **memoryStatistics})
+            for stage in memory_profiler.profiles:
+                db_reporter.submit({
+                    'FilesNumber': dataFilesNumber,
+                    'FragmentSize': 0,
+                    'BenchName': benchName + "." + stage,
+                    **memory_profiler.report_values(stage)})
 except IOError as err:
     print("Failed writing report file", args.r, err)
@@ -0,0 +1,108 @@
+import math
+
+class LatencyHistogram:
+    """Histogram of times in ms with logarithmic buckets. Every bucket is wider than
+    previous one by relative precision, so percentiles have bounded relative error
+    for any range of values and histogram stays compact. Histograms serialized to
+    report can be merged later to get percentiles of several runs"""
+
+    metrics_fields = {
+        'P95TimeMS': 'DOUBLE',
+        'P99TimeMS': 'DOUBLE',
+        'P999TimeMS': 'DOUBLE',
+        'Histogram': 'TEXT'
+    }
+
+    # Values smaller than lowest value are counted in bucket 0
+    lowest_value = 0.001
+    format_version = "h1"
+
+    def __init__(self, precision=0.01):
+        self.precision = precision
+        self._log_base = math.log(1 + precision)
+        self.counts = {}
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value):
+        if value < self.lowest_value:
+            return 0
+        return 1 + int(math.log(value / self.lowest_value) / self._log_base)
+
+    def _bucket_value(self, bucket):
+        # Middle of bucket in logarithmic scale
+        if bucket == 0:
+            return 0.0
+        return self.lowest_value * math.exp((bucket - 0.5) * self._log_base)
+
+    def record(self, value, count=1):
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        "Add counts of other histogram with the same precision"
+
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge histograms with precision %g and %g" % (self.precision, other.precision))
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        for value in [other.min, other.max]:
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def percentile(self, percent):
+        "Value at percentile, None if histogram is empty"
+
+        if self.count == 0:
+            return None
+        rank = max(int(math.ceil(self.count * percent / 100.0)), 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(max(self._bucket_value(bucket), self.min), self.max)
+        return self.max
+
+    def serialize(self):
+        "Return compact text form without commas, so it can be stored in CSV column"
+
+        def bound(value):
+            # Bounds are written as floats, so text doesn't depend on type of recorded values
+            return None if value is None else float(value)
+
+        buckets = ";".join("%d:%d" % (bucket, self.counts[bucket]) for bucket in sorted(self.counts))
+        return "%s/%g/%r/%r/%s" % (self.format_version, self.precision, bound(self.min), bound(self.max), buckets)
+
+    @classmethod
+    def deserialize(cls, text):
+        version, precision, minimum, maximum, buckets = text.split("/")
+        if version != cls.format_version:
+            raise ValueError("Unknown histogram format " + version)
+        histogram = cls(float(precision))
+        histogram.min = None if minimum == "None" else float(minimum)
+        histogram.max = None if maximum == "None" else float(maximum)
+        for item in buckets.split(";") if buckets else []:
+            bucket, count = item.split(":")
+            histogram.counts[int(bucket)] = int(count)
+            histogram.count += int(count)
+        return histogram
+
+    def report_values(self):
+        "Return values for report with names of LatencyHistogram.metrics_fields"
+
+        def rounded(value):
+            return None if value is None else round(value, 3)
+
+        return {
+            'P95TimeMS': rounded(self.percentile(95)),
+            'P99TimeMS': rounded(self.percentile(99)),
+            'P999TimeMS': rounded(self.percentile(99.9)),
+            'Histogram': self.serialize()
+        }
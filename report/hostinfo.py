@@ -0,0 +1,124 @@
+import collections
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import tempfile
+
+# Host parameters that don't change until reboot, they are collected once
+# per boot and stored in a cache file
+_static_fields = [
+    'ServerName', 'Architecture', 'Machine', 'Node', 'System', 'KernelRelease',
+    'CPUCount', 'CPUModel', 'CPUMaxMHz', 'CPUSockets', 'CPUCoresPerSocket', 'CPUThreadsPerCore',
+    'L1dCache', 'L1iCache', 'L2Cache', 'L3Cache', 'NUMANodes', 'NUMANodeCPUs', 'CPUGovernor',
+    'MemTotal', 'SwapTotal', 'HugePages_Total', 'Hugepagesize'
+]
+# Current CPU frequency and memory state are read from /proc on every call
+_dynamic_fields = ['CPUMHz', 'MemFree', 'MemAvailable', 'SwapFree', 'HugePages_Free']
+
+HostInfo = collections.namedtuple("HostInfo", _static_fields + _dynamic_fields)
+
+_lscpu_patterns = {
+    'CPUModel': re.compile("^Model name: +(.+)$", flags=re.MULTILINE),
+    'CPUMaxMHz': re.compile("^CPU max MHz: +(.+)$", flags=re.MULTILINE),
+    'CPUSockets': re.compile(r"^Socket\(s\): +(.+)$", flags=re.MULTILINE),
+    'CPUCoresPerSocket': re.compile(r"^Core\(s\) per socket: +(.+)$", flags=re.MULTILINE),
+    'CPUThreadsPerCore': re.compile(r"^Thread\(s\) per core: +(.+)$", flags=re.MULTILINE),
+    'L1dCache': re.compile("^L1d cache: +(.+)$", flags=re.MULTILINE),
+    'L1iCache': re.compile("^L1i cache: +(.+)$", flags=re.MULTILINE),
+    'L2Cache': re.compile("^L2 cache: +(.+)$", flags=re.MULTILINE),
+    'L3Cache': re.compile("^L3 cache: +(.+)$", flags=re.MULTILINE),
+    'NUMANodes': re.compile(r"^NUMA node\(s\): +(.+)$", flags=re.MULTILINE)
+}
+_numa_node_cpus_pattern = re.compile(r"^NUMA node\d+ CPU\(s\): +(.+)$", flags=re.MULTILINE)
+_meminfo_fields = ['MemTotal', 'MemFree', 'MemAvailable', 'SwapTotal', 'SwapFree', 'HugePages_Total', 'HugePages_Free', 'Hugepagesize']
+_proc_meminfo_pattern = re.compile("^([A-Za-z_]+): +(.+)$", flags=re.MULTILINE)
+_proc_cpuinfo_mhz_pattern = re.compile(r"^cpu MHz\s*: +(.+)$", flags=re.MULTILINE)
+
+_static_values = None
+
+def _boot_id():
+    try:
+        with open('/proc/sys/kernel/random/boot_id', 'r') as boot_id_file:
+            return boot_id_file.read().strip()
+    except OSError:
+        return 'unknown'
+
+def _cache_file_name():
+    return os.path.join(tempfile.gettempdir(), "omniscripts_hostinfo_%s.json" % _boot_id())
+
+def _match(pattern, output):
+    matches = re.search(pattern, output)
+    if matches is None:
+        return 'N/A'
+    return matches.groups()[0].strip()
+
+def _read_file(file_name):
+    try:
+        with open(file_name, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return 'N/A'
+
+def _read_meminfo():
+    meminfo = dict(re.findall(_proc_meminfo_pattern, _read_file('/proc/meminfo')))
+    return {field: meminfo.get(field, 'N/A').strip() for field in _meminfo_fields}
+
+def _collect_static_fields():
+    values = {
+        'ServerName': socket.gethostname(),
+        'Architecture': platform.architecture()[0],
+        'Machine': platform.machine(),
+        'Node': platform.node(),
+        'System': platform.system(),
+        'KernelRelease': platform.release(),
+        'CPUCount': str(os.cpu_count()),
+        'CPUGovernor': _read_file('/sys/devices/system/cpu/cpu0/cpufreq/scaling_governor')
+    }
+    try:
+        output = subprocess.run(['lscpu'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode()
+    except OSError:
+        output = ''
+    values.update({field: _match(pattern, output) for field, pattern in _lscpu_patterns.items()})
+    numa_node_cpus = re.findall(_numa_node_cpus_pattern, output)
+    values['NUMANodeCPUs'] = ';'.join(cpus.strip() for cpus in numa_node_cpus) if numa_node_cpus else 'N/A'
+    meminfo = _read_meminfo()
+    values.update({field: meminfo[field] for field in ['MemTotal', 'SwapTotal', 'HugePages_Total', 'Hugepagesize']})
+    return values
+
+def _load_static_fields():
+    cache_file_name = _cache_file_name()
+    try:
+        with open(cache_file_name, 'r') as cache_file:
+            values = json.load(cache_file)
+        if set(values.keys()) == set(_static_fields):
+            return values
+    except (OSError, ValueError):
+        pass
+    values = _collect_static_fields()
+    try:
+        tmp_file_name = "%s.%d" % (cache_file_name, os.getpid())
+        with open(tmp_file_name, 'w') as cache_file:
+            json.dump(values, cache_file)
+        os.replace(tmp_file_name, cache_file_name)
+    except OSError as err:
+        print("Failed to store host info in", cache_file_name, err)
+    return values
+
+def get_dynamic_host_info():
+    "Return dict of current CPU frequency and memory state"
+
+    meminfo = _read_meminfo()
+    values = {field: meminfo[field] for field in _dynamic_fields if field in meminfo}
+    values['CPUMHz'] = _match(_proc_cpuinfo_mhz_pattern, _read_file('/proc/cpuinfo'))
+    return values
+
+def get_host_info():
+    "Return HostInfo record, static host parameters are collected once per boot and dynamic ones on every call"
+
+    global _static_values
+    if _static_values is None:
+        _static_values = _load_static_fields()
+    return HostInfo(**_static_values, **get_dynamic_host_info())
@@ -0,0 +1,184 @@
+import math
+import time
+
+from histogram import LatencyHistogram
+
+def add_measurement_arguments(parser):
+    "Add arguments that control adaptive measurement to argparse parser"
+
+    parser.add_argument("-max-iterations", default=100, type=int, help="Maximum number of iterations to run every query when confidence interval of median doesn't converge.")
+    parser.add_argument("-target-ci", default=0.05, type=float, help="Target width of confidence interval of median relative to median. Query iterations stop when it is reached.")
+    parser.add_argument("-confidence", default=0.95, type=float, help="Confidence level of median confidence interval.")
+    parser.add_argument("-time-budget", default=60.0, type=float, help="Time budget in seconds to measure every query. Iterations stop when it is exceeded even if target confidence interval is not reached.")
+    parser.add_argument("-max-warmup", default=3, type=int, help="Maximum number of first iterations that can be detected as warmup and discarded.")
+
+def percentile(sorted_values, percent):
+    "Percentile of sorted values with linear interpolation between closest ranks"
+
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    position = (len(sorted_values) - 1) * percent / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def _median(values):
+    return percentile(sorted(values), 50)
+
+def _normal_quantile(p):
+    # Inverse of standard normal CDF by bisection, precise enough for confidence levels
+    low, high = -10.0, 10.0
+    for _ in range(100):
+        middle = (low + high) / 2
+        if 0.5 * (1 + math.erf(middle / math.sqrt(2))) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+class MeasurementResult:
+    "Statistics of accepted iterations of one query"
+
+    def __init__(self, times, warmup, accepted, confidence, error=None):
+        self.times = times
+        self.warmup = warmup
+        self.accepted = accepted
+        self.error = error
+        values = sorted(times[i] for i in accepted)
+        self.iterations = len(times)
+        self.outliers = len(times) - warmup - len(accepted)
+        self.first = times[0] if times else None
+        # Histogram is built from accepted iterations, so tail percentiles describe the same population as median
+        self.histogram = LatencyHistogram()
+        for time_ms in values:
+            self.histogram.record(time_ms)
+        if not values:
+            self.best = self.worst = self.average = self.median = self.p90 = self.stddev = self.ci_low = self.ci_high = None
+            return
+        self.best = values[0]
+        self.worst = values[-1]
+        self.average = sum(values) / len(values)
+        self.median = percentile(values, 50)
+        self.p90 = percentile(values, 90)
+        if len(values) > 1:
+            self.stddev = math.sqrt(sum((value - self.average) ** 2 for value in values) / (len(values) - 1))
+        else:
+            self.stddev = 0.0
+        # Distribution-free confidence interval of median by order statistics
+        n = len(values)
+        z = _normal_quantile(0.5 + confidence / 2)
+        low_rank = int(math.floor(n / 2 - z * math.sqrt(n) / 2))
+        high_rank = int(math.ceil(n / 2 + z * math.sqrt(n) / 2))
+        self.ci_low = values[max(low_rank, 0)]
+        self.ci_high = values[min(high_rank, n - 1)]
+
+    def ci_relative_width(self):
+        if self.median is None:
+            return float("inf")
+        if self.median == 0:
+            return 0.0 if self.ci_high == self.ci_low else float("inf")
+        return (self.ci_high - self.ci_low) / self.median
+
+    def report_values(self):
+        "Return values of statistics for report with names of Measurement.metrics_fields"
+
+        def rounded(value):
+            return None if value is None else int(round(value))
+
+        return {
+            'MedianExecTimeMS': rounded(self.median),
+            'P90ExecTimeMS': rounded(self.p90),
+            'StdDevExecTimeMS': None if self.stddev is None else round(self.stddev, 3),
+            'CILowExecTimeMS': rounded(self.ci_low),
+            'CIHighExecTimeMS': rounded(self.ci_high),
+            'Iterations': self.iterations,
+            'WarmupIterations': self.warmup,
+            'OutlierIterations': self.outliers,
+            **self.histogram.report_values()
+        }
+
+class Measurement:
+    "Run query iterations until confidence interval of median time is narrow enough or time budget is exhausted"
+
+    metrics_fields = {
+        'MedianExecTimeMS': 'BIGINT UNSIGNED',
+        'P90ExecTimeMS': 'BIGINT UNSIGNED',
+        'StdDevExecTimeMS': 'DOUBLE',
+        'CILowExecTimeMS': 'BIGINT UNSIGNED',
+        'CIHighExecTimeMS': 'BIGINT UNSIGNED',
+        'Iterations': 'INT UNSIGNED',
+        'WarmupIterations': 'INT UNSIGNED',
+        'OutlierIterations': 'INT UNSIGNED',
+        **LatencyHistogram.metrics_fields
+    }
+
+    def __init__(self, min_iterations=5, max_iterations=100, target_ci=0.05, confidence=0.95, time_budget=60.0,
+                 max_warmup=3, outlier_threshold=3.5):
+        self.min_iterations = max(min_iterations, 1)
+        self.max_iterations = max(max_iterations, self.min_iterations)
+        self.target_ci = target_ci
+        self.confidence = confidence
+        self.time_budget = time_budget
+        self.max_warmup = max_warmup
+        self.outlier_threshold = outlier_threshold
+
+    @classmethod
+    def from_args(cls, args, min_iterations):
+        return cls(min_iterations=min_iterations, max_iterations=args.max_iterations, target_ci=args.target_ci,
+                   confidence=args.confidence, time_budget=args.time_budget, max_warmup=args.max_warmup)
+
+    def _robust_spread(self, values):
+        median = _median(values)
+        # Scaled median absolute deviation estimates standard deviation of normal distribution
+        return median, 1.4826 * _median([abs(value - median) for value in values])
+
+    def _detect_warmup(self, times):
+        # Leading iterations that are slower than upper fence of the following ones are warmup
+        warmup = 0
+        while warmup < min(self.max_warmup, len(times) - 2):
+            median, spread = self._robust_spread(times[warmup + 1:])
+            if times[warmup] <= median + self.outlier_threshold * max(spread, 0.01 * median, 1):
+                break
+            warmup += 1
+        return warmup
+
+    def _accepted(self, times, warmup):
+        indices = list(range(warmup, len(times)))
+        if len(indices) < 3:
+            return indices
+        median, spread = self._robust_spread([times[i] for i in indices])
+        # Spread is limited from below, otherwise every deviation is an outlier when most times are equal
+        limit = self.outlier_threshold * max(spread, 0.01 * median, 1)
+        return [i for i in indices if abs(times[i] - median) <= limit]
+
+    def analyze(self, times, error=None):
+        "Return MeasurementResult for iteration times"
+
+        warmup = self._detect_warmup(times)
+        return MeasurementResult(times, warmup, self._accepted(times, warmup), self.confidence, error)
+
+    def run(self, iteration_func, name=""):
+        """Call iteration_func(iteration) until measurement converges. It returns iteration
+        time in ms or None when iteration failed, in which case measurement stops"""
+
+        times = []
+        t_begin = time.time()
+        while True:
+            iteration = len(times) + 1
+            print("RUNNING", name, "ITERATION NUMBER", iteration)
+            time_ms = iteration_func(iteration)
+            if time_ms is None:
+                return self.analyze(times, error="Iteration %d failed" % iteration)
+            times.append(time_ms)
+            if len(times) < self.min_iterations:
+                continue
+            result = self.analyze(times)
+            if len(result.accepted) >= self.min_iterations and result.ci_relative_width() <= self.target_ci:
+                print(name, "CONVERGED AFTER", len(times), "ITERATIONS, MEDIAN CI", result.ci_low, "-", result.ci_high)
+                return result
+            if len(times) >= self.max_iterations:
+                print(name, "REACHED MAXIMUM NUMBER OF ITERATIONS", len(times), "MEDIAN CI", result.ci_low, "-", result.ci_high)
+                return result
+            if time.time() - t_begin >= self.time_budget:
+                print(name, "EXCEEDED TIME BUDGET AFTER", len(times), "ITERATIONS, MEDIAN CI", result.ci_low, "-", result.ci_high)
+                return result
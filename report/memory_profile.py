@@ -0,0 +1,124 @@
+import contextlib
+import tracemalloc
+
+def add_memory_arguments(parser):
+    "Add arguments that control memory profiling to argparse parser"
+
+    parser.add_argument("-mem-profile", action='store_true', help="Run every query or stage once more with memory accounting and report Python allocations peak and RSS high-water mark of it.")
+    parser.add_argument("-mem-top", default=0, type=int, help="Number of allocation sites with largest growth of allocated memory to print for every profiled query or stage.")
+
+def _read_status_mb(field):
+    # Values in /proc/self/status are in kB
+    try:
+        with open("/proc/self/status", "r") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_rss_peak():
+    # Writing 5 to clear_refs resets VmHWM to current RSS, supported by Linux 4.0 and newer
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+class MemoryProfile:
+    "Memory used by one query or stage, maximums of all times it was profiled"
+
+    def __init__(self):
+        self.python_peak = None
+        self.rss_peak = None
+        self.rss_growth = None
+        self.top = []
+
+    def update(self, python_peak, rss_peak, rss_growth):
+        def maximum(old, new):
+            return new if old is None or (new is not None and new > old) else old
+
+        self.python_peak = maximum(self.python_peak, python_peak)
+        self.rss_peak = maximum(self.rss_peak, rss_peak)
+        self.rss_growth = maximum(self.rss_growth, rss_growth)
+
+    def report_values(self):
+        "Return values for report with names of MemoryProfiler.metrics_fields"
+
+        def rounded(value):
+            return None if value is None else round(value, 1)
+
+        return {
+            'PythonPeakMB': rounded(self.python_peak),
+            'RssPeakMB': rounded(self.rss_peak),
+            'RssGrowthMB': rounded(self.rss_growth)
+        }
+
+class MemoryProfiler:
+    """Memory accounting of queries or stages. Peak of memory allocated through Python
+    allocators, including NumPy buffers, is traced by tracemalloc and high-water mark
+    of resident set size is read from /proc/self/status"""
+
+    metrics_fields = {
+        'PythonPeakMB': 'DOUBLE',
+        'RssPeakMB': 'DOUBLE',
+        'RssGrowthMB': 'DOUBLE'
+    }
+
+    def __init__(self, enabled=True, top=0):
+        self.enabled = enabled
+        self.top = top
+        self.profiles = {}
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(enabled=args.mem_profile or args.mem_top > 0, top=args.mem_top)
+
+    def report_values(self, name=None):
+        """Return report values of profiled query or stage, they are empty if it was not profiled.
+        Maximums of all profiled queries or stages are returned if name is None"""
+
+        if name is not None:
+            return self.profiles.get(name, MemoryProfile()).report_values()
+        total = MemoryProfile()
+        for profile in self.profiles.values():
+            total.update(profile.python_peak, profile.rss_peak, profile.rss_growth)
+        return total.report_values()
+
+    def _snapshot(self):
+        # Allocations of profiler itself are not reported
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)])
+
+    @contextlib.contextmanager
+    def profile(self, name):
+        """Account memory used in context, maximum of all contexts with the same name is kept.
+        Contexts should not be nested because peaks are reset when context is entered"""
+
+        if not self.enabled:
+            yield
+            return
+        # Tracing slows allocations down, so it is active only in profiled context
+        tracemalloc.start()
+        before = self._snapshot() if self.top > 0 else None
+        tracemalloc.reset_peak()
+        python_base = tracemalloc.get_traced_memory()[0]
+        rss_base = _read_status_mb("VmRSS")
+        if not _reset_rss_peak():
+            # High-water mark cannot be reset, peak of whole process is reported
+            rss_base = None
+        try:
+            yield
+        finally:
+            python_peak = (tracemalloc.get_traced_memory()[1] - python_base) / 2**20
+            rss_peak = _read_status_mb("VmHWM")
+            profile = self.profiles.setdefault(name, MemoryProfile())
+            profile.update(python_peak, rss_peak, None if rss_base is None or rss_peak is None else rss_peak - rss_base)
+            print("MEMORY", name, "PYTHON PEAK MB", round(python_peak, 1), "RSS PEAK MB", None if rss_peak is None else round(rss_peak, 1))
+            if before is not None:
+                profile.top = self._snapshot().compare_to(before, 'lineno')[:self.top]
+                for statistic in profile.top:
+                    print("MEMORY TOP", name, statistic)
+            tracemalloc.stop()
@@ -1,8 +1,26 @@
 import os
-import re
-import socket
-import platform
-import subprocess
+import json
+import threading
+import time
+import atexit
+import hostinfo
+import mysql.connector
+
+# Names of rows with server startup and shutdown times in reports of all benchmarks
+SERVER_STARTUP = "server_startup"
+SERVER_SHUTDOWN = "server_shutdown"
+
+def report_server_time(report_file, db_reporter, name, time_ms, **fields):
+    "Write server startup or shutdown time as a query result row preceded by benchmark specific fields"
+
+    values = dict(fields)
+    values['QueryName'] = name
+    for field in ['FirstExecTimeMS', 'WorstExecTimeMS', 'BestExecTimeMS', 'AverageExecTimeMS', 'TotalTimeMS']:
+        values[field] = time_ms
+    print("".join(field + ": " + str(value) + "," for field, value in values.items()),
+          "", '\n', file=report_file, sep='', end='', flush=True)
+    if db_reporter is not None:
+        db_reporter.submit(values)
 
 class DbReport:
     "Initialize and submit reports to MySQL database"
@@ -18,14 +36,21 @@ class DbReport:
         'Machine': 'VARCHAR(500) NOT NULL',
         'Node': 'VARCHAR(500) NOT NULL',
         'System': 'VARCHAR(500) NOT NULL',
+        'KernelRelease': 'VARCHAR(500) NOT NULL',
         'CPUCount': 'VARCHAR(500) NOT NULL',
         'CPUModel': 'VARCHAR(500) NOT NULL',
         'CPUMHz':  'VARCHAR(500) NOT NULL',
         'CPUMaxMHz': 'VARCHAR(500) NOT NULL',
+        'CPUSockets': 'VARCHAR(500) NOT NULL',
+        'CPUCoresPerSocket': 'VARCHAR(500) NOT NULL',
+        'CPUThreadsPerCore': 'VARCHAR(500) NOT NULL',
+        'CPUGovernor': 'VARCHAR(500) NOT NULL',
         'L1dCache': 'VARCHAR(500) NOT NULL',
         'L1iCache': 'VARCHAR(500) NOT NULL',
         'L2Cache': 'VARCHAR(500) NOT NULL',
         'L3Cache': 'VARCHAR(500) NOT NULL',
+        'NUMANodes': 'VARCHAR(500) NOT NULL',
+        'NUMANodeCPUs': 'VARCHAR(500) NOT NULL',
         'MemTotal': 'VARCHAR(500) NOT NULL',
         'MemFree': 'VARCHAR(500) NOT NULL',
         'MemAvailable': 'VARCHAR(500) NOT NULL',
@@ -36,62 +61,30 @@ class DbReport:
         'Hugepagesize': 'VARCHAR(500) NOT NULL'
     }
 
-    __lscpu_patterns = {
-        'CPUModel': re.compile("^Model name: +(.+)$", flags=re.MULTILINE),
-        'CPUMHz': re.compile("^CPU MHz: +(.+)$", flags=re.MULTILINE),
-        'CPUMaxMHz': re.compile("^CPU max MHz: +(.+)$", flags=re.MULTILINE),
-        'L1dCache': re.compile("^L1d cache: +(.+)$", flags=re.MULTILINE),
-        'L1iCache': re.compile("^L1i cache: +(.+)$", flags=re.MULTILINE),
-        'L2Cache': re.compile("^L2 cache: +(.+)$", flags=re.MULTILINE),
-        'L3Cache': re.compile("^L3 cache: +(.+)$", flags=re.MULTILINE)
-    }
-    __proc_meminfo_patterns = {
-        'MemTotal': re.compile("^MemTotal: +(.+)$", flags=re.MULTILINE),
-        'MemFree': re.compile("^MemFree: +(.+)$", flags=re.MULTILINE),
-        'MemAvailable': re.compile("^MemAvailable: +(.+)$", flags=re.MULTILINE),
-        'SwapTotal': re.compile("^SwapTotal: +(.+)$", flags=re.MULTILINE),
-        'SwapFree': re.compile("^SwapFree: +(.+)$", flags=re.MULTILINE),
-        'HugePages_Total': re.compile("^HugePages_Total: +(.+)$", flags=re.MULTILINE),
-        'HugePages_Free': re.compile("^HugePages_Free: +(.+)$", flags=re.MULTILINE),
-        'Hugepagesize': re.compile("^Hugepagesize: +(.+)$", flags=re.MULTILINE)
-    }
-    __predefined_field_values = {}
-
     def __init_predefined_field_values(self, initial_values):
         # System parameters
-        self.__predefined_field_values['ServerName'] = socket.gethostname()
-        self.__predefined_field_values['Architecture'] = platform.architecture()[0]
-        self.__predefined_field_values['Machine'] = platform.machine()
-        self.__predefined_field_values['Node'] = platform.node()
-        self.__predefined_field_values['System'] = platform.system()
-        self.__predefined_field_values['CPUCount'] = os.cpu_count()
-        def match_and_assign(tag, pattern):
-            matches = re.search(pattern, output)
-            if matches is None:
-                return 'N/A'
-            if len(matches.groups()) == 1:
-                return matches.groups()[0]
-            else:
-                return 'N/A'
-        # System data from lscpu
-        data = subprocess.Popen(['lscpu'], stdout = subprocess.PIPE)
-        output = str(data.communicate()[0].strip().decode())
-        lscpu_values = {t: match_and_assign(t, p) for (t, p) in self.__lscpu_patterns.items()}
-        self.__predefined_field_values.update(lscpu_values)
-        # System data from /proc/meminfo
-        with open('/proc/meminfo', 'r') as proc_meminfo:
-            output = proc_meminfo.read().strip()
-            proc_meminfo_values = {t: match_and_assign(t, p) for (t, p) in self.__proc_meminfo_patterns.items()}
-            self.__predefined_field_values.update(proc_meminfo_values)
+        self.__predefined_field_values = hostinfo.get_host_info()._asdict()
         # Script specific values
         if initial_values is not None:
             self.__predefined_field_values.update(initial_values)
         print('self.__predefined_field_values = ', self.__predefined_field_values)
 
-    def __init__(self, database, table_name, benchmark_specific_fields, initial_values=None):
+    def __add_missing_columns(self, database, all_fields):
+        # Tables created by previous versions of scripts don't have fields added later
+        cursor = database.cursor()
+        cursor.execute("SHOW COLUMNS FROM %s;" % self.__table_name)
+        existing_fields = set(row[0] for row in cursor.fetchall())
+        for field, spec in all_fields.items():
+            if field not in existing_fields:
+                sql_statement = "ALTER TABLE %s ADD COLUMN %s %s;" % (self.__table_name, field, spec)
+                print("Executing statement", sql_statement)
+                cursor.execute(sql_statement)
+
+    def __init__(self, database, table_name, benchmark_specific_fields, initial_values=None,
+                 batch_size=100, retries=3, spool_file_name=None):
         self.__table_name = table_name
         self.__init_predefined_field_values(initial_values)
-        all_fields = self.__predefined_fields
+        all_fields = dict(self.__predefined_fields)
         all_fields.update(benchmark_specific_fields)
         sql_statement = "CREATE TABLE IF NOT EXISTS %s (" % table_name
         for field, spec in all_fields.items():
@@ -99,28 +92,92 @@ class DbReport:
         sql_statement += "PRIMARY KEY (id));"
         print("Executing statement", sql_statement)
         database.cursor().execute(sql_statement)
+        self.__add_missing_columns(database, all_fields)
         self.__database = database
+        self.__batch_size = batch_size
+        self.__retries = retries
+        if spool_file_name is None:
+            spool_file_name = table_name + "_spool.json"
+        self.__spool_file_name = spool_file_name
+        self.__rows = []
+        # Rows can be submitted from several threads, database connection is used by one of them at a time
+        self.__lock = threading.RLock()
+        self.__submit_spooled_rows()
+        atexit.register(self.flush)
 
-    def __quote_string(self, n):
-        if type(n) is str:
-            return "'" + n + "'"
-        elif type(n) is float:
+    def __convert_value(self, n):
+        if type(n) is float:
             if n == float("inf"):
-                return '4294967295'
-        return str(n)
+                return 4294967295
+        return n
 
     def submit(self, benchmark_specific_values):
-        sql_statement = "INSERT INTO %s (" % self.__table_name
-        all_fields = self.__predefined_field_values
-        all_fields.update(benchmark_specific_values)
-        for n in list(all_fields.keys())[:-1]:
-            sql_statement += n + ','
-        sql_statement += list(all_fields)[-1] + ") VALUES("
-        for n in list(all_fields.values())[:-1]:
-            sql_statement += self.__quote_string(n) + ','
-        n = list(all_fields.values())[-1]
-        sql_statement += self.__quote_string(n) + ");"
-        print("Executing statement", sql_statement)
-        self.__database.cursor().execute(sql_statement)
-        self.__database.commit()
+        "Buffer result row, rows are inserted by batches of batch_size rows and at exit"
+
+        row = dict(self.__predefined_field_values)
+        # Time of result is inserted explicitly, so rows replayed from spool file keep it
+        row['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        # Memory state and CPU frequency are recorded at the time of every result
+        row.update(hostinfo.get_dynamic_host_info())
+        row.update(benchmark_specific_values)
+        with self.__lock:
+            self.__rows.append({field: self.__convert_value(value) for field, value in row.items()})
+            if len(self.__rows) >= self.__batch_size:
+                self.flush()
+
+    def flush(self):
+        "Insert buffered rows, store them in spool file if they can't be inserted for any reason"
+
+        with self.__lock:
+            rows, self.__rows = self.__rows, []
+            if not rows:
+                return
+            try:
+                self.__insert_rows(rows)
+            except Exception as err:
+                # Only connection errors are retried, rows are never lost because of other errors
+                print("Failed to submit", len(rows), "rows to database:", err)
+                print("Storing rows in spool file", self.__spool_file_name)
+                with open(self.__spool_file_name, "a") as spool_file:
+                    for row in rows:
+                        print(json.dumps(row, default=str), file=spool_file)
+
+    def __insert_rows(self, rows):
+        # Rows with the same set of fields are inserted by one statement
+        rows_by_fields = {}
+        for row in rows:
+            rows_by_fields.setdefault(tuple(row.keys()), []).append(tuple(row.values()))
+        for attempt in range(self.__retries + 1):
+            try:
+                cursor = self.__database.cursor()
+                for fields, values in rows_by_fields.items():
+                    sql_statement = "INSERT INTO %s (%s) VALUES (%s)" % (self.__table_name, ",".join(fields), ",".join(["%s"] * len(fields)))
+                    print("Executing statement", sql_statement, "for", len(values), "rows")
+                    cursor.executemany(sql_statement, values)
+                self.__database.commit()
+                return
+            except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError) as err:
+                if attempt == self.__retries:
+                    raise
+                print("Lost connection to database:", err, "reconnecting")
+                try:
+                    self.__database.reconnect(attempts=1)
+                except mysql.connector.Error:
+                    time.sleep(2 ** attempt)
+            except mysql.connector.Error:
+                # Rows inserted by previous statements are spooled too, so they must not be committed later
+                try:
+                    self.__database.rollback()
+                except mysql.connector.Error:
+                    pass
+                raise
 
+    def __submit_spooled_rows(self):
+        if not os.path.exists(self.__spool_file_name):
+            return
+        with open(self.__spool_file_name, "r") as spool_file:
+            rows = [json.loads(line) for line in spool_file if line.strip()]
+        print("Submitting", len(rows), "rows from spool file", self.__spool_file_name)
+        os.remove(self.__spool_file_name)
+        self.__rows.extend(rows)
+        self.flush()
@@ -0,0 +1,292 @@
+import mysql.connector
+import threading
+import argparse
+import pathlib
+import random
+import queue
+import glob
+import time
+import sys
+import os
+
+# Load database reporting and omnisql session functions
+pathToReportDir = os.path.join(pathlib.Path(__file__).parent, "report")
+pathToServerDir = os.path.join(pathlib.Path(__file__).parent, "server")
+sys.path.insert(1, pathToReportDir)
+sys.path.insert(1, pathToServerDir)
+import report
+from omnisql_session import OmnisqlSession
+from pymapd_session import PymapdSession
+from measurement import percentile
+from histogram import LatencyHistogram
+
+def load_queries(queries_dir, table_name):
+    "Read query files of directory, ##TAB## in them is replaced by table name"
+
+    queries = {}
+    for file_name in sorted(glob.glob(os.path.join(queries_dir, "*.sql"))):
+        with open(file_name, "r") as query_file:
+            queries[pathlib.Path(file_name).stem] = query_file.read().replace("##TAB##", table_name)
+    return queries
+
+def sentinel_overhead(session, repetitions=5):
+    """Return median time in ms of executing empty statement by omnisql session. Every
+    statement executed by omnisql session is followed by sentinel SELECT that marks end
+    of its output, so its round trip is subtracted from latencies"""
+
+    if args.client != "omnisql":
+        return 0.0
+    times = []
+    for _ in range(repetitions):
+        t1 = time.time()
+        session.execute("")
+        times.append((time.time() - t1) * 1000)
+    return percentile(sorted(times), 50)
+
+def create_session():
+    if args.client == "pymapd":
+        return PymapdSession(user=args.user, password=args.passwd, port=args.port, dbname=args.name)
+    return OmnisqlSession([args.executable, "-q", args.name, "-u", args.user, "-p", args.passwd, "--port", str(args.port)])
+
+class LoadLevel:
+    """Run query mix from concurrent clients for fixed duration. In closed loop every
+    client sends next query when previous one is finished. In open loop queries arrive
+    at fixed rate and latency is counted from scheduled arrival, so time spent waiting
+    for a free client is included"""
+
+    def __init__(self, sessions, queries, rate=None):
+        self.sessions = sessions
+        self.overheads = {session: sentinel_overhead(session) for session in sessions}
+        self.queries = queries
+        self.rate = rate
+        self.samples = []
+        self.unfinished = 0
+        self.elapsed = 0
+        self._samples_lock = threading.Lock()
+        self._arrivals = queue.Queue()
+
+    def _execute(self, session, query_name, scheduled_time, measured):
+        t1 = time.time()
+        try:
+            result = session.execute(self.queries[query_name])
+            error = result.error
+        except Exception as err:
+            error = str(err)
+        latency = (time.time() - (t1 if scheduled_time is None else scheduled_time)) * 1000
+        latency = max(latency - self.overheads[session], 0.0)
+        if measured:
+            with self._samples_lock:
+                self.samples.append((query_name, latency, error))
+
+    def _closed_loop_client(self, index, session, t_warmup_end, t_end):
+        generator = random.Random(args.seed + index)
+        query_names = list(self.queries)
+        while time.time() < t_end:
+            self._execute(session, generator.choice(query_names), None, time.time() >= t_warmup_end)
+
+    def _open_loop_client(self, session, t_warmup_end):
+        while True:
+            arrival = self._arrivals.get()
+            if arrival is None:
+                return
+            scheduled_time, query_name = arrival
+            self._execute(session, query_name, scheduled_time, scheduled_time >= t_warmup_end)
+
+    def run(self, duration, warmup):
+        t_begin = time.time()
+        t_warmup_end = t_begin + warmup
+        t_end = t_warmup_end + duration
+        if self.rate is None:
+            threads = [threading.Thread(target=self._closed_loop_client, args=(i, session, t_warmup_end, t_end))
+                       for i, session in enumerate(self.sessions)]
+        else:
+            threads = [threading.Thread(target=self._open_loop_client, args=(session, t_warmup_end))
+                       for session in self.sessions]
+        for thread in threads:
+            thread.start()
+        if self.rate is not None:
+            generator = random.Random(args.seed)
+            query_names = list(self.queries)
+            arrival = 0
+            while True:
+                scheduled_time = t_begin + arrival / self.rate
+                if scheduled_time >= t_end:
+                    break
+                time.sleep(max(scheduled_time - time.time(), 0))
+                self._arrivals.put((scheduled_time, generator.choice(query_names)))
+                arrival += 1
+            # Queries that were not started until the end of level are not executed
+            while True:
+                try:
+                    scheduled_time, _ = self._arrivals.get_nowait()
+                except queue.Empty:
+                    break
+                if scheduled_time >= t_warmup_end:
+                    self.unfinished += 1
+            for _ in threads:
+                self._arrivals.put(None)
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.time() - t_warmup_end
+
+    def statistics(self, query_name=None):
+        """Return throughput, latency percentiles and error rates of all queries or one query.
+        Errors and ErrorRate count executed queries that failed, queries that were not
+        started until the end of open loop level are counted in Unfinished and UnfinishedRate"""
+
+        samples = [sample for sample in self.samples if query_name is None or sample[0] == query_name]
+        latencies = sorted(latency for _, latency, error in samples if error is None)
+        errors = len(samples) - len(latencies)
+        unfinished = self.unfinished if query_name is None else None
+
+        def latency_percentile(percent):
+            return round(percentile(latencies, percent), 1) if latencies else None
+
+        # Percentiles are exact, histogram is stored so levels or runs can be merged later
+        histogram = LatencyHistogram()
+        for latency in latencies:
+            histogram.record(latency)
+
+        return {
+            'Queries': len(latencies),
+            'Errors': errors,
+            'Unfinished': unfinished,
+            'ErrorRate': round(errors / len(samples), 4) if samples else None,
+            'UnfinishedRate': round(unfinished / (len(samples) + unfinished), 4) if unfinished is not None and len(samples) + unfinished > 0 else None,
+            'QPS': round(len(latencies) / self.elapsed, 2) if self.elapsed > 0 else None,
+            'P50LatencyMS': latency_percentile(50),
+            'P95LatencyMS': latency_percentile(95),
+            'P99LatencyMS': latency_percentile(99),
+            'P999LatencyMS': latency_percentile(99.9),
+            'MaxLatencyMS': round(latencies[-1], 1) if latencies else None,
+            'Histogram': histogram.serialize()
+        }
+
+parser = argparse.ArgumentParser(description='Run queries from concurrent clients against running omnisci server and report throughput and latency')
+optional = parser._action_groups.pop()
+required = parser.add_argument_group("required arguments")
+parser._action_groups.append(optional)
+
+optional.add_argument('-r', '--report', dest="report", default="report_load.csv",
+                      help="Report file name.")
+optional.add_argument("-d", "--queries-dir", dest="queries_dir", default=os.path.join(pathlib.Path(__file__).parent, "taxi", "queries"),
+                      help="Directory with query files in format of run_omnisci_benchmark.py. ##TAB## in queries is replaced by table name. By default taxi q1-q4 are used.")
+required.add_argument("-t", "--table-name", dest="table_name", required=True,
+                      help="Name of table that queries use.")
+optional.add_argument("-c", "--concurrency", dest="concurrency", action='append', type=int,
+                      help="Number of concurrent clients. Multiple values are allowed, every value is a separate load level. By default 1 client is used.")
+optional.add_argument("--mode", dest="mode", choices=['closed', 'open'], default='closed',
+                      help="In closed loop every client sends next query as soon as previous one is finished. In open loop queries arrive at fixed rate and are executed by free clients.")
+optional.add_argument("--rate", dest="rate", type=float,
+                      help="Arrival rate of queries per second in open loop mode.")
+optional.add_argument("--duration", dest="duration", default=60.0, type=float,
+                      help="Number of seconds to measure every load level.")
+optional.add_argument("--warmup", dest="warmup", default=5.0, type=float,
+                      help="Number of seconds to run every load level before measurement.")
+optional.add_argument("--seed", dest="seed", default=0, type=int,
+                      help="Seed of random choice of queries from query mix.")
+optional.add_argument("--client", dest="client", choices=['omnisql', 'pymapd'], default='omnisql',
+                      help="Client that executes queries. Every omnisql client is a separate omnisql process, pymapd clients are thrift connections. omnisql client executes sentinel SELECT after every query to find end of its output, median time of it measured for every client before load level is subtracted from latencies.")
+optional.add_argument("-e", "--executable", dest="executable", default="build/bin/omnisql",
+                      help='Path to executable "omnisql".')
+optional.add_argument("-o", "--port", dest="port", default=62074, type=int,
+                      help="TCP port of omnisci server.")
+optional.add_argument("-u", "--user", dest="user", default="admin",
+                      help="User name to use on omniscidb server.")
+optional.add_argument("-p", "--passwd", dest="passwd", default="HyperInteractive",
+                      help="User password to use on omniscidb server.")
+optional.add_argument("-n", "--name", dest="name", default="omnisci",
+                      help="Database name to use on omniscidb server.")
+
+# MySQL database parameters
+optional.add_argument("-db-server", default="localhost", help="Host name of MySQL server.")
+optional.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server.")
+optional.add_argument("-db-user", default="", help="Username to use to connect to MySQL database. If user name is specified, script attempts to store results in MySQL database using other -db-* parameters.")
+optional.add_argument("-db-pass", default="omniscidb", help="Password to use to connect to MySQL database.")
+optional.add_argument("-db-name", default="omniscidb", help="MySQL database to use to store benchmark results.")
+optional.add_argument("-db-table", help="Table to use to store results for this benchmark.")
+
+optional.add_argument("-commit", default="1234567890123456789012345678901234567890", help="Commit hash to use to record this benchmark results.")
+
+args = parser.parse_args()
+
+concurrency_levels = args.concurrency if args.concurrency is not None else [1]
+if any(concurrency < 1 for concurrency in concurrency_levels):
+    print("Bad number of concurrent clients specified", concurrency_levels)
+    sys.exit(3)
+
+if args.mode == 'open' and (args.rate is None or args.rate <= 0):
+    print("Positive --rate is mandatory in open loop mode")
+    sys.exit(3)
+
+queries = load_queries(args.queries_dir, args.table_name)
+if len(queries) == 0:
+    print("Could not find any query files in", args.queries_dir)
+    sys.exit(2)
+print("QUERY MIX", list(queries))
+
+db_reporter = None
+if args.db_user != "":
+    if args.db_table is None:
+        print("--db-table parameter is mandatory to store results in MySQL database")
+        sys.exit(4)
+    print("CONNECTING TO DATABASE")
+    db = mysql.connector.connect(host=args.db_server, port=args.db_port, user=args.db_user, passwd=args.db_pass, db=args.db_name);
+    db_reporter = report.DbReport(db, args.db_table, {
+        'Concurrency': 'INT UNSIGNED NOT NULL',
+        'Mode': 'VARCHAR(10) NOT NULL',
+        'ArrivalRate': 'DOUBLE',
+        'BenchName': 'VARCHAR(500) NOT NULL',
+        'Queries': 'BIGINT UNSIGNED',
+        'Errors': 'BIGINT UNSIGNED',
+        'Unfinished': 'BIGINT UNSIGNED',
+        'ErrorRate': 'DOUBLE',
+        'UnfinishedRate': 'DOUBLE',
+        'QPS': 'DOUBLE',
+        'P50LatencyMS': 'DOUBLE',
+        'P95LatencyMS': 'DOUBLE',
+        'P99LatencyMS': 'DOUBLE',
+        'P999LatencyMS': 'DOUBLE',
+        'MaxLatencyMS': 'DOUBLE',
+        'Histogram': LatencyHistogram.metrics_fields['Histogram']
+    }, {
+        'ScriptName': 'run_load_benchmark.py',
+        'CommitHash': args.commit
+    })
+
+with open(args.report, "w") as report:
+    print("concurrency,mode,arrival_rate,query,queries,errors,unfinished,error_rate,unfinished_rate,qps,p50_ms,p95_ms,p99_ms,p999_ms,max_ms,histogram", file=report, flush=True)
+    for concurrency in concurrency_levels:
+        print("RUNNING LOAD LEVEL WITH", concurrency, "CLIENTS IN", args.mode.upper(), "LOOP")
+        sessions = []
+        try:
+            for _ in range(concurrency):
+                sessions.append(create_session().start())
+            level = LoadLevel(sessions, queries, args.rate if args.mode == 'open' else None)
+            level.run(args.duration, args.warmup)
+        except Exception as err:
+            print("Failed to run load level with", concurrency, "clients:", err)
+            sys.exit(3)
+        finally:
+            for session in sessions:
+                session.close()
+        # First row of level is statistics of whole query mix
+        for query_name in [None] + list(queries):
+            statistics = level.statistics(query_name)
+            benchName = "all" if query_name is None else query_name
+            print("LOAD LEVEL", concurrency, "QUERY", benchName, "QPS", statistics['QPS'], "P50", statistics['P50LatencyMS'],
+                  "P99", statistics['P99LatencyMS'], "ERROR RATE", statistics['ErrorRate'], "UNFINISHED RATE", statistics['UnfinishedRate'])
+            print(concurrency, ",",
+                  args.mode, ",",
+                  "" if args.rate is None or args.mode != 'open' else args.rate, ",",
+                  benchName, ",",
+                  ",".join("" if value is None else str(value) for value in statistics.values()), '\n',
+                  file=report, sep='', end='', flush=True)
+            if db_reporter is not None:
+                db_reporter.submit({
+                    'Concurrency': concurrency,
+                    'Mode': args.mode,
+                    'ArrivalRate': args.rate if args.mode == 'open' else None,
+                    'BenchName': benchName,
+                    **statistics
+                })
@@ -4,26 +4,33 @@ import subprocess
 import threading
 import argparse
 import pathlib
-import signal
 import glob
-import time
 import json
 import copy
 import sys
+import traceback
 import os
 import io
 
-def execute_process(cmdline, cwd=None):
+def pinned_cmdline(cmdline, cpus):
+    "Prefix command line with taskset, so process is pinned to cpus before it starts, taskset execs command in the same process"
+
+    if cpus is None:
+        return cmdline
+    return ['taskset', '-c', ','.join(str(cpu) for cpu in sorted(cpus))] + cmdline
+
+def execute_process(cmdline, cwd=None, cpus=None):
     try:
-        process = subprocess.Popen(cmdline, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        process = subprocess.Popen(pinned_cmdline(cmdline, cpus), cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         out = process.communicate()[0].strip().decode()
         print(out)
     except OSError as err:
-        print("Failed to start", omnisciCmdLine, err)
+        print("Failed to start", cmdline, err)
+        raise
     if process.returncode != 0:
         raise Exception("Command returned {}".format(process.returncode))
 
-def execute_benchmark(datafiles, import_cmdline, benchmark_cwd, benchmark_cmdline, fragment_size, results_file_name, report):
+def execute_benchmark(datafiles, import_cmdline, benchmark_cwd, benchmark_cmdline, fragment_size, results_file_name, report, sampler, cpus=None):
     if import_cmdline is not None:
         ic = copy.copy(import_cmdline)
         # Import dataset mode
@@ -33,52 +40,266 @@ def execute_benchmark(datafiles, import_cmdline, benchmark_cwd, benchmark_cmdlin
         else:
             fs = 0
         print('IMPORT COMMAND LINE:', ic)
-        execute_process(ic)
+        execute_process(ic, cpus=cpus)
     else:
         # Synthetic benchmark mode
-        benchmark_cmdline += ['--fragment_size', str(fragment_size)]
+        benchmark_cmdline = benchmark_cmdline + ['--fragment_size', str(fragment_size)]
         fs = fragment_size
 
-    # Execute benchmark
+    # Execute benchmark. Queries are run by external script, so server
+    # resource usage is accounted for the whole benchmark run.
     print('BENCHMARK COMMAND LINE', benchmark_cmdline)
-    execute_process(benchmark_cmdline, cwd=benchmark_cwd)
+    sampler.begin()
+    execute_process(benchmark_cmdline, cwd=benchmark_cwd, cpus=cpus)
+    resource_usage = sampler.end()
 
     # Parse report
     with open(results_file_name, "r") as results_file:
         results = json.load(results_file)
-    for result in results:
+    with report_lock:
+        for result in results:
+            histogram_values = result_histogram_values(result)
+            print(datafiles, ",",
+                  fs, ",",
+                  result['name'], ",",
+                  result['results']['query_exec_min'], ",",
+                  result['results']['query_total_min'], ",",
+                  result['results']['query_exec_max'], ",",
+                  result['results']['query_total_max'], ",",
+                  result['results']['query_exec_avg'], ",",
+                  result['results']['query_total_avg'], ",",
+                  result['results']['query_error_info'], ",",
+                  ",".join(format_resource_usage(histogram_values[field]) for field in LatencyHistogram.metrics_fields), ",",
+                  ",".join(format_resource_usage(resource_usage[field]) for field in ResourceSampler.metrics_fields), '\n',
+                  file=report, sep='', end='', flush=True)
+            if db_reporter is not None:
+                values = {
+                    'FilesNumber': datafiles,
+                    'FragmentSize': fs,
+                    'BenchName': result['name'],
+                    'BestExecTimeMS': str(result['results']['query_exec_min']),
+                    'BestTotalTimeMS': result['results']['query_total_min'],
+                    'WorstExecTimeMS': str(result['results']['query_exec_max']),
+                    'WorstTotalTimeMS': result['results']['query_total_max'],
+                    'AverageExecTimeMS': str(result['results']['query_exec_avg']),
+                    'AverageTotalTimeMS': result['results']['query_total_avg']
+                }
+                values.update(histogram_values)
+                values.update(resource_usage)
+                db_reporter.submit(values)
+
+def result_histogram_values(result):
+    """Report values of histogram of per-iteration query exec times of benchmark result. Summary
+    results have only min/max/avg, so values are empty when benchmark doesn't report iteration times"""
+
+    times = result.get('debug', {}).get('query_exec_times', [])
+    if not times:
+        return dict.fromkeys(LatencyHistogram.metrics_fields)
+    histogram = LatencyHistogram()
+    for time_ms in times:
+        histogram.record(time_ms)
+    return histogram.report_values()
+
+def format_resource_usage(value):
+    return "" if value is None else str(value)
+
+def print_omnisci_output(stdout, prefix="OMNISCI>>"):
+    for line in iter(stdout.readline, b''):
+        print(prefix, line.decode().strip())
+
+def report_server_time_row(datafiles, name, time_ms, report):
+    with report_lock:
         print(datafiles, ",",
-              fs, ",",
-              result['name'], ",",
-              result['results']['query_exec_min'], ",",
-              result['results']['query_total_min'], ",",
-              result['results']['query_exec_max'], ",",
-              result['results']['query_total_max'], ",",
-              result['results']['query_exec_avg'], ",",
-              result['results']['query_total_avg'], ",",
-              result['results']['query_error_info'], '\n',
+              0, ",",
+              name, ",",
+              time_ms, ",",
+              time_ms, ",",
+              time_ms, ",",
+              time_ms, ",",
+              time_ms, ",",
+              time_ms, ",",
+              "", ",",
+              ",".join("" for _ in LatencyHistogram.metrics_fields), ",",
+              ",".join("" for _ in ResourceSampler.metrics_fields), '\n',
               file=report, sep='', end='', flush=True)
         if db_reporter is not None:
             db_reporter.submit({
                 'FilesNumber': datafiles,
-                'FragmentSize': fs,
-                'BenchName': result['name'],
-                'BestExecTimeMS': str(result['results']['query_exec_min']),
-                'BestTotalTimeMS': result['results']['query_total_min'],
-                'WorstExecTimeMS': str(result['results']['query_exec_max']),
-                'WorstTotalTimeMS': result['results']['query_total_max'],
-                'AverageExecTimeMS': str(result['results']['query_exec_avg']),
-                'AverageTotalTimeMS': result['results']['query_total_avg']
+                'FragmentSize': 0,
+                'BenchName': name,
+                'BestExecTimeMS': time_ms,
+                'BestTotalTimeMS': time_ms,
+                'WorstExecTimeMS': time_ms,
+                'WorstTotalTimeMS': time_ms,
+                'AverageExecTimeMS': time_ms,
+                'AverageTotalTimeMS': time_ms
             })
 
-def print_omnisci_output(stdout):
-    for line in iter(stdout.readline, b''):
-        print("OMNISCI>>", line.decode().strip())
+def split_cpus(instances_number):
+    "Split CPUs available to the script into disjoint sets, whole NUMA nodes are used when possible"
+
+    if instances_number == 1:
+        return [None]
+    available_cpus = os.sched_getaffinity(0)
+    numa_nodes = []
+    for node_cpulist in sorted(glob.glob('/sys/devices/system/node/node*/cpulist')):
+        with open(node_cpulist, 'r') as f:
+            cpus = set()
+            for cpus_range in f.read().strip().split(','):
+                if cpus_range:
+                    first, _, last = cpus_range.partition('-')
+                    cpus.update(range(int(first), int(last or first) + 1))
+        if cpus & available_cpus:
+            numa_nodes.append(cpus & available_cpus)
+    if len(numa_nodes) >= instances_number:
+        return [set().union(*numa_nodes[i::instances_number]) for i in range(instances_number)]
+    available_cpus = sorted(available_cpus)
+    cpus_per_instance = len(available_cpus) // instances_number
+    if cpus_per_instance == 0:
+        print("Not enough CPUs to run", instances_number, "server instances")
+        sys.exit(3)
+    return [set(available_cpus[i * cpus_per_instance:(i + 1) * cpus_per_instance]) for i in range(instances_number)]
+
+class ServerInstance:
+    "omnisci_server instance with its own ports, data directory and CPU set that runs benchmarks for its fragment sizes"
+
+    def __init__(self, index, instances_number, fragment_sizes, cpus):
+        self.index = index
+        self.fragment_sizes = fragment_sizes
+        self.cpus = cpus
+        self.error = None
+        # The first instance uses default data directory. HTTP and Calcite ports follow
+        # Thrift port like default ports 62274, 62278 and 62279 do
+        self.port = args.omnisci_port + 10 * index
+        self.http_port = self.port + 4
+        self.calcite_port = self.port + 5
+        self.data_dir_name = 'data' if index == 0 else 'data_%d' % index
+        self.data_dir = os.path.join(server_cwd, self.data_dir_name)
+        self.name_suffix = '' if instances_number == 1 else '_%d' % index
 
-# Load database reporting functions
+        self.server_cmdline = [args.omnisci_executable,
+                               self.data_dir_name,
+                               '--port', str(self.port),
+                               '--http-port', str(self.http_port),
+                               '--calcite-port', str(self.calcite_port),
+                               '--config', 'omnisci.conf']
+
+        if args.mode == 'synthetic':
+            results_dir_name = 'synthetic_results' + self.name_suffix
+            self.results_file_name = os.path.join(args.benchmarks_path, results_dir_name, args.label, 'CPU', 'Benchmarks', args.synthetic_query + '.json')
+            self.import_cmdline = None
+            self.benchmark_cmdline = ['python3',
+                                      os.path.join(args.benchmarks_path, 'run_synthetic_benchmark.py'),
+                                      '--user', args.user,
+                                      '--password', args.passwd,
+                                      '--server', 'localhost',
+                                      '--port', str(self.port),
+                                      '--dest_port', str(self.port),
+                                      '--name', args.name,
+                                      '--table_name', args.import_table_name,
+                                      '--label', args.label,
+                                      '--iterations', str(args.iterations),
+                                      '--print_results',
+                                      '--query', args.synthetic_query,
+                                      '--num_fragments', str(args.num_synthetic_fragments),
+                                      '--data_dir', self.data_dir,
+                                      '--gpu_label', 'CPU',
+                                      '--result_dir', results_dir_name]
+        else:
+            results_json_name = 'benchmark' + self.name_suffix + '.json'
+            self.results_file_name = os.path.join(args.benchmarks_path, results_json_name)
+            self.import_cmdline = ['python3',
+                                   os.path.join(args.benchmarks_path, 'run_benchmark_import.py'),
+                                   '-u', args.user,
+                                   '-p', args.passwd,
+                                   '-s', 'localhost',
+                                   '-o', str(self.port),
+                                   '-n', args.name,
+                                   '-t', args.import_table_name,
+                                   '-l', args.label,
+                                   '-f', args.import_file,
+                                   '-c', args.table_schema_file,
+                                   '-e', 'output',
+                                   '-v',
+                                   '--no-drop-table-after']
+            self.benchmark_cmdline = ['python3',
+                                      os.path.join(args.benchmarks_path, 'run_benchmark.py'),
+                                      '-u', args.user,
+                                      '-p', args.passwd,
+                                      '-s', 'localhost',
+                                      '-o', str(self.port),
+                                      '-n', args.name,
+                                      '-t', args.import_table_name,
+                                      '-l', args.label,
+                                      '-d', args.queries_dir,
+                                      '-i', str(args.iterations),
+                                      '-e', 'file_json',
+                                      '-j', results_json_name,
+                                      '-v']
+
+    def init_data_dir(self):
+        if not os.path.isdir(self.data_dir):
+            print("CREATING DATA DIR", self.data_dir)
+            os.makedirs(self.data_dir)
+        if not os.path.isdir(os.path.join(self.data_dir, "mapd_data")):
+            print("INITIALIZING DATA DIR", self.data_dir)
+            initdb_executable = os.path.join(pathlib.Path(args.omnisci_executable).parent, "initdb")
+            execute_process([initdb_executable, '-f', '--data', self.data_dir])
+
+    def run(self, report):
+        "Start server, run benchmarks for all fragment sizes of the instance and stop server"
+
+        try:
+            self.init_data_dir()
+            if self.cpus is not None:
+                print("SERVER INSTANCE", self.index, "IS PINNED TO CPUS", sorted(self.cpus))
+            server_process = subprocess.Popen(pinned_cmdline(self.server_cmdline, self.cpus), cwd=server_cwd,
+                                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except Exception as err:
+            print("Failed to start", self.server_cmdline, err)
+            self.error = err
+            return
+
+        server_lifecycle = ServerLifecycle(server_process, [self.port, self.calcite_port],
+                                           startup_timeout=args.startup_timeout, shutdown_timeout=args.shutdown_timeout)
+        sampler = None
+        try:
+            pt = threading.Thread(target=print_omnisci_output, args=(server_process.stdout, "OMNISCI%s>>" % self.name_suffix), daemon=True)
+            pt.start()
+
+            # Server has to open TCP ports and start listening, otherwise the
+            # following benchmarks fail.
+            server_lifecycle.wait_for_startup()
+            sampler = ResourceSampler(server_process.pid, args.sampling_interval).start()
+            report_server_time_row(datafiles, SERVER_STARTUP + self.name_suffix, int(round(server_lifecycle.startup_time * 1000)), report)
+            for fs in self.fragment_sizes:
+                if fs is not None:
+                    print("RUNNING WITH FRAGMENT SIZE", fs, "ON SERVER INSTANCE", self.index)
+                else:
+                    print("RUNNING WITH DEFAULT FRAGMENT SIZE")
+                execute_benchmark(datafiles, self.import_cmdline, args.benchmarks_path,
+                                  self.benchmark_cmdline, fs, self.results_file_name, report, sampler, self.cpus)
+        except Exception as err:
+            traceback.print_exc()
+            self.error = err
+        finally:
+            if sampler is not None:
+                sampler.stop()
+            print("TERMINATING SERVER", self.index)
+            server_lifecycle.shutdown()
+            if server_lifecycle.startup_time is not None:
+                report_server_time_row(datafiles, SERVER_SHUTDOWN + self.name_suffix, int(round(server_lifecycle.shutdown_time * 1000)), report)
+
+# Load database reporting and server lifecycle functions
 pathToReportDir = os.path.join(pathlib.Path(__file__).parent, "report")
+pathToServerDir = os.path.join(pathlib.Path(__file__).parent, "server")
 sys.path.insert(1, pathToReportDir)
+sys.path.insert(1, pathToServerDir)
 import report
+from report import SERVER_STARTUP, SERVER_SHUTDOWN
+from lifecycle import ServerLifecycle
+from resource_sampler import ResourceSampler
+from histogram import LatencyHistogram
 
 parser = argparse.ArgumentParser(description='Run arbitrary omnisci benchmark and submit report values to MySQL database')
 optional = parser._action_groups.pop()
@@ -96,7 +317,15 @@ required.add_argument("-e", "--executable", dest="omnisci_executable", required=
 optional.add_argument("-w", "--workdir", dest="omnisci_cwd",
                       help="Path to omnisci working directory. By default parent directory of executable location is used. Data directory is used in this location.")
 optional.add_argument("-o", "--port", dest="omnisci_port", default=62274, type=int,
-                      help="TCP port number to run omnisci_server on.")
+                      help="TCP port number to run omnisci_server on. HTTP and Calcite ports of server are this port plus 4 and 5.")
+optional.add_argument("--sweep-instances", dest="sweep_instances", default=1, type=int,
+                      help="Number of omnisci_server instances to run fragment sizes sweep concurrently. Every instance uses its own ports, data directory and CPU set.")
+optional.add_argument("--startup-timeout", dest="startup_timeout", default=120, type=int,
+                      help="Number of seconds to wait for omnisci_server to open its ports.")
+optional.add_argument("--sampling-interval", dest="sampling_interval", default=0.1, type=float,
+                      help="Interval in seconds between samples of omnisci_server resource usage.")
+optional.add_argument("--shutdown-timeout", dest="shutdown_timeout", default=30, type=int,
+                      help="Number of seconds to wait for omnisci_server to exit after SIGINT before killing it.")
 required.add_argument("-u", "--user", dest="user", default="admin", required=True,
                       help="User name to use on omniscidb server.")
 required.add_argument("-p", "--passwd", dest="passwd", default="HyperInteractive", required=True,
@@ -148,78 +377,15 @@ if args.omnisci_cwd is not None:
 else:
     server_cwd = pathlib.Path(args.omnisci_executable).parent.parent
 
-data_dir = os.path.join(server_cwd, "data")
-if not os.path.isdir(data_dir):
-    print("CREATING DATA DIR", data_dir)
-    os.makedirs(data_dir)
-if not os.path.isdir(os.path.join(data_dir, "mapd_data")):
-    print("INITIALIZING DATA DIR", data_dir)
-    initdb_executable = os.path.join(pathlib.Path(args.omnisci_executable).parent, "initdb")
-    execute_process([initdb_executable, '-f', '--data', data_dir])
-
-server_cmdline = [args.omnisci_executable,
-                  'data',
-                  '--port', str(args.omnisci_port),
-                  '--http-port', "62278",
-                  '--calcite-port', "62279",
-                  '--config', 'omnisci.conf']
-
-dataset_import_cmdline = ['python3',
-                          os.path.join(args.benchmarks_path, 'run_benchmark_import.py'),
-                          '-u', args.user,
-                          '-p', args.passwd,
-                          '-s', 'localhost',
-                          '-o', str(args.omnisci_port),
-                          '-n', args.name,
-                          '-t', args.import_table_name,
-                          '-l', args.label,
-                          '-f', args.import_file,
-                          '-c', args.table_schema_file,
-                          '-e', 'output',
-                          '-v',
-                          '--no-drop-table-after']
-
-dataset_benchmark_cmdline = ['python3',
-                             os.path.join(args.benchmarks_path, 'run_benchmark.py'),
-                             '-u', args.user,
-                             '-p', args.passwd,
-                             '-s', 'localhost',
-                             '-o', str(args.omnisci_port),
-                             '-n', args.name,
-                             '-t', args.import_table_name,
-                             '-l', args.label,
-                             '-d', args.queries_dir,
-                             '-i', str(args.iterations),
-                             '-e', 'file_json',
-                             '-j', 'benchmark.json',
-                             '-v']
-
-synthetic_benchmark_cmdline = ['python3',
-                               os.path.join(args.benchmarks_path, 'run_synthetic_benchmark.py'),
-                               '--user', args.user,
-                               '--password', args.passwd,
-                               '--server', 'localhost',
-                               '--port', str(args.omnisci_port),
-                               '--dest_port', str(args.omnisci_port),
-                               '--name', args.name,
-                               '--table_name', args.import_table_name,
-                               '--label', args.label,
-                               '--iterations', str(args.iterations),
-                               '--print_results',
-                               '--query', args.synthetic_query,
-                               '--num_fragments', str(args.num_synthetic_fragments),
-                               '--data_dir', os.path.join(server_cwd, 'data'),
-                               '--gpu_label', 'CPU',
-                               '--result_dir', 'synthetic_results']
+if args.sweep_instances < 1:
+    print("Bad number of sweep instances specified", args.sweep_instances)
+    sys.exit(3)
 
 if args.mode == 'synthetic':
     if args.synthetic_query is None or args.num_synthetic_fragments is None or args.fragment_size is None:
         print("For synthetic type of benchmark the following parameters are mandatory: --synthetic-query, --num-fragments and --fragment-size.")
         sys.exit(3)
     datafiles = 0
-    results_file_name = os.path.join(args.benchmarks_path, 'synthetic_results', args.label, 'CPU', 'Benchmarks', args.synthetic_query + '.json')
-    import_cmdline = None
-    benchmark_cmdline = synthetic_benchmark_cmdline
 else:
     if args.import_file is None or args.table_schema_file is None or args.queries_dir is None:
         print("For dataset type of benchmark the following parameters are mandatory: --import-file, --table-schema-file and --queries-dir and --fragment-size is optional.")
@@ -228,9 +394,6 @@ else:
     datafiles_names = sorted([x for f in datafiles_names for x in glob.glob(f)])
     datafiles = len(datafiles_names)
     print("NUMBER OF DATAFILES FOUND:", datafiles)
-    results_file_name = os.path.join(args.benchmarks_path, "benchmark.json")
-    import_cmdline = dataset_import_cmdline
-    benchmark_cmdline = dataset_benchmark_cmdline
 
 db_reporter = None
 if args.db_user is not "":
@@ -239,7 +402,7 @@ if args.db_user is not "":
         sys.exit(4)
     print("CONNECTING TO DATABASE")
     db = mysql.connector.connect(host=args.db_server, port=args.db_port, user=args.db_user, passwd=args.db_pass, db=args.db_name);
-    db_reporter = report.DbReport(db, args.db_table, {
+    db_reporter = report.DbReport(db, args.db_table, dict({
         'FilesNumber': 'INT UNSIGNED NOT NULL',
         'FragmentSize': 'BIGINT UNSIGNED NOT NULL',
         'BenchName': 'VARCHAR(500) NOT NULL',
@@ -248,41 +411,33 @@ if args.db_user is not "":
         'WorstExecTimeMS': 'BIGINT UNSIGNED',
         'WorstTotalTimeMS': 'BIGINT UNSIGNED',
         'AverageExecTimeMS': 'BIGINT UNSIGNED',
-        'AverageTotalTimeMS': 'BIGINT UNSIGNED'
-    }, {
+        'AverageTotalTimeMS': 'BIGINT UNSIGNED',
+        **LatencyHistogram.metrics_fields
+    }, **ResourceSampler.metrics_fields), {
         'ScriptName': 'run_omnisci_benchmark.py',
         'CommitHash': args.commit
     })
 
-try:
-    server_process = subprocess.Popen(server_cmdline, cwd=server_cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-except OSError as err:
-    print("Failed to start", omnisciCmdLine, err)
-    sys.exit(1)
-
-try:
-    pt = threading.Thread(target=print_omnisci_output, args=(server_process.stdout,), daemon=True)
-    pt.start()
-
-    # Allow server to start up. It has to open TCP port and start
-    # listening, otherwise the following benchmarks fail.
-    time.sleep(5)
-
-    with open(args.report, "w") as report:
-        print("datafiles,fragment_size,query,query_exec_min,query_total_min,query_exec_max,query_total_max,query_exec_avg,query_total_avg,query_error_info", file=report, flush=True)
-        if args.fragment_size is not None:
-            for fs in args.fragment_size:
-                print("RUNNING WITH FRAGMENT SIZE", fs)
-                execute_benchmark(datafiles, import_cmdline, args.benchmarks_path,
-                                  benchmark_cmdline, fs, results_file_name, report)
-        else:
-            print("RUNNING WITH DEFAULT FRAGMENT SIZE")
-            execute_benchmark(datafiles, import_cmdline, args.benchmarks_path,
-                              benchmark_cmdline, None, results_file_name, report)
-finally:
-    print("TERMINATING SERVER")
-    server_process.send_signal(signal.SIGINT)
-    time.sleep(2)
-    server_process.kill()
-    time.sleep(1)
-    server_process.terminate()
+fragment_sizes = args.fragment_size if args.fragment_size is not None else [None]
+instances_number = min(args.sweep_instances, len(fragment_sizes))
+instances = [ServerInstance(i, instances_number, fragment_sizes[i::instances_number], cpus)
+             for i, cpus in enumerate(split_cpus(instances_number))]
+report_lock = threading.Lock()
+
+with open(args.report, "w") as report:
+    print("datafiles,fragment_size,query,query_exec_min,query_total_min,query_exec_max,query_total_max,query_exec_avg,query_total_avg,query_error_info,",
+          "query_exec_p95,query_exec_p99,query_exec_p999,query_exec_histogram,",
+          ",".join(ResourceSampler.metrics_fields), file=report, sep='', flush=True)
+    if instances_number == 1:
+        instances[0].run(report)
+    else:
+        threads = [threading.Thread(target=instance.run, args=(report,)) for instance in instances]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+failed_instances = [instance.index for instance in instances if instance.error is not None]
+if failed_instances:
+    print("Benchmark failed on server instances", failed_instances)
+    sys.exit(5)
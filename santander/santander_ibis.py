@@ -2,7 +2,6 @@ import mysql.connector
 import pandas as pd
 import numpy as np
 import subprocess
-import threading
 import argparse
 import pathlib
 import time
@@ -25,16 +24,24 @@ sys.path.insert(1, path_to_ibis_dir)
 import report
 import server
 import ibis
+from resource_sampler import ResourceSampler
+from measurement import Measurement, add_measurement_arguments
 
 parser = argparse.ArgumentParser(description='Run Santander benchmark using Ibis.')
 
 parser.add_argument('-e', default=omnisci_executable, help='Path to executable "omnisql".')
 parser.add_argument('-r', default="report_santander_ibis.csv", help="Report file name.")
 parser.add_argument('-dp', default=datafile_directory, help="Datafile that should be loaded.")
-parser.add_argument('-i', default=5, type=int, help="Number of iterations to run every query. Best result is selected.")
+parser.add_argument('-i', default=5, type=int, help="Minimum number of iterations to run every query. Iterations continue until confidence interval of median time is narrow enough.")
 parser.add_argument('-dnd', action='store_true', help="Do not delete old table.")
 parser.add_argument('-dni', action='store_true', help="Do not create new table and import any data from CSV files.")
+parser.add_argument('-pd-cache-dir', help="Directory to cache parsed datafiles in between runs.")
+parser.add_argument('-pd-cache-size', default=20, type=int, help="Maximum size of parsed datafiles cache in GB. Least recently used entries are evicted.")
+parser.add_argument('-arrow-dir', help="Directory of Arrow dataset. Datafile is converted to it on first read and memory-mapped from it later instead of parsing CSV.")
+parser.add_argument('-chunksize', type=int, help="Read and load datafile by chunks of this number of rows, parsing next chunk while current one is loaded.")
+parser.add_argument("-sampling-interval", default=0.1, type=float, help="Interval in seconds between samples of omnisci_server resource usage.")
 parser.add_argument("-port", default=62074, type=int, help="TCP port that omnisql client should use to connect to server.")
+add_measurement_arguments(parser)
 
 parser.add_argument("-db-server", default="localhost", help="Host name of MySQL server.")
 parser.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server.")
@@ -49,11 +56,8 @@ args = parser.parse_args()
 
 if args.i < 1:
     print("Bad number of iterations specified", args.i)
-    
-def print_omnisci_output(stdout):
-    for line in iter(stdout.readline, b''):
-        print("OMNISCI>>", line.decode().strip())
-    
+    sys.exit(1)
+
 datafile_columns_names = ["ID_code", "target"] + ["var_" + str(index) for index in range(200)]
 datafile_columns_types = ["string", "int16"] + ["float32" for _ in range(200)]
 
@@ -62,10 +66,12 @@ schema_train = ibis.Schema(
     types = datafile_columns_types
 )
 
-omnisci_server = server.Omnisci_server(omnisci_executable=args.e, omnisci_port=args.port, database_name=database_name)
-omnisci_server.launch()
+omnisci_server = server.Omnisci_server(omnisci_executable=args.e, omnisci_port=args.port, database_name=database_name,
+                                       pd_cache_dir=args.pd_cache_dir, pd_cache_size=args.pd_cache_size * 2**30,
+                                       arrow_dir=args.arrow_dir)
+server_startup_time = omnisci_server.launch()
+sampler = ResourceSampler(omnisci_server.server_process.pid, args.sampling_interval).start()
 
-time.sleep(2)
 conn = omnisci_server.connect_to_server()
 
 db_reporter = None
@@ -78,7 +84,9 @@ if args.db_user is not "":
         'WorstExecTimeMS': 'BIGINT UNSIGNED',
         'BestExecTimeMS': 'BIGINT UNSIGNED',
         'AverageExecTimeMS': 'BIGINT UNSIGNED',
-        'TotalTimeMS': 'BIGINT UNSIGNED'
+        'TotalTimeMS': 'BIGINT UNSIGNED',
+        **Measurement.metrics_fields,
+        **ResourceSampler.metrics_fields
     }, {
         'ScriptName': 'santander_ibis.py',
         'CommitHash': args.commit
@@ -107,7 +115,7 @@ cast_dict_train['target'] = 'int16'
 
 if not args.dni:
     # Datafiles import
-    t_import_pandas, t_import_ibis = omnisci_server.import_data_by_ibis(table_name = train_table_name, data_files_names=args.dp, files_limit=1, columns_names=datafile_columns_names, columns_types=datafile_columns_types, cast_dict=cast_dict_train, header=0)
+    t_import_pandas, t_import_ibis = omnisci_server.import_data_by_ibis(table_name = train_table_name, data_files_names=args.dp, files_limit=1, columns_names=datafile_columns_names, columns_types=datafile_columns_types, cast_dict=cast_dict_train, header=0, chunksize=args.chunksize, dataset_name='santander_train')
     print("Pandas import time:", t_import_pandas)
     print("Ibis import time:", t_import_ibis)
 
@@ -192,7 +200,7 @@ tmp_table_name = 'tmp_table'
 def q1():
     t_import = 0
     t0 = time.time()
-    _, _ = omnisci_server.import_data_by_ibis(table_name = tmp_table_name, data_files_names=args.dp, files_limit=1, columns_names=datafile_columns_names, columns_types=datafile_columns_types, cast_dict=cast_dict_train, header=0)
+    _, _ = omnisci_server.import_data_by_ibis(table_name = tmp_table_name, data_files_names=args.dp, files_limit=1, columns_names=datafile_columns_names, columns_types=datafile_columns_types, cast_dict=cast_dict_train, header=0, chunksize=args.chunksize, dataset_name='santander_train')
     t_import = time.time() - t0
     omnisci_server.drop_table(tmp_table_name)
     
@@ -246,6 +254,9 @@ def q4():
     
     return t_split
 
+def rounded(value):
+    return None if value is None else int(round(value))
+
 queries_list = [q1, q2, q3, q4]
 queries_description = {}
 queries_description[1] = 'Santander data file import query'
@@ -254,39 +265,29 @@ queries_description[3] = 'Rows filtration query'
 queries_description[4] = 'Rows split query'
 
 try:
-    pt = threading.Thread(target=print_omnisci_output, args=(omnisci_server.server_process.stdout,), daemon=True)
-    pt.start()
-    
-    with open(args.r, "w") as report:
+    with open(args.r, "w") as report_file:
+        report.report_server_time(report_file, db_reporter, report.SERVER_STARTUP, int(round(server_startup_time * 1000)))
         t_begin = time.time()
+        measurement = Measurement.from_args(args, args.i)
         for query_number in range(0,4):
-            exec_times = [None]*5
-            best_exec_time = float("inf")
-            worst_exec_time = 0.0
-            first_exec_time = float("inf")
-            times_sum = 0.0
-            for iteration in range(1, args.i + 1):
-                print("Running query number:", query_number + 1, "Iteration number:", iteration)
-                time_tmp = int(round(queries_list[query_number]() * 1000))
-                exec_times[iteration - 1] = time_tmp
-                if iteration == 1:
-                    first_exec_time = exec_times[iteration - 1]
-                if best_exec_time > exec_times[iteration - 1]:
-                    best_exec_time = exec_times[iteration - 1]
-                if iteration != 1 and worst_exec_time < exec_times[iteration - 1]:
-                    worst_exec_time = exec_times[iteration - 1]
-                if iteration != 1:
-                    times_sum += exec_times[iteration - 1]
-            average_exec_time = times_sum/(args.i - 1)
-            total_exec_time = int(round(time.time() - t_begin))
-            print("Query", query_number + 1, "Exec time (ms):", best_exec_time, "Total time (s):", total_exec_time)
+            result = measurement.run(sampler.iterations(lambda iteration: int(round(queries_list[query_number]() * 1000))), "query number %d" % (query_number + 1))
+            resource_usage = sampler.iterations_usage(result.accepted)
+            first_exec_time = result.first
+            worst_exec_time = result.worst
+            best_exec_time = result.best
+            average_exec_time = rounded(result.average)
+            statistics = result.report_values()
+            total_exec_time_ms = int(round((time.time() - t_begin) * 1000))
+            print("Query", query_number + 1, "Exec time (ms):", best_exec_time, "Total time (ms):", total_exec_time_ms)
             print("QueryName: ",  queries_description[query_number + 1], ",",
                   "FirstExecTimeMS: ", first_exec_time, ",",
                   "WorstExecTimeMS: ", worst_exec_time, ",",
                   "BestExecTimeMS: ", best_exec_time, ",",
                   "AverageExecTimeMS: ", average_exec_time, ",",
-                  "TotalTimeS: ", total_exec_time, ",",
-                  "", '\n', file=report, sep='', end='', flush=True)
+                  "TotalTimeMS: ", total_exec_time_ms, ",",
+                  "".join(field + ": " + str(value) + "," for field, value in statistics.items()),
+                  "".join(field + ": " + str(value) + "," for field, value in resource_usage.items()),
+                  "", '\n', file=report_file, sep='', end='', flush=True)
             if db_reporter is not None:
                 db_reporter.submit({
                     'QueryName': queries_description[query_number + 1],
@@ -294,9 +295,15 @@ try:
                     'WorstExecTimeMS': worst_exec_time,
                     'BestExecTimeMS': best_exec_time,
                     'AverageExecTimeMS': average_exec_time,
-                    'TotalTimeS': total_exec_time
+                    'TotalTimeMS': total_exec_time_ms,
+                    **statistics,
+                    **resource_usage
                 })
 except IOError as err:
     print("Failed writing report file", args.r, err)
 finally:
-    omnisci_server.terminate()
+    # Sampler reads /proc of server process, so it is stopped before the process exits
+    sampler.stop()
+    server_shutdown_time = omnisci_server.terminate()
+    with open(args.r, "a") as report_file:
+        report.report_server_time(report_file, db_reporter, report.SERVER_SHUTDOWN, int(round(server_shutdown_time * 1000)))
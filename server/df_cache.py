@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+class DfCache:
+    "Persistent cache of parsed Pandas DataFrames in Feather (Arrow IPC) format with LRU eviction by total size"
+
+    def __init__(self, cache_dir, max_bytes):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self.enabled = True
+        try:
+            import pyarrow
+        except ImportError:
+            print("pyarrow is not installed, DataFrame cache in", cache_dir, "is disabled")
+            self.enabled = False
+            return
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_path(self, file_name, read_args):
+        stat = os.stat(file_name)
+        key = json.dumps([os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns, read_args],
+                         sort_keys=True, default=str)
+        return os.path.join(self._cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".feather")
+
+    def get(self, file_name, read_args):
+        "Return DataFrame cached for file_name read with read_args or None"
+
+        if not self.enabled:
+            return None
+        entry_path = self._entry_path(file_name, read_args)
+        try:
+            df = pd.read_feather(entry_path)
+        except (OSError, ValueError):
+            return None
+        # Modification time of entry is used as its last access time
+        os.utime(entry_path)
+        print("Datafile", file_name, "is read from cache", entry_path)
+        return df
+
+    def get_chunks(self, file_name, read_args, chunksize):
+        """Return iterator over DataFrames of chunksize rows cached for file_name read with read_args or None.
+        Entry is read record batch by record batch, so whole DataFrame is never held in memory"""
+
+        if not self.enabled:
+            return None
+        import pyarrow as pa
+        # Feather files are Arrow IPC files, so they are split to chunks the same way as Arrow dataset files
+        from arrow_dataset import record_batch_chunks
+        entry_path = self._entry_path(file_name, read_args)
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(entry_path, 'r'))
+        except (OSError, pa.ArrowInvalid):
+            return None
+        os.utime(entry_path)
+        print("Datafile", file_name, "is read by chunks from cache", entry_path)
+        return record_batch_chunks(reader, chunksize)
+
+    def put(self, file_name, read_args, df):
+        "Store DataFrame for file_name read with read_args and evict least recently used entries"
+
+        if not self.enabled:
+            return
+        entry_path = self._entry_path(file_name, read_args)
+        tmp_path = entry_path + ".tmp"
+        try:
+            df.to_feather(tmp_path)
+            os.replace(tmp_path, entry_path)
+        except (OSError, ValueError) as err:
+            print("Failed to store datafile", file_name, "in cache:", err)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        entries = [os.path.join(self._cache_dir, name) for name in os.listdir(self._cache_dir) if name.endswith(".feather")]
+        entries = sorted(((os.stat(path), path) for path in entries), key=lambda entry: entry[0].st_mtime_ns)
+        total_bytes = sum(stat.st_size for stat, _ in entries)
+        # Most recently used entry is kept even if it alone exceeds the limit
+        for stat, path in entries[:-1]:
+            if total_bytes <= self._max_bytes:
+                break
+            print("Evicting", path, "from DataFrame cache")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= stat.st_size
@@ -0,0 +1,66 @@
+import signal
+import socket
+import subprocess
+import time
+
+class ServerLifecycle:
+    "Wait for OmniSciDB server readiness and shut it down, recording startup and shutdown times"
+
+    def __init__(self, server_process, ports, host="localhost", startup_timeout=120,
+                 shutdown_timeout=30, initial_backoff=0.05, max_backoff=1.0):
+        self.server_process = server_process
+        self._ports = ports
+        self._host = host
+        self._startup_timeout = startup_timeout
+        self._shutdown_timeout = shutdown_timeout
+        self._initial_backoff = initial_backoff
+        self._max_backoff = max_backoff
+        self._t_launch = time.time()
+        self.startup_time = None
+        self.shutdown_time = None
+
+    def _port_is_open(self, port):
+        try:
+            with socket.create_connection((self._host, port), timeout=self._max_backoff):
+                return True
+        except OSError:
+            return False
+
+    def wait_for_startup(self):
+        "Poll server ports with exponential backoff until all of them accept connections"
+
+        backoff = self._initial_backoff
+        pending_ports = list(self._ports)
+        while pending_ports:
+            if self.server_process.poll() is not None:
+                raise RuntimeError("Server exited with code {} during startup, ports {} were not opened".format(
+                    self.server_process.returncode, pending_ports))
+            pending_ports = [port for port in pending_ports if not self._port_is_open(port)]
+            if not pending_ports:
+                break
+            if time.time() - self._t_launch > self._startup_timeout:
+                raise TimeoutError("Server did not open ports {} in {} seconds, it is still running".format(
+                    pending_ports, self._startup_timeout))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self._max_backoff)
+        self.startup_time = time.time() - self._t_launch
+        print("Server is ready in", round(self.startup_time, 3), "seconds")
+        return self.startup_time
+
+    def shutdown(self, shutdown_timeout=None):
+        "Send SIGINT and wait for server exit, kill it if it doesn't exit in shutdown timeout"
+
+        if shutdown_timeout is None:
+            shutdown_timeout = self._shutdown_timeout
+        t0 = time.time()
+        if self.server_process.poll() is None:
+            self.server_process.send_signal(signal.SIGINT)
+            try:
+                self.server_process.wait(timeout=shutdown_timeout)
+            except subprocess.TimeoutExpired:
+                print("Server didn't exit in", shutdown_timeout, "seconds, killing it")
+                self.server_process.kill()
+                self.server_process.wait()
+        self.shutdown_time = time.time() - t0
+        print("Server is stopped in", round(self.shutdown_time, 3), "seconds with code", self.server_process.returncode)
+        return self.shutdown_time
@@ -0,0 +1,173 @@
+import collections
+import queue
+import re
+import subprocess
+import threading
+import time
+import uuid
+
+OmnisqlResult = collections.namedtuple("OmnisqlResult", ["output", "exec_time", "total_time", "error"])
+
+class OmnisqlSession:
+    "Long-lived omnisql process that executes statements sent over stdin"
+
+    _timing_regexp = re.compile(r"Execution time: (\d+) ms, Total time: (\d+) ms")
+    _rows_returned_regexp = re.compile(r"\d+ rows returned")
+    _exception_regexp = re.compile("Exception: .*")
+    # Interval of checks that omnisql process is still running while waiting for its output
+    _poll_interval = 1.0
+
+    def __init__(self, omnisql_cmdline, timing=True, timeout=None):
+        self._omnisql_cmdline = omnisql_cmdline
+        self._timing = timing
+        self._timeout = timeout
+        self._process = None
+        self._lines = None
+        self._sentinel = "omnisql_sentinel_" + uuid.uuid4().hex
+        # Sentinel column has its own name, so its header line can be told from output of statement
+        self._sentinel_header = self._sentinel + "_header"
+
+    def _read_output(self):
+        for line in iter(self._process.stdout.readline, b''):
+            self._lines.put(line.decode(errors="replace").rstrip("\n"))
+        self._lines.put(None)
+
+    def _read_line(self):
+        t1 = time.time()
+        while True:
+            try:
+                line = self._lines.get(timeout=self._poll_interval)
+                break
+            except queue.Empty:
+                # Output pipe may stay open after crash if it is inherited by other processes
+                if self._process.poll() is not None:
+                    raise RuntimeError("omnisql exited with code {}".format(self._process.returncode))
+                if self._timeout is not None and time.time() - t1 > self._timeout:
+                    raise TimeoutError("omnisql didn't respond in {} seconds".format(self._timeout))
+        if line is None:
+            raise RuntimeError("omnisql exited with code {}".format(self._process.wait()))
+        return line
+
+    def start(self):
+        "Start omnisql process and switch timing on"
+
+        self._process = subprocess.Popen(self._omnisql_cmdline, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_output, daemon=True).start()
+        if self._timing:
+            self._send("\\timing\n")
+        # Login messages are dropped together with the first sentinel
+        self.execute("")
+        return self
+
+    def _send(self, text):
+        self._process.stdin.write(text.encode())
+        self._process.stdin.flush()
+
+    def execute(self, statement):
+        "Execute statement and return its output and parsed \\timing values"
+
+        # Timing is switched on once per session, \timing inside statement would toggle it
+        statement = "\n".join(line for line in statement.splitlines() if line.strip() != "\\timing").strip()
+        self._send(statement + "\nSELECT '" + self._sentinel + "' AS " + self._sentinel_header + ";\n")
+
+        output_lines = []
+        line = self._read_line()
+        while line.strip() != self._sentinel:
+            # Header of sentinel SELECT is printed unless omnisql runs with -q
+            if line.strip() != self._sentinel_header:
+                output_lines.append(line)
+            line = self._read_line()
+        # Skip rows counter and timing that sentinel SELECT prints after its value
+        trailer_regexp = self._timing_regexp if self._timing else self._rows_returned_regexp
+        while not trailer_regexp.search(self._read_line()):
+            pass
+
+        output = "\n".join(output_lines).strip()
+        exec_time = None
+        total_time = None
+        error = None
+        exceptions = self._exception_regexp.findall(output)
+        if exceptions:
+            error = exceptions[-1]
+        timings = self._timing_regexp.findall(output)
+        if timings:
+            exec_time = int(timings[-1][0])
+            total_time = int(timings[-1][1])
+        return OmnisqlResult(output, exec_time, total_time, error)
+
+    def close(self):
+        "Quit omnisql and wait for process exit"
+
+        if self._process is None:
+            return
+        try:
+            self._send("\\q\n")
+            self._process.stdin.close()
+            self._process.wait(timeout=self._timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def kill(self):
+        "Kill omnisql without waiting for it to quit, output it hasn't printed yet is lost"
+
+        if self._process is None:
+            return
+        self._process.kill()
+        self._process.wait()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class OmnisqlSessionPool:
+    "Set of omnisql sessions that can be used concurrently from several threads"
+
+    def __init__(self, omnisql_cmdline, size=1, timing=True, timeout=None):
+        self._sessions = [OmnisqlSession(omnisql_cmdline, timing, timeout) for _ in range(size)]
+        self._idle_sessions = queue.Queue()
+
+    def start(self):
+        for session in self._sessions:
+            session.start()
+            self._idle_sessions.put(session)
+        return self
+
+    def execute(self, statement):
+        "Execute statement in any idle session, block until one is available"
+
+        if not self._sessions:
+            raise RuntimeError("No omnisql sessions left in pool")
+        session = self._idle_sessions.get()
+        try:
+            result = session.execute(statement)
+        except Exception:
+            # Output of failed statement may be still unread, so the next statement in this
+            # session would get it instead of its own. Session is replaced by a new one
+            session.kill()
+            try:
+                session.start()
+            except Exception:
+                session.kill()
+                self._sessions.remove(session)
+                raise
+            self._idle_sessions.put(session)
+            raise
+        self._idle_sessions.put(session)
+        return result
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,113 @@
+import collections
+import queue
+import re
+import time
+
+try:
+    import pymapd
+except ImportError:
+    pymapd = None
+
+# Fields common with OmnisqlResult are filled the same way, so results of both
+# sessions are handled by the same code. Client time is round trip measured by
+# client, transfer time is part of it spent outside of server, i.e. in network
+# and in deserialization of result.
+PymapdResult = collections.namedtuple("PymapdResult", ["output", "exec_time", "total_time", "error",
+                                                       "client_time", "transfer_time", "rows"])
+
+class PymapdSession:
+    "Thrift connection to server that executes statements by pymapd client"
+
+    _timing_regexp = re.compile(r"^\s*\\timing\s*$", flags=re.MULTILINE)
+
+    def __init__(self, user="admin", password="HyperInteractive", host="localhost", port=6274, dbname="omnisci"):
+        if pymapd is None:
+            raise ImportError("pymapd is required to connect to server by pymapd client")
+        self._connect_args = {'user': user, 'password': password, 'host': host, 'port': port, 'dbname': dbname}
+        self._connection = None
+
+    def start(self):
+        "Connect to server"
+
+        self._connection = pymapd.connect(**self._connect_args)
+        return self
+
+    def _statements(self, statement):
+        # Script may contain omnisql \timing command and several statements separated by semicolons
+        statement = self._timing_regexp.sub("", statement)
+        return [s.strip() for s in statement.split(";") if s.strip() != ""]
+
+    def execute(self, statement):
+        "Execute statement and return server timing of its last SQL statement, client round trip time and number of rows"
+
+        result = PymapdResult("", None, None, None, None, None, None)
+        for sql in self._statements(statement):
+            result = self._execute_one(sql)
+            if result.error is not None:
+                break
+        return result
+
+    def _execute_one(self, sql):
+        t1 = time.time()
+        try:
+            # Low level thrift call is used because pymapd cursor doesn't expose server timing
+            query_result = self._connection._client.sql_execute(self._connection._session, sql, True, None, -1, -1)
+        except Exception as err:
+            return PymapdResult(str(err), None, None, "Exception: " + str(err), None, None, None)
+        client_time = int(round((time.time() - t1) * 1000))
+        rows = 0
+        row_set = query_result.row_set
+        if row_set is not None and row_set.columns:
+            rows = len(row_set.columns[0].nulls)
+        total_time = query_result.total_time_ms
+        return PymapdResult("%d rows returned" % rows, query_result.execution_time_ms, total_time, None,
+                            client_time, max(client_time - total_time, 0), rows)
+
+    def close(self):
+        "Disconnect from server"
+
+        if self._connection is None:
+            return
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class PymapdSessionPool:
+    "Set of pymapd connections that can be used concurrently from several threads"
+
+    def __init__(self, size=1, **connect_args):
+        self._sessions = [PymapdSession(**connect_args) for _ in range(size)]
+        self._idle_sessions = queue.Queue()
+
+    def start(self):
+        for session in self._sessions:
+            session.start()
+            self._idle_sessions.put(session)
+        return self
+
+    def execute(self, statement):
+        "Execute statement in any idle connection, block until one is available"
+
+        session = self._idle_sessions.get()
+        try:
+            return session.execute(statement)
+        finally:
+            self._idle_sessions.put(session)
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,136 @@
+import os
+import threading
+
+class ResourceSampler:
+    "Sample resource usage of a process from /proc/<pid> in background thread and account it per marked interval"
+
+    metrics_fields = {
+        'ServerPeakRSSKB': 'BIGINT UNSIGNED',
+        'ServerCPUUserMS': 'BIGINT UNSIGNED',
+        'ServerCPUSysMS': 'BIGINT UNSIGNED',
+        'ServerCtxSwitches': 'BIGINT UNSIGNED',
+        'ServerReadBytes': 'BIGINT UNSIGNED'
+    }
+
+    def __init__(self, pid, interval=0.1):
+        self._pid = pid
+        self._interval = interval
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._peak_rss = 0
+        self._begin_sample = None
+        self._iterations_usage = []
+
+    def _read_sample(self):
+        proc_dir = os.path.join('/proc', str(self._pid))
+        with open(os.path.join(proc_dir, 'stat'), 'r') as stat_file:
+            # Command name in the second field can contain spaces, fields after it are counted from ')'
+            stat = stat_file.read().rsplit(')', 1)[1].split()
+        status = {}
+        with open(os.path.join(proc_dir, 'status'), 'r') as status_file:
+            for line in status_file:
+                name, _, value = line.partition(':')
+                status[name] = value.split()
+        read_bytes = None
+        try:
+            with open(os.path.join(proc_dir, 'io'), 'r') as io_file:
+                for line in io_file:
+                    name, _, value = line.partition(':')
+                    if name == 'read_bytes':
+                        read_bytes = int(value)
+        except OSError:
+            # /proc/<pid>/io is readable only by process owner with ptrace access
+            pass
+        return {
+            'rss_kb': int(status['VmRSS'][0]) if 'VmRSS' in status else 0,
+            'cpu_user': int(stat[11]) / self._clock_ticks,
+            'cpu_sys': int(stat[12]) / self._clock_ticks,
+            'ctx_switches': int(status['voluntary_ctxt_switches'][0]) + int(status['nonvoluntary_ctxt_switches'][0]),
+            'read_bytes': read_bytes
+        }
+
+    def _sample(self):
+        try:
+            sample = self._read_sample()
+        except (OSError, IndexError, ValueError):
+            return None
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, sample['rss_kb'])
+        return sample
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            self._sample()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def begin(self):
+        "Mark beginning of measured interval"
+
+        with self._lock:
+            self._peak_rss = 0
+        self._begin_sample = self._sample()
+
+    def end(self):
+        "Mark end of measured interval and return resource usage accounted for it"
+
+        end_sample = self._sample()
+        begin_sample = self._begin_sample
+        if begin_sample is None or end_sample is None:
+            return {field: None for field in self.metrics_fields}
+        with self._lock:
+            peak_rss = self._peak_rss
+        read_bytes = None
+        if begin_sample['read_bytes'] is not None and end_sample['read_bytes'] is not None:
+            read_bytes = end_sample['read_bytes'] - begin_sample['read_bytes']
+        return {
+            'ServerPeakRSSKB': peak_rss,
+            'ServerCPUUserMS': int(round((end_sample['cpu_user'] - begin_sample['cpu_user']) * 1000)),
+            'ServerCPUSysMS': int(round((end_sample['cpu_sys'] - begin_sample['cpu_sys']) * 1000)),
+            'ServerCtxSwitches': end_sample['ctx_switches'] - begin_sample['ctx_switches'],
+            'ServerReadBytes': read_bytes
+        }
+
+    def iterations(self, iteration_func):
+        "Wrap iteration_func so that resource usage is accounted for every its call separately"
+
+        self._iterations_usage = []
+
+        def measured_iteration(*args):
+            self.begin()
+            try:
+                return iteration_func(*args)
+            finally:
+                self._iterations_usage.append(self.end())
+        return measured_iteration
+
+    def iterations_usage(self, indices=None):
+        """Return resource usage of iterations of function wrapped by iterations with given
+        indices, e.g. accepted iterations of measurement. Peak RSS is the maximum of
+        iterations, other values are averages per iteration"""
+
+        if indices is None:
+            indices = range(len(self._iterations_usage))
+        usages = [self._iterations_usage[i] for i in indices if i < len(self._iterations_usage)]
+        resource_usage = {}
+        for field in self.metrics_fields:
+            values = [usage[field] for usage in usages if usage[field] is not None]
+            if not values:
+                resource_usage[field] = None
+            elif field == 'ServerPeakRSSKB':
+                resource_usage[field] = max(values)
+            else:
+                resource_usage[field] = int(round(sum(values) / len(values)))
+        return resource_usage
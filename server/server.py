@@ -1,16 +1,30 @@
+import concurrent.futures
 import glob
 import os
 import pandas as pd
 import pathlib
-import signal
+import queue
+import re
+import shutil
 import sys
 import subprocess
+import tempfile
 import threading
 import time
 
+from df_cache import DfCache
+from lifecycle import ServerLifecycle
+from omnisql_session import OmnisqlSessionPool
+
 path_to_ibis_dir = os.path.join(pathlib.Path(__file__).parent.parent, "..", "ibis/build/lib")
+path_to_dataset_dir = os.path.join(pathlib.Path(__file__).parent.parent, "dataset")
 sys.path.insert(1, path_to_ibis_dir)
+sys.path.insert(1, path_to_dataset_dir)
 import ibis
+from parallel_reader import read_datafiles
+from decompress_stage import DecompressStage
+from arrow_dataset import ArrowDataset
+import datasets
 
 class Omnisci_server:
     "Manage interactions with OmniSciDB server (launch/termination, connection establishing, etc.)"
@@ -18,10 +32,12 @@ class Omnisci_server:
     _http_port = 62278
     _calcite_port = 62279
     server_process = None
+    server_lifecycle = None
     _header_santander_train = False
     _imported_pd_df = {}
+    _imported_pd_df_sources = {}
 
-    def __init__(self, omnisci_executable, omnisci_port, database_name, omnisci_cwd=None):
+    def __init__(self, omnisci_executable, omnisci_port, database_name, omnisci_cwd=None, pd_cache_dir=None, pd_cache_size=20*2**30, read_workers=None, arrow_dir=None):
         if omnisci_cwd is not None:
             self._server_cwd = omnisci_cwd
         else:
@@ -48,7 +64,15 @@ class Omnisci_server:
         
         self._omnisci_cmd_line = [omnisci_executable] + [str(self._database_name), "-u", "admin", "-p", "HyperInteractive"] + ["--port", str(self._server_port)]
         self._command_2_import_CSV = "COPY %s FROM '%s' WITH (header='%s');"
+        self._copy_result_regexp = re.compile(r"Loaded: (\d+) recs, Rejected: (\d+) recs")
         self._conn = None
+        self._pd_cache = None
+        self._read_workers = read_workers
+        self._arrow_dataset = None
+        if arrow_dir is not None:
+            self._arrow_dataset = ArrowDataset(arrow_dir)
+        if pd_cache_dir is not None:
+            self._pd_cache = DfCache(pd_cache_dir, pd_cache_size)
 
     def _execute_process(self, cmdline, cwd=None):
         "Execute cmdline in user-defined directory by creating separated process"
@@ -62,11 +86,39 @@ class Omnisci_server:
 
         return process
 
-    def _read_csv_datafile(self, file_name, columns_names, header=None, compression_type='gzip', nrows=200000):
-        "Read csv by Pandas. Function returns Pandas DataFrame, which can be used by ibis load_data function"
-        
+    def _read_csv_datafile(self, file_name, columns_names, header=None, compression_type='gzip', nrows=200000, dtypes=None, dataset_name=None):
+        """Read csv by Pandas. Function returns Pandas DataFrame, which can be used by ibis load_data function.
+        Datafiles of known datasets are memory-mapped from Arrow dataset if it is used"""
+
+        if self._arrow_dataset is not None and dataset_name is not None:
+            return self._arrow_dataset.read(file_name, dataset_name, datasets.readers[dataset_name])
+
+        read_args = [columns_names, header, compression_type, nrows, dtypes]
+        if self._pd_cache is not None:
+            df = self._pd_cache.get(file_name, read_args)
+            if df is not None:
+                return df
+
         print("Reading datafile", file_name)
-        return pd.read_csv(file_name, compression=compression_type, header=header, names=columns_names, nrows=nrows)
+        df = pd.read_csv(file_name, compression=compression_type, header=header, names=columns_names, nrows=nrows, dtype=dtypes)
+        if self._pd_cache is not None:
+            self._pd_cache.put(file_name, read_args, df)
+        return df
+
+    def _read_csv_datafile_chunks(self, file_name, columns_names, header=None, chunksize=100000, compression_type='gzip', nrows=200000, dtypes=None, dataset_name=None):
+        "Read csv by Pandas. Function returns iterator over Pandas DataFrames with chunksize rows each"
+
+        # Cached datafiles are streamed by record batches instead of being loaded whole
+        if self._arrow_dataset is not None and dataset_name is not None:
+            return self._arrow_dataset.read_chunks(file_name, dataset_name, datasets.readers[dataset_name], chunksize)
+
+        if self._pd_cache is not None:
+            chunks = self._pd_cache.get_chunks(file_name, [columns_names, header, compression_type, nrows, dtypes], chunksize)
+            if chunks is not None:
+                return chunks
+
+        print("Reading datafile by chunks", file_name)
+        return pd.read_csv(file_name, compression=compression_type, header=header, names=columns_names, nrows=nrows, dtype=dtypes, chunksize=chunksize)
     
     def connect_to_server(self):
         "Connect to Omnisci server using Ibis framework"
@@ -74,33 +126,48 @@ class Omnisci_server:
         self._conn = ibis.omniscidb.connect(host="localhost", port=self._server_port, user="admin", password="HyperInteractive")
         return self._conn
 
-    def launch(self):
-        "Launch OmniSciDB server"
+    def _print_server_output(self, stdout):
+        for line in iter(stdout.readline, b''):
+            print("OMNISCI>>", line.decode().strip())
+
+    def launch(self, startup_timeout=120):
+        "Launch OmniSciDB server and wait until its Thrift and Calcite ports accept connections"
 
         print("Launching server ...")
         self.server_process = self._execute_process(self._server_start_cmdline, cwd=self._server_cwd)
+        self.server_lifecycle = ServerLifecycle(self.server_process, [self._server_port, self._calcite_port], startup_timeout=startup_timeout)
+        # Server blocks on full stdout pipe, so output is drained while waiting for startup
+        threading.Thread(target=self._print_server_output, args=(self.server_process.stdout,), daemon=True).start()
+        try:
+            self.server_lifecycle.wait_for_startup()
+        except Exception as err:
+            print("Failed to launch server, error occured:", err)
+            self.server_lifecycle.shutdown()
+            sys.exit(1)
         print("Server is launched")
 
-    def terminate(self):
+        return self.server_lifecycle.startup_time
+
+    def terminate(self, shutdown_timeout=30):
         "Terminate OmniSci server"
 
         print("Terminating server ...")
 
         try:
             #self._conn.close()
-            self.server_process.send_signal(signal.SIGINT)
-            time.sleep(2)
-            self.server_process.kill()
-            time.sleep(1)
-            self.server_process.terminate()
+            self.server_lifecycle.shutdown(shutdown_timeout)
         except Exception as err:
             print("Failed to terminate server, error occured:", err)
             sys.exit(1)
 
         print("Server is terminated")
 
-    def import_data(self, table_name, data_files_names, files_limit, columns_names, columns_types, header=False):
-        "Import CSV files using COPY SQL statement"
+        return self.server_lifecycle.shutdown_time
+
+    def import_data(self, table_name, data_files_names, files_limit, columns_names, columns_types, header=False, workers=1, import_mode='file',
+                    decompress_workers=0, scratch_dir=None, scratch_bytes=8*2**30):
+        """Import CSV files using COPY SQL statements executed by workers concurrently, one file or one group of files per COPY.
+        If decompress_workers is positive, gzipped files are decompressed by that many processes into scratch_dir ahead of their COPY"""
 
         if header == True:
             header_value = 'true'
@@ -109,6 +176,15 @@ class Omnisci_server:
         else:
             print("Wrong value of header argument!")
             sys.exit(2)
+
+        if workers < 1:
+            print("Wrong number of import workers:", workers)
+            sys.exit(2)
+
+        files = data_files_names[:files_limit]
+        if not files:
+            # Wildcard that matches nothing would give empty pool of sessions and zero import time
+            raise ValueError("No datafiles to import into table " + table_name)
             
         schema_table = ibis.Schema(
             names = columns_names,
@@ -121,21 +197,109 @@ class Omnisci_server:
             except Exception as err:
                 print("Failed to create table:", err)
 
-        for f in data_files_names[:files_limit]:
-            print("Importing datafile", f)
-            copy_str = self._command_2_import_CSV % (table_name, f, header_value)
+        if import_mode == 'wildcard':
+            # Every worker imports its group of files by one COPY statement
+            # with wildcard pointing to directory with links to the files
+            groups = [files[i::workers] for i in range(min(workers, len(files)))]
+        elif import_mode == 'file':
+            groups = [[f] for f in files]
+        else:
+            print("Wrong value of import_mode argument!")
+            sys.exit(2)
+        if decompress_workers > 0 and import_mode != 'file':
+            # Wildcard COPY needs all files of group at once, so scratch space couldn't be bounded
+            print("Decompression of datafiles is supported only in file import mode!")
+            sys.exit(2)
 
-            try:
-                import_process = subprocess.Popen(self._omnisci_cmd_line, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-                output = import_process.communicate(copy_str.encode())
-            except OSError as err:
-                print("Failed to start", self._omnisci_cmd_line, err)
+        try:
+            sessions = OmnisqlSessionPool(self._omnisci_cmd_line, size=min(workers, len(groups)), timing=False).start()
+        except OSError as err:
+            print("Failed to start", self._omnisci_cmd_line, err)
+            sys.exit(2)
 
-            print(str(output[0].strip().decode()))
-            print("Command returned", import_process.returncode)
-    
-    def import_data_by_ibis(self, table_name, data_files_names, files_limit, columns_names, columns_types, cast_dict, header=None):
-        "Import CSV files using Ibis load_data from the Pandas.DataFrame"
+        stage = None
+        t0 = time.time()
+        try:
+            if decompress_workers > 0:
+                stage = DecompressStage(files, decompress_workers, scratch_dir, scratch_bytes).start()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._import_files_group, sessions, table_name, group, header_value, stage) for group in groups]
+                try:
+                    import_stats = [future.result() for future in futures]
+                except Exception as err:
+                    # COPY statements that are not started yet are not executed after failure
+                    for future in futures:
+                        future.cancel()
+                    print("Failed to import datafiles:", err)
+                    sys.exit(2)
+        finally:
+            sessions.close()
+            if stage is not None:
+                stage.close()
+        t_import = time.time() - t0
+
+        total_rows = sum(stats['rows'] for stats in import_stats)
+        total_bytes = sum(stats['bytes'] for stats in import_stats)
+        print("Imported", len(files), "datafiles,", total_rows, "rows,", round(total_bytes / 2**20, 1), self._size_unit(files), "in", round(t_import, 3), "seconds,",
+              round(total_rows / t_import), "rows/s,", round(total_bytes / 2**20 / t_import, 1), self._size_unit(files) + "/s")
+        if stage is not None:
+            # Wait time is decompression that was not overlapped with import of previous files.
+            # COPY and wait times are summed over concurrent sessions, so they are averaged to be comparable with import time
+            importers = min(workers, len(groups))
+            decompress_stats = stage.report_values(sum(stats['time'] for stats in import_stats), importers)
+            print("Import time", round(t_import, 3), "seconds, per each of", importers, "import sessions: ingestion", decompress_stats['IngestTime'], "seconds,",
+                  "waiting for decompression", decompress_stats['DecompressWaitTime'], "seconds; decompression in workers",
+                  decompress_stats['DecompressTime'], "seconds,", decompress_stats['DecompressedMB'], "MB decompressed")
+
+        return import_stats, t_import
+
+    def _import_files_group(self, sessions, table_name, files, header_value, stage=None):
+        "Import group of files by one COPY statement and return import statistics"
+
+        # Exceptions are handled by import_data, they are raised in its thread
+        if stage is not None:
+            import_files = [stage.acquire(f) for f in files]
+        else:
+            import_files = files
+        links_dir = None
+        if len(import_files) > 1:
+            links_dir = tempfile.mkdtemp(prefix="omnisci_import_")
+            for f in import_files:
+                os.symlink(os.path.abspath(f), os.path.join(links_dir, os.path.basename(f)))
+            copy_source = os.path.join(links_dir, "*")
+        else:
+            copy_source = import_files[0]
+
+        print("Importing datafiles", files)
+        t0 = time.time()
+        try:
+            result = sessions.execute(self._command_2_import_CSV % (table_name, copy_source, header_value))
+        finally:
+            if links_dir is not None:
+                shutil.rmtree(links_dir)
+            if stage is not None:
+                for f in files:
+                    stage.release(f)
+        t_import = time.time() - t0
+
+        print(result.output)
+        if result.error is not None:
+            print("Failed to import datafiles", files, result.error)
+        matches = self._copy_result_regexp.search(result.output)
+        rows = int(matches.group(1)) if matches else 0
+        files_bytes = sum(os.path.getsize(f) for f in files)
+        print("Imported", files, rows, "rows in", round(t_import, 3), "seconds,",
+              round(rows / t_import), "rows/s,", round(files_bytes / 2**20 / t_import, 1), self._size_unit(files) + "/s")
+
+        return {'files': files, 'rows': rows, 'bytes': files_bytes, 'time': t_import}
+
+    def _size_unit(self, files):
+        # Sizes of datafiles are reported as they are stored
+        return "compressed MB" if any(f.endswith(".gz") for f in files) else "MB"
+
+    def import_data_by_ibis(self, table_name, data_files_names, files_limit, columns_names, columns_types, cast_dict, header=None, chunksize=None, dataset_name=None):
+        """Import CSV files using Ibis load_data from the Pandas.DataFrame, read and load them by chunks of chunksize rows if it is specified.
+        dataset_name is name of dataset in datasets.readers that reads datafiles the same way, it is used to memory-map them from Arrow dataset"""
         
         schema_table = ibis.Schema(
             names = columns_names,
@@ -148,13 +312,13 @@ class Omnisci_server:
             except Exception as err:
                 print("Failed to create table:", err)
 
+        files = self._datafiles_list(data_files_names, files_limit)
+        self._imported_pd_df_sources[table_name] = (files, columns_names, header, dataset_name)
+        if chunksize is not None:
+            return self._import_data_by_ibis_chunks(table_name, files, columns_names, cast_dict, header, chunksize, dataset_name)
+
         t0 = time.time()
-        if files_limit > 1:
-            pandas_df_from_each_file = (self._read_csv_datafile(file_name, columns_names, header) for file_name in data_files_names[:files_limit])
-            self._imported_pd_df[table_name] = pd.concat(pandas_df_from_each_file, ignore_index=True)
-        else:
-            self._imported_pd_df[table_name] = self._read_csv_datafile(data_files_names, columns_names, header)
-        
+        self._imported_pd_df[table_name] = self._read_csv_datafiles(files, columns_names, header, dataset_name)
         t_import_pandas = time.time() - t0
             
         pandas_concatenated_df_casted = self._imported_pd_df[table_name].astype(dtype=cast_dict, copy=True)
@@ -164,7 +328,61 @@ class Omnisci_server:
         t_import_ibis = time.time() - t0
 
         return t_import_pandas, t_import_ibis
-    
+
+    def _import_data_by_ibis_chunks(self, table_name, files, columns_names, cast_dict, header, chunksize, dataset_name=None):
+        "Load CSV files chunk by chunk, next chunk is parsed in background thread while current one is loaded"
+
+        # At most one parsed chunk waits in the queue, so memory consumption is
+        # bounded by three chunks: being parsed, waiting and being loaded
+        chunks = queue.Queue(maxsize=1)
+        t_import_pandas = 0.0
+
+        def read_chunks():
+            nonlocal t_import_pandas
+            try:
+                for file_name in files:
+                    t0 = time.time()
+                    for chunk in self._read_csv_datafile_chunks(file_name, columns_names, header, chunksize, dataset_name=dataset_name):
+                        t_import_pandas += time.time() - t0
+                        chunks.put(chunk)
+                        t0 = time.time()
+            except Exception as err:
+                chunks.put(err)
+            chunks.put(None)
+
+        reader = threading.Thread(target=read_chunks, daemon=True)
+        reader.start()
+
+        t_import_ibis = 0.0
+        chunk = chunks.get()
+        while chunk is not None:
+            if isinstance(chunk, Exception):
+                print("Failed to read datafile:", chunk)
+                sys.exit(2)
+            chunk = chunk.astype(dtype=cast_dict, copy=False)
+            t0 = time.time()
+            self._conn.load_data(table_name=table_name, obj=chunk, database=self._database_name)
+            t_import_ibis += time.time() - t0
+            del chunk
+            chunk = chunks.get()
+        reader.join()
+
+        return t_import_pandas, t_import_ibis
+
+    def _datafiles_list(self, data_files_names, files_limit):
+        if isinstance(data_files_names, str):
+            return [data_files_names]
+        return data_files_names[:files_limit]
+
+    def _read_csv_datafiles(self, files, columns_names, header, dataset_name=None):
+        "Read datafiles in parallel processes and concatenate them"
+
+        read_workers = self._read_workers
+        if self._arrow_dataset is not None and dataset_name is not None:
+            # Mapping is cheap and mapped datafiles shouldn't be copied between processes
+            read_workers = 1
+        return read_datafiles(lambda file_name: self._read_csv_datafile(file_name, columns_names, header, dataset_name=dataset_name), files, read_workers)
+
     def drop_table(self, table_name):
         "Drop table by table_name using Ibis framework"
         
@@ -174,14 +392,18 @@ class Omnisci_server:
             df.drop()
             if table_name in self._imported_pd_df:
                 del self._imported_pd_df[table_name]
+            if table_name in self._imported_pd_df_sources:
+                del self._imported_pd_df_sources[table_name]
         else:
             print("Table", table_name, "doesn't exist!")
             sys.exit(3)
     
     def get_pd_df(self, table_name):
-        "Get already imported Pandas DataFrame"
+        "Get already imported Pandas DataFrame, datafiles imported by chunks are read again"
         
         if self._conn.exists_table(name=table_name, database=self._database_name):
+            if table_name not in self._imported_pd_df:
+                self._imported_pd_df[table_name] = self._read_csv_datafiles(*self._imported_pd_df_sources[table_name])
             return self._imported_pd_df[table_name]
         else:
             print("Table", table_name, "doesn't exist!")
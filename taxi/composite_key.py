@@ -0,0 +1,36 @@
+import numpy as np
+
+def count_by_composite_key(columns):
+    """Count rows for every combination of integer valued columns. Columns are packed into
+    single int64 key, so counting is done by np.bincount or np.unique instead of hashing
+    of tuples. Return sorted unique combinations as list of columns and their counts"""
+
+    valid = np.ones(len(columns[0]), dtype=bool)
+    for column in columns:
+        if column.dtype.kind == 'f':
+            valid &= ~np.isnan(column)
+    columns = [column[valid].astype(np.int64) for column in columns]
+    if len(columns[0]) == 0:
+        return [np.empty(0, dtype=np.int64) for _ in columns], np.empty(0, dtype=np.int64)
+    minimums = [int(column.min()) for column in columns]
+    ranges = [int(column.max()) - minimum + 1 for column, minimum in zip(columns, minimums)]
+    keys_number = int(np.prod([float(r) for r in ranges]))
+    if keys_number >= 2**62:
+        # Key space doesn't fit int64, count unique rows instead
+        unique, counts = np.unique(np.stack(columns, axis=1), axis=0, return_counts=True)
+        return [unique[:, i] for i in range(len(columns))], counts
+    key = np.zeros(len(columns[0]), dtype=np.int64)
+    for column, minimum, r in zip(columns, minimums, ranges):
+        key *= r
+        key += column - minimum
+    if keys_number <= 4 * len(key):
+        counts = np.bincount(key, minlength=keys_number)
+        unique = np.flatnonzero(counts)
+        counts = counts[unique]
+    else:
+        unique, counts = np.unique(key, return_counts=True)
+    decoded = []
+    for minimum, r in zip(reversed(minimums), reversed(ranges)):
+        decoded.append(unique % r + minimum)
+        unique = unique // r
+    return decoded[::-1], counts
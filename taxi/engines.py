@@ -0,0 +1,286 @@
+import importlib
+import importlib.util
+import os
+import time
+import numpy as np
+import pandas as pd
+
+# Dataframe engines that execute taxi queries q1-q4 on data loaded by
+# taxibench_pandas.py. Engines are optional dependencies, module of engine
+# is imported only when engine is used.
+
+class Engine:
+    "Taxi queries implemented by pandas API of engine module"
+
+    name = None
+    suffix = None
+    required_module = None
+
+    @classmethod
+    def available(cls):
+        return importlib.util.find_spec(cls.required_module.split('.')[0]) is not None
+
+    def __init__(self, df, years=None):
+        self.module = importlib.import_module(self.required_module)
+        # Time of compilation of every query in ms for engines that compile queries before running them
+        self.compile_times = {}
+        frame = df.copy(deep=False)
+        if years is not None:
+            frame['pickup_year'] = years
+        t1 = time.time()
+        self.df = self.prepare(frame)
+        print("PREPARING", self.name, "ENGINE TIME", int(round((time.time() - t1) * 1000)))
+
+    def prepare(self, frame):
+        "Convert loaded pandas dataframe to dataframe of engine"
+        return self.module.DataFrame(frame)
+
+    def compute(self, result):
+        "Materialize result of query"
+        return result
+
+    def q1(self):
+        return self.compute(self.df.groupby('cab_type', observed=True)['cab_type'].count())
+
+    def q2(self):
+        return self.compute(self.df[['passenger_count','total_amount']].groupby('passenger_count').mean())
+
+    def q3(self):
+        return self.compute(self.df.groupby(['passenger_count','pickup_year']).size())
+
+    def q4(self):
+        df = self.df[['passenger_count','pickup_year','trip_distance']]
+        df = df.assign(trip_distance=df['trip_distance'].round())
+        result = self.compute(df.groupby(['passenger_count','pickup_year','trip_distance']).size().reset_index())
+        return result.sort_values(by=['pickup_year',0],ascending=[True,False])
+
+class ModinEngine(Engine):
+    name = 'modin'
+    suffix = 'modin'
+    required_module = 'modin.pandas'
+
+class DaskEngine(Engine):
+    "Local Dask dataframe with one partition per CPU, partitions are persisted in memory"
+
+    name = 'dask'
+    suffix = 'dask'
+    required_module = 'dask.dataframe'
+
+    def prepare(self, frame):
+        return self.module.from_pandas(frame, npartitions=os.cpu_count()).persist()
+
+    def compute(self, result):
+        return result.compute()
+
+class PolarsEngine(Engine):
+    name = 'polars'
+    suffix = 'polars'
+    required_module = 'polars'
+
+    def prepare(self, frame):
+        return self.module.from_pandas(frame)
+
+    def q1(self):
+        return self.df.group_by('cab_type').agg(self.module.len())
+
+    def q2(self):
+        return self.df.group_by('passenger_count').agg(self.module.col('total_amount').mean())
+
+    def q3(self):
+        return self.df.group_by(['passenger_count','pickup_year']).agg(self.module.len())
+
+    def q4(self):
+        pl = self.module
+        # Halves are rounded to even like pandas and numpy do, polars rounds them away from zero by default
+        return self.df.with_columns(pl.col('trip_distance').round(0, mode='half_to_even')) \
+                      .group_by(['passenger_count','pickup_year','trip_distance']) \
+                      .agg(pl.len().alias('trips')) \
+                      .sort(['pickup_year','trips'], descending=[False,True])
+
+class ArrowEngine(Engine):
+    "Arrow table with queries executed by pyarrow.compute and Acero group by"
+
+    name = 'pyarrow'
+    suffix = 'pa'
+    required_module = 'pyarrow'
+
+    def prepare(self, frame):
+        self.compute_module = importlib.import_module('pyarrow.compute')
+        return self.module.Table.from_pandas(frame, preserve_index=False)
+
+    def q1(self):
+        return self.df.group_by('cab_type').aggregate([('cab_type', 'count')])
+
+    def q2(self):
+        return self.df.group_by('passenger_count').aggregate([('total_amount', 'mean')])
+
+    def q3(self):
+        return self.df.group_by(['passenger_count','pickup_year']).aggregate([([], 'count_all')])
+
+    def q4(self):
+        table = self.df.select(['passenger_count','pickup_year','trip_distance'])
+        table = table.set_column(2, 'trip_distance', self.compute_module.round(table['trip_distance'], round_mode='half_to_even'))
+        result = table.group_by(['passenger_count','pickup_year','trip_distance']).aggregate([([], 'count_all')])
+        return result.sort_by([('pickup_year', 'ascending'), ('count_all', 'descending')])
+
+# Kernels of Numba engine, they are compiled by numba.njit once per process when
+# the first engine is created. Missing values of keys are represented by code -1.
+
+_compiled_kernels = None
+
+def _kernels(numba):
+    global _compiled_kernels
+    if _compiled_kernels is None:
+        _compiled_kernels = {kernel.__name__.lstrip('_'): numba.njit(nogil=True)(kernel)
+                             for kernel in [_count_codes, _sum_count_codes, _count_code_pairs, _distance_keys, _count_keys]}
+    return _compiled_kernels
+
+def _count_codes(codes, codes_number):
+    counts = np.zeros(codes_number, dtype=np.int64)
+    for code in codes:
+        if code >= 0:
+            counts[code] += 1
+    return counts
+
+def _sum_count_codes(codes, values, codes_number):
+    sums = np.zeros(codes_number, dtype=np.float64)
+    counts = np.zeros(codes_number, dtype=np.int64)
+    for i in range(len(codes)):
+        if codes[i] >= 0 and not np.isnan(values[i]):
+            sums[codes[i]] += values[i]
+            counts[codes[i]] += 1
+    return sums, counts
+
+def _count_code_pairs(first_codes, second_codes, second_codes_number, codes_number):
+    counts = np.zeros(codes_number, dtype=np.int64)
+    for i in range(len(first_codes)):
+        if first_codes[i] >= 0 and second_codes[i] >= 0:
+            counts[first_codes[i] * second_codes_number + second_codes[i]] += 1
+    return counts
+
+def _distance_keys(first_codes, second_codes, second_codes_number, distance):
+    "Pack codes and rounded distance into int64 key, return keys, validity of rows, minimum and range of rounded distance"
+
+    rows = len(distance)
+    rounded = np.empty(rows, dtype=np.int64)
+    valid = np.empty(rows, dtype=np.bool_)
+    low = np.iinfo(np.int64).max
+    high = np.iinfo(np.int64).min
+    for i in range(rows):
+        valid[i] = first_codes[i] >= 0 and second_codes[i] >= 0 and not np.isnan(distance[i])
+        if valid[i]:
+            rounded[i] = np.int64(np.rint(distance[i]))
+            low = min(low, rounded[i])
+            high = max(high, rounded[i])
+    if high < low:
+        # No valid rows, keys are not used
+        return np.empty(rows, dtype=np.int64), valid, np.int64(0), np.int64(1)
+    distance_range = max(high - low + 1, 1)
+    keys = np.empty(rows, dtype=np.int64)
+    for i in range(rows):
+        if valid[i]:
+            keys[i] = (first_codes[i] * second_codes_number + second_codes[i]) * distance_range + rounded[i] - low
+    return keys, valid, low, distance_range
+
+def _count_keys(keys, valid, keys_number):
+    "Return sorted unique valid keys and their counts"
+
+    if keys_number <= 4 * len(keys) + 1024:
+        counts = np.zeros(keys_number, dtype=np.int64)
+        for i in range(len(keys)):
+            if valid[i]:
+                counts[keys[i]] += 1
+        unique = np.flatnonzero(counts)
+        return unique, counts[unique]
+    # Key space is too large for dense counters, equal keys are counted after sorting
+    keys = np.sort(keys[valid])
+    unique = np.empty(len(keys), dtype=np.int64)
+    counts = np.empty(len(keys), dtype=np.int64)
+    unique_number = 0
+    for i in range(len(keys)):
+        if i == 0 or keys[i] != keys[i - 1]:
+            unique[unique_number] = keys[i]
+            counts[unique_number] = 0
+            unique_number += 1
+        counts[unique_number - 1] += 1
+    return unique[:unique_number], counts[:unique_number]
+
+class NumbaEngine(Engine):
+    """Queries executed by kernels compiled by Numba over numpy arrays. Keys are
+    mapped to dense integer codes once, so strings never reach kernels. Kernels
+    are compiled when the first engine is created and compile time is kept separately"""
+
+    name = 'numba'
+    suffix = 'nb'
+    required_module = 'numba'
+
+    def __init__(self, df, years=None):
+        super().__init__(df, years)
+        # Kernels are specialized to types of arguments, so one row is enough to compile them
+        row = {column: values[:1] for column, values in self.df.items()}
+        for query_name in ['q1', 'q2', 'q3', 'q4']:
+            t1 = time.time()
+            getattr(self, '_' + query_name)(row)
+            self.compile_times[query_name] = int(round((time.time() - t1) * 1000))
+        print("COMPILING", self.name, "ENGINE TIME", sum(self.compile_times.values()), self.compile_times)
+
+    def prepare(self, frame):
+        self.kernels = _kernels(self.module)
+        data = {}
+        self.uniques = {}
+        for column in ['cab_type', 'passenger_count', 'pickup_year']:
+            codes, self.uniques[column] = pd.factorize(frame[column], sort=True)
+            data[column] = codes
+        for column in ['total_amount', 'trip_distance']:
+            data[column] = frame[column].to_numpy()
+        return data
+
+    def q1(self):
+        return self._q1(self.df)
+
+    def q2(self):
+        return self._q2(self.df)
+
+    def q3(self):
+        return self._q3(self.df)
+
+    def q4(self):
+        return self._q4(self.df)
+
+    def _q1(self, data):
+        counts = self.kernels['count_codes'](data['cab_type'], len(self.uniques['cab_type']))
+        codes = np.flatnonzero(counts)
+        return pd.Series(counts[codes], index=pd.Index(np.asarray(self.uniques['cab_type'])[codes], name='cab_type'), name='cab_type')
+
+    def _q2(self, data):
+        sums, counts = self.kernels['sum_count_codes'](data['passenger_count'], data['total_amount'], len(self.uniques['passenger_count']))
+        codes = np.flatnonzero(counts)
+        return pd.DataFrame({'passenger_count': np.asarray(self.uniques['passenger_count'])[codes],
+                             'total_amount': sums[codes] / counts[codes]})
+
+    def _q3(self, data):
+        years_number = len(self.uniques['pickup_year'])
+        counts = self.kernels['count_code_pairs'](data['passenger_count'], data['pickup_year'], years_number,
+                                                  len(self.uniques['passenger_count']) * years_number)
+        keys = np.flatnonzero(counts)
+        index = pd.MultiIndex.from_arrays([np.asarray(self.uniques['passenger_count'])[keys // years_number],
+                                           np.asarray(self.uniques['pickup_year'])[keys % years_number]],
+                                          names=['passenger_count', 'pickup_year'])
+        return pd.Series(counts[keys], index=index, name='passenger_count')
+
+    def _q4(self, data):
+        years_number = len(self.uniques['pickup_year'])
+        keys, valid, low, distance_range = self.kernels['distance_keys'](data['passenger_count'], data['pickup_year'],
+                                                                          years_number, data['trip_distance'])
+        keys_number = len(self.uniques['passenger_count']) * years_number * distance_range
+        unique, counts = self.kernels['count_keys'](keys, valid, keys_number)
+        pairs = unique // distance_range
+        result = pd.DataFrame({
+            'passenger_count': np.asarray(self.uniques['passenger_count'])[pairs // years_number],
+            'pickup_year': np.asarray(self.uniques['pickup_year'])[pairs % years_number],
+            'trip_distance': (unique % distance_range + low).astype(np.float64),
+            0: counts
+        })
+        return result.sort_values(by=['pickup_year',0],ascending=[True,False])
+
+engines = {engine.name: engine for engine in [DaskEngine, PolarsEngine, ArrowEngine, ModinEngine, NumbaEngine]}
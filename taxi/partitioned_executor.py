@@ -0,0 +1,96 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+# Frame and derived columns are set before worker processes are forked, so
+# workers access row ranges of them in memory shared with parent process
+# instead of receiving pickled partitions.
+_df = None
+_years = None
+
+def partial_q1(df, years):
+    "Count of trips per cab_type"
+
+    return df['cab_type'].value_counts()
+
+def partial_q2(df, years):
+    "Sum and count of total_amount per passenger_count"
+
+    return df.groupby('passenger_count')['total_amount'].agg(['sum', 'count'])
+
+def partial_q3(df, years):
+    "Count of trips per passenger_count and pickup year"
+
+    return df.groupby([df['passenger_count'].values, years]).size()
+
+def partial_q4(df, years):
+    "Count of trips per passenger_count, pickup year and rounded trip_distance"
+
+    return df.groupby([df['passenger_count'].values, years, df['trip_distance'].round().values]).size()
+
+def combine(partials):
+    "Combine partial aggregates of any query into one partial aggregate"
+
+    combined = pd.concat(partials)
+    return combined.groupby(level=list(range(combined.index.nlevels))).sum()
+
+def merge_q1(partials):
+    counts = combine(partials)
+    counts.index.name = 'cab_type'
+    return counts[counts > 0].rename('cab_type')
+
+def merge_q2(partials):
+    totals = combine(partials)
+    result = pd.DataFrame({'passenger_count': totals.index, 'total_amount': totals['sum'] / totals['count']})
+    return result.reset_index(drop=True)
+
+def merge_q3(partials):
+    counts = combine(partials)
+    counts.index.names = ['passenger_count', 'pickup_datetime']
+    return counts.rename('passenger_count')
+
+def merge_q4(partials):
+    counts = combine(partials)
+    counts.index.names = ['passenger_count', 'pickup_datetime', 'trip_distance']
+    return counts.reset_index(name=0).sort_values(by=['pickup_datetime',0],ascending=[True,False])
+
+queries = {
+    'q1': (partial_q1, merge_q1),
+    'q2': (partial_q2, merge_q2),
+    'q3': (partial_q3, merge_q3),
+    'q4': (partial_q4, merge_q4)
+}
+
+def _compute_partial(task):
+    query_name, start, stop = task
+    partial, _ = queries[query_name]
+    return partial(_df.iloc[start:stop], None if _years is None else _years[start:stop])
+
+class PartitionedExecutor:
+    """Execute taxi queries by computing partial aggregates for row ranges of the frame
+    in worker processes and merging them"""
+
+    def __init__(self, df, workers, years=None):
+        global _df, _years
+        _df = df
+        _years = years
+        self.workers = workers
+        self._rows = len(df)
+        self._pool = multiprocessing.get_context('fork').Pool(workers)
+
+    def _partitions(self, partitions_number):
+        bounds = np.linspace(0, self._rows, partitions_number + 1).astype(np.int64)
+        return [(int(bounds[i]), int(bounds[i + 1])) for i in range(partitions_number) if bounds[i] < bounds[i + 1]]
+
+    def run(self, query_name, serial=False):
+        "Execute query by worker processes or serially in current process and return its result"
+
+        _, merge = queries[query_name]
+        if serial:
+            return merge([_compute_partial((query_name, 0, self._rows))])
+        tasks = [(query_name, start, stop) for start, stop in self._partitions(self.workers)]
+        return merge(self._pool.map(_compute_partial, tasks))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
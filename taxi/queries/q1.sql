@@ -0,0 +1,4 @@
+SELECT cab_type,
+       count(*)
+FROM ##TAB##
+GROUP BY cab_type;
@@ -0,0 +1,6 @@
+SELECT passenger_count,
+       extract(year from pickup_datetime) AS pickup_year,
+       count(*)
+FROM ##TAB##
+GROUP BY passenger_count,
+         pickup_year;
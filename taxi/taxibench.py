@@ -1,5 +1,6 @@
 import mysql.connector
-import subprocess
+import time
+import statistics
 import argparse
 import pathlib
 import glob
@@ -8,11 +9,20 @@ import re
 import io
 import os
 
-# Load database reporting functions
+# Load database reporting and omnisql session functions
 pathToReportDir = os.path.join(pathlib.Path(__file__).parent, "..", "report")
+pathToServerDir = os.path.join(pathlib.Path(__file__).parent, "..", "server")
+pathToDatasetDir = os.path.join(pathlib.Path(__file__).parent, "..", "dataset")
 print(pathToReportDir)
 sys.path.insert(1, pathToReportDir)
+sys.path.insert(1, pathToServerDir)
+sys.path.insert(1, pathToDatasetDir)
 import report
+from omnisql_session import OmnisqlSession
+from pymapd_session import PymapdSessionPool
+from measurement import Measurement, add_measurement_arguments
+from fifo_source import FifoSource
+from decompress_stage import DecompressStage
 
 omnisciExecutable  = "build/bin/omnisql"
 taxiTripsDirectory = "/localdisk/work/trips_x*.csv"
@@ -20,7 +30,6 @@ taxiTripsDirectory = "/localdisk/work/trips_x*.csv"
 command1DropTableTrips = "drop table taxitestdb;"
 command2ImportCSV      = "COPY taxitestdb FROM '%s' WITH (header='false');"
 
-timingRegexpRegexp = re.compile("Execution time: (\d+) ms, Total time: (\d+) ms", flags=re.MULTILINE)
 exceptionRegexpRegexp = re.compile("Exception: .*", flags=re.MULTILINE)
 
 omnisciCmdLine = ["-q", "omnisci", "-u", "admin", "-p", "HyperInteractive"]
@@ -184,6 +193,7 @@ def getErrorLine(text):
         return exMatch
 
     # Return last non-emptry string from text buffer
+    errStr = ""
     buf = io.StringIO(text)
     for line in buf:
         line = line.strip()
@@ -223,17 +233,24 @@ parser = argparse.ArgumentParser(description='Run NY Taxi benchmark using omnisq
 
 parser.add_argument('-fs', action='append', type=int, help="Fragment size to use for created table. Multiple values are allowed and encouraged.")
 parser.add_argument('-e', default=omnisciExecutable, help='Path to executable "omnisql"')
-parser.add_argument('-ct', action='store_true', help="Use CREATE TABLE WITH (STORAGE_TYPE='CSV:trips.csv'). KEEP IN MIND that currently it is possible to load JUST ONE CSV file with this statement, so join all data into one big file, so -df value has no effect.")
+parser.add_argument('-ct', action='store_true', help="Use CREATE TABLE WITH (STORAGE_TYPE='CSV:trips.csv'). KEEP IN MIND that currently it is possible to load JUST ONE CSV file with this statement, so join all data into one big file or use -fifo, otherwise -df value has no effect.")
+parser.add_argument('-fifo', action='store_true', help="With -ct stream first -df datafiles through named pipe that is passed to CREATE TABLE instead of one joined file. Gzipped datafiles are decompressed on the fly and all files are streamed again every time server opens the pipe.")
+parser.add_argument('-fifo-dir', help="Directory to create named pipe for -fifo in. It should be accessible by server. By default system temporary directory is used.")
 parser.add_argument('-df', default=1, type=int, help="Number of datafiles to input into database for processing")
 parser.add_argument('-dp', default=taxiTripsDirectory, help="Wildcard pattern of datafiles that should be loaded")
+parser.add_argument('-decompress-workers', default=0, type=int, help="Number of processes that decompress gzipped datafiles into scratch directory ahead of their COPY import. By default datafiles are passed to COPY compressed.")
+parser.add_argument('-scratch-dir', help="Directory for datafiles decompressed by -decompress-workers. It should be accessible by server. By default /dev/shm is used if it exists.")
+parser.add_argument('-scratch-mb', default=8192, type=int, help="Maximum size in MB of decompressed datafiles kept in scratch directory.")
 parser.add_argument('-dnd', action='store_true', help="Do not delete old table. KEEP IN MIND that in this case -fs values have no effect because table is taken from previous runs.")
 parser.add_argument('-dni', action='store_true', help="Do not create new table and import any data from CSV files. KEEP IN MIND that in this case -fs values have no effect because table is taken from previous runs.")
-parser.add_argument('-t', default=5, type=int, help="Number of times to run every benchmark. Best result is selected")
+parser.add_argument('-t', default=5, type=int, help="Minimum number of times to run every benchmark. Iterations continue until confidence interval of median exec time is narrow enough")
+add_measurement_arguments(parser)
 parser.add_argument('-sco', action='store_true', help="Show commands (that delete and create table) output")
 parser.add_argument('-sbo', action='store_true', help="Show benchmarks output")
 parser.add_argument('-r', default="report.csv", help="Report file name")
 parser.add_argument("-test", action='store_true', help="Run tests")
 parser.add_argument("-port", default=62074, type=int, help="TCP port that omnisql client should use to connect to server")
+parser.add_argument("-client", default="omnisql", choices=["omnisql", "pymapd"], help="Client that executes statements. omnisql is piped statements with \\timing, pymapd executes them over thrift connection to -port and reports client round trip time, result transfer time and number of result rows in addition to server timing.")
 
 parser.add_argument("-db-server", default="localhost", help="Host name of MySQL server")
 parser.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server")
@@ -254,6 +271,15 @@ if args.df <= 0:
 
 if args.t < 1:
     print("Bad number of iterations specified", args.t)
+    sys.exit(1)
+
+if args.decompress_workers < 0 or args.scratch_mb <= 0:
+    print("Bad decompression parameters specified", args.decompress_workers, args.scratch_mb)
+    sys.exit(1)
+
+if args.fifo and not args.ct:
+    print("-fifo can be used only with -ct")
+    sys.exit(1)
 
 omnisciCmdLine = [args.e] + omnisciCmdLine + ["--port", str(args.port)]
 
@@ -266,25 +292,51 @@ if args.db_user is not "":
         'FragmentSize': 'BIGINT UNSIGNED NOT NULL',
         'BenchName': 'VARCHAR(500) NOT NULL',
         'BestExecTimeMS': 'BIGINT UNSIGNED',
-        'BestTotalTimeMS': 'BIGINT UNSIGNED'
+        'BestTotalTimeMS': 'BIGINT UNSIGNED',
+        'BestClientTimeMS': 'BIGINT UNSIGNED',
+        'MedianTransferTimeMS': 'BIGINT UNSIGNED',
+        'ResultRows': 'BIGINT UNSIGNED',
+        **Measurement.metrics_fields
     }, {
         'ScriptName': 'taxibench.py',
         'CommitHash': args.commit
     })
 
+def executeStatement(statement, showOutput):
+    try:
+        result = session.execute(statement)
+    except Exception as err:
+        print("Failed to execute statement by", args.client, "client", err)
+        sys.exit(3)
+    if showOutput:
+        print(result.output)
+    if result.error is not None:
+        print("Statement failed:", result.error)
+    return result
+
+measurement = Measurement.from_args(args, args.t)
+if args.client == "pymapd":
+    try:
+        session = PymapdSessionPool(1, port=args.port)
+        session.start()
+    except Exception as err:
+        print("Failed to connect to server on port", args.port, "by pymapd", err)
+        sys.exit(3)
+else:
+    session = OmnisqlSession(omnisciCmdLine)
+    try:
+        session.start()
+    except OSError as err:
+        print("Failed to start", omnisciCmdLine, err)
+        sys.exit(3)
+
+fifoSource = None
 for fs in args.fs:
     print("RUNNING WITH FRAGMENT SIZE", fs)
     # Delete old table
     if not args.dnd:
         print("Deleting taxitestdb old database")
-        try:
-            process = subprocess.Popen(omnisciCmdLine, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-            output = process.communicate(command1DropTableTrips.encode())
-        except OSError as err:
-            print("Failed to start", omnisciCmdLine, err)
-        if args.sco:
-            print(str(output[0].strip().decode()))
-        print("Command returned", process.returncode)
+        executeStatement(command1DropTableTrips, args.sco)
 
     dataFilesNumber = 0
     # Create table and import data
@@ -294,92 +346,121 @@ for fs in args.fs:
             print("Could not find any data files matching", args.dp)
             sys.exit(2)
 
-        if args.ct:
+        if args.ct and args.fifo:
+            # Foreign storage interface import from named pipe that streams all datafiles
+            dataFilesNumber = len(dataFileNames[:args.df])
+            if fifoSource is None:
+                try:
+                    fifoSource = FifoSource(dataFileNames[:args.df], args.fifo_dir).start()
+                except OSError as err:
+                    print("Failed to create named pipe for datafiles", err)
+                    sys.exit(3)
+            print("Creating new table taxitestdb with fragment size", fs, "and", dataFilesNumber, "data files streamed through", fifoSource.path)
+            createTableStr = tripsCreateTableFSI % (fs, fifoSource.path)
+            executeStatement(createTableStr, args.sco)
+        elif args.ct:
             # Foreign storage interface import with CREATE TABLE
             dataFilesNumber = 1
             print("Creating new table taxitestdb with fragment size", fs, "and data file", dataFileNames[0])
             createTableStr = tripsCreateTableFSI % (fs, dataFileNames[0])
-            try:
-                process = subprocess.Popen(omnisciCmdLine, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-                output = process.communicate(createTableStr.encode())
-            except OSError as err:
-                print("Failed to start", omnisciCmdLine, err)
-            if args.sco:
-                print(str(output[0].strip().decode()))
-            print("Command returned", process.returncode)
+            executeStatement(createTableStr, args.sco)
         else:
             # Import using COPY
             # Create new table
             print("Creating new table taxitestdb with fragment size", fs)
             createTableStr = tripsCreateTableOriginal % fs
-            try:
-                process = subprocess.Popen(omnisciCmdLine, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-                output = process.communicate(createTableStr.encode())
-            except OSError as err:
-                print("Failed to start", omnisciCmdLine, err)
-            if args.sco:
-                print(str(output[0].strip().decode()))
-            print("Command returned", process.returncode)
+            executeStatement(createTableStr, args.sco)
             # Datafiles import
             dataFilesNumber = len(dataFileNames[:args.df])
-            for df in dataFileNames[:args.df]:
-                print("Importing datafile", df)
-                copyStr = command2ImportCSV % df
+            if args.decompress_workers > 0:
+                # Next datafiles are decompressed while previous ones are imported
+                ingestTime = 0
+                t0 = time.time()
                 try:
-                    process = subprocess.Popen(omnisciCmdLine, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-                    output = process.communicate(copyStr.encode())
+                    with DecompressStage(dataFileNames[:args.df], args.decompress_workers, args.scratch_dir, args.scratch_mb * 2**20) as stage:
+                        for df, importName in stage:
+                            print("Importing datafile", df, "decompressed to", importName)
+                            t1 = time.time()
+                            executeStatement(command2ImportCSV % importName, args.sco)
+                            ingestTime += time.time() - t1
                 except OSError as err:
-                    print("Failed to start", omnisciCmdLine, err)
-                if args.sco:
-                    print(str(output[0].strip().decode()))
-                print("Command returned", process.returncode)
+                    print("Failed to decompress datafiles", err)
+                    sys.exit(3)
+                importStatistics = stage.report_values(ingestTime)
+                print("IMPORT TIME", round(time.time() - t0, 3), "INGEST TIME", importStatistics['IngestTime'],
+                      "DECOMPRESS WAIT TIME", importStatistics['DecompressWaitTime'], "DECOMPRESS TIME IN WORKERS", importStatistics['DecompressTime'],
+                      "DECOMPRESSED MB", importStatistics['DecompressedMB'])
+            else:
+                for df in dataFileNames[:args.df]:
+                    print("Importing datafile", df)
+                    copyStr = command2ImportCSV % df
+                    executeStatement(copyStr, args.sco)
 
     # Benchmarks
     try:
         with open(args.r, "w") as report:
             for benchNumber, benchString in enumerate(benchmarksCode, start=1):
+                totalTimes = {}
+                clientTimes = {}
+                transferTimes = {}
+                resultRows = None
+                errstr = ""
+                def runIteration(iii):
+                    global errstr, resultRows
+                    result = executeStatement(benchString, args.sbo)
+                    if result.exec_time is None:
+                        print("Failed to parse command output:", result.output)
+                        errstr = getErrorLine(result.output)
+                        return None
+                    print("Iteration", iii, "exec time", result.exec_time, "total time", result.total_time)
+                    totalTimes[iii - 1] = result.total_time
+                    if args.client == "pymapd":
+                        print("Iteration", iii, "client time", result.client_time, "transfer time", result.transfer_time, "rows", result.rows)
+                        clientTimes[iii - 1] = result.client_time
+                        transferTimes[iii - 1] = result.transfer_time
+                        resultRows = result.rows
+                    return result.exec_time
+                measurementResult = measurement.run(runIteration, "benchmark number %d" % benchNumber)
                 bestExecTime = float("inf")
                 bestTotalTime = float("inf")
-                errstr = ""
-                for iii in range(1, args.t + 1):
-                    print("Running benchmark number", benchNumber, "Iteration number", iii)
-                    try:
-                        process = subprocess.Popen(omnisciCmdLine, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE)
-                        output = str(process.communicate(benchString.encode())[0].strip().decode())
-                    except OSError as err:
-                        print("Failed to start", omnisciCmdLine, err)
-                    if args.sbo:
-                        print(output)
-                    print("Command returned", process.returncode)
-                    execTime = float("inf")
-                    totalTime = float("inf")
-                    if process.returncode == 0:
-                        matches = re.search(timingRegexpRegexp, output).groups()
-                        if len(matches) == 2:
-                            execTime = int(matches[0])
-                            totalTime = int(matches[1])
-                            print("Iteration", iii, "exec time", execTime, "total time", totalTime)
-                        else:
-                            print("Failed to parse command output:", output)
-                            errstr = getErrorLine(strout)
-                    if bestExecTime > execTime:
-                        bestExecTime = execTime
-                    if bestTotalTime > totalTime:
-                        bestTotalTime = totalTime
-                print("BENCHMARK", benchNumber, "exec time", bestExecTime, "total time", bestTotalTime)
+                bestClientTime = None
+                medianTransferTime = None
+                if measurementResult.accepted:
+                    bestExecTime = measurementResult.best
+                    bestTotalTime = min(totalTimes[iii] for iii in measurementResult.accepted)
+                    if clientTimes:
+                        bestClientTime = min(clientTimes[iii] for iii in measurementResult.accepted)
+                        medianTransferTime = int(round(statistics.median(transferTimes[iii] for iii in measurementResult.accepted)))
+                measurementStatistics = measurementResult.report_values()
+                print("BENCHMARK", benchNumber, "exec time", bestExecTime, "total time", bestTotalTime, "median exec time", measurementStatistics['MedianExecTimeMS'])
+                if bestClientTime is not None:
+                    print("BENCHMARK", benchNumber, "client time", bestClientTime, "median transfer time", medianTransferTime, "rows", resultRows)
                 print(dataFilesNumber, ",",
                       fs, ",",
                       benchNumber, ",",
                       bestExecTime, ",",
                       bestTotalTime, ",",
-                      errstr, '\n', file=report, sep='', end='', flush=True)
+                      errstr, ",",
+                      ",".join(str(value) for value in measurementStatistics.values()), ",",
+                      "" if bestClientTime is None else bestClientTime, ",",
+                      "" if medianTransferTime is None else medianTransferTime, ",",
+                      "" if resultRows is None else resultRows, '\n', file=report, sep='', end='', flush=True)
                 if db_reporter is not None:
                     db_reporter.submit({
                         'FilesNumber': dataFilesNumber,
                         'FragmentSize': fs,
                         'BenchName': str(benchNumber),
                         'BestExecTimeMS': bestExecTime,
-                        'BestTotalTimeMS': bestTotalTime
+                        'BestTotalTimeMS': bestTotalTime,
+                        'BestClientTimeMS': bestClientTime,
+                        'MedianTransferTimeMS': medianTransferTime,
+                        'ResultRows': resultRows,
+                        **measurementStatistics
                     })
     except IOError as err:
         print("Failed writing report file", args.r, err)
+
+session.close()
+if fifoSource is not None:
+    print("STREAMED", fifoSource.bytes_written, "BYTES OF DATAFILES IN", fifoSource.passes, "PASSES")
+    fifoSource.close()
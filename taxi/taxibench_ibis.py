@@ -3,7 +3,6 @@ import mysql.connector
 import pandas as pd
 import numpy as np
 import subprocess
-import threading
 import argparse
 import pathlib
 import time
@@ -26,6 +25,8 @@ sys.path.insert(1, path_to_ibis_dir)
 import report
 import server
 import ibis
+from resource_sampler import ResourceSampler
+from measurement import Measurement, add_measurement_arguments
 
 parser = argparse.ArgumentParser(description='Run NY Taxi benchmark using Ibis.')
 
@@ -33,10 +34,17 @@ parser.add_argument('-e', default=omnisci_executable, help='Path to executable "
 parser.add_argument('-r', default="report_taxibench_ibis.csv", help="Report file name.")
 parser.add_argument('-df', default=1, type=int, help="Number of datafiles to input into database for processing.")
 parser.add_argument('-dp', default=taxi_trips_directory, help="Wildcard pattern of datafiles that should be loaded.")
-parser.add_argument('-i', default=5, type=int, help="Number of iterations to run every query. Best result is selected.")
+parser.add_argument('-i', default=5, type=int, help="Minimum number of iterations to run every query. Iterations continue until confidence interval of median time is narrow enough.")
 parser.add_argument('-dnd', action='store_true', help="Do not delete old table.")
 parser.add_argument('-dni', action='store_true', help="Do not create new table and import any data from CSV files.")
+parser.add_argument('-import-workers', default=1, type=int, help="Number of COPY statements to run concurrently during data import.")
+parser.add_argument('-import-mode', default='file', choices=['file', 'wildcard'], help="Import every datafile by its own COPY statement or import group of datafiles per worker by one wildcard COPY statement.")
+parser.add_argument('-decompress-workers', default=0, type=int, help="Number of processes that decompress gzipped datafiles into scratch directory ahead of their COPY import. Supported only in file import mode. By default datafiles are passed to COPY compressed.")
+parser.add_argument('-scratch-dir', help="Directory for datafiles decompressed by -decompress-workers. It should be accessible by server. By default /dev/shm is used if it exists.")
+parser.add_argument('-scratch-mb', default=8192, type=int, help="Maximum size in MB of decompressed datafiles kept in scratch directory.")
+parser.add_argument("-sampling-interval", default=0.1, type=float, help="Interval in seconds between samples of omnisci_server resource usage.")
 parser.add_argument("-port", default=62074, type=int, help="TCP port that omnisql client should use to connect to server.")
+add_measurement_arguments(parser)
 
 parser.add_argument("-db-server", default="localhost", help="Host name of MySQL server.")
 parser.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server.")
@@ -55,15 +63,12 @@ if args.df <= 0:
 
 if args.i < 1:
     print("Bad number of iterations specified", args.i)
-    
-def print_omnisci_output(stdout):
-    for line in iter(stdout.readline, b''):
-        print("OMNISCI>>", line.decode().strip())
+    sys.exit(1)
 
 omnisci_server = server.Omnisci_server(omnisci_executable=args.e, omnisci_port=args.port, database_name=database_name)
-omnisci_server.launch()
+server_startup_time = omnisci_server.launch()
+sampler = ResourceSampler(omnisci_server.server_process.pid, args.sampling_interval).start()
 
-time.sleep(2)
 conn = omnisci_server.connect_to_server()
 
 taxibench_columns_names = ["trip_id","vendor_id","pickup_datetime","dropoff_datetime","store_and_fwd_flag","rate_code_id","pickup_longitude","pickup_latitude","dropoff_longitude","dropoff_latitude","passenger_count","trip_distance","fare_amount","extra","mta_tax","tip_amount","tolls_amount","ehail_fee","improvement_surcharge","total_amount","payment_type","trip_type","pickup","dropoff","cab_type","precipitation","snow_depth","snowfall","max_temperature","min_temperature","average_wind_speed","pickup_nyct2010_gid","pickup_ctlabel","pickup_borocode","pickup_boroname","pickup_ct2010","pickup_boroct2010","pickup_cdeligibil","pickup_ntacode","pickup_ntaname","pickup_puma","dropoff_nyct2010_gid","dropoff_ctlabel","dropoff_borocode","dropoff_boroname","dropoff_ct2010","dropoff_boroct2010","dropoff_cdeligibil","dropoff_ntacode","dropoff_ntaname", "dropoff_puma"]
@@ -80,7 +85,9 @@ if args.db_user is not "":
         'WorstExecTimeMS': 'BIGINT UNSIGNED',
         'BestExecTimeMS': 'BIGINT UNSIGNED',
         'AverageExecTimeMS': 'BIGINT UNSIGNED',
-        'TotalTimeMS': 'BIGINT UNSIGNED'
+        'TotalTimeMS': 'BIGINT UNSIGNED',
+        **Measurement.metrics_fields,
+        **ResourceSampler.metrics_fields
     }, {
         'ScriptName': 'taxibench_ibis.py',
         'CommitHash': args.commit
@@ -114,7 +121,9 @@ if len(data_files_names) == 0:
 # Create table and import data
 if not args.dni:
     # Datafiles import
-    omnisci_server.import_data(table_name=taxibench_table_name, data_files_names=data_files_names, files_limit=args.df, columns_names=taxibench_columns_names, columns_types=taxibench_columns_types, header=False)
+    omnisci_server.import_data(table_name=taxibench_table_name, data_files_names=data_files_names, files_limit=args.df, columns_names=taxibench_columns_names, columns_types=taxibench_columns_types, header=False,
+                               workers=args.import_workers, import_mode=args.import_mode,
+                               decompress_workers=args.decompress_workers, scratch_dir=args.scratch_dir, scratch_bytes=args.scratch_mb * 2**20)
 
 try:
     db = conn.database(database_name)
@@ -150,6 +159,9 @@ def timeq(q):
     q(df)
     return time.time()-t
 
+def rounded(value):
+    return None if value is None else int(round(value))
+
 def queries_exec(index):
     if index == 1:
         return timeq(q1)
@@ -165,28 +177,18 @@ def queries_exec(index):
         return None
 
 try:
-    pt = threading.Thread(target=print_omnisci_output, args=(omnisci_server.server_process.stdout,), daemon=True)
-    pt.start()
-    with open(args.r, "w") as report:
+    with open(args.r, "w") as report_file:
+        report.report_server_time(report_file, db_reporter, report.SERVER_STARTUP, int(round(server_startup_time * 1000)), FilesNumber=data_files_number)
         t_begin = time.time()
+        measurement = Measurement.from_args(args, args.i)
         for bench_number in range(1,5):
-            exec_times = [None]*5
-            best_exec_time = float("inf")
-            worst_exec_time = 0.0
-            first_exec_time = float("inf")
-            times_sum = 0.0
-            for iteration in range(1, args.i + 1):
-                print("RUNNING QUERY NUMBER", bench_number, "ITERATION NUMBER", iteration)
-                exec_times[iteration - 1] = int(round(queries_exec(bench_number) * 1000))
-                if iteration == 1:
-                    first_exec_time = exec_times[iteration - 1]
-                if best_exec_time > exec_times[iteration - 1]:
-                    best_exec_time = exec_times[iteration - 1]
-                if iteration != 1 and worst_exec_time < exec_times[iteration - 1]:
-                    worst_exec_time = exec_times[iteration - 1]
-                if iteration != 1:
-                    times_sum += exec_times[iteration - 1]
-            average_exec_time = times_sum/(args.i - 1)
+            result = measurement.run(sampler.iterations(lambda iteration: int(round(queries_exec(bench_number) * 1000))), "QUERY NUMBER %d" % bench_number)
+            resource_usage = sampler.iterations_usage(result.accepted)
+            first_exec_time = result.first
+            worst_exec_time = result.worst
+            best_exec_time = result.best
+            average_exec_time = rounded(result.average)
+            statistics = result.report_values()
             total_exec_time = int(round((time.time() - t_begin)*1000))
             print("QUERY", bench_number, "EXEC TIME MS", best_exec_time, "TOTAL TIME MS", total_exec_time)
             print("FilesNumber: ", data_files_number,  ",",
@@ -196,7 +198,9 @@ try:
                   "BestExecTimeMS: ", best_exec_time, ",",
                   "AverageExecTimeMS: ", average_exec_time, ",",
                   "TotalTimeMS: ", total_exec_time, ",",
-                  "", '\n', file=report, sep='', end='', flush=True)
+                  "".join(field + ": " + str(value) + "," for field, value in statistics.items()),
+                  "".join(field + ": " + str(value) + "," for field, value in resource_usage.items()),
+                  "", '\n', file=report_file, sep='', end='', flush=True)
             if db_reporter is not None:
                 db_reporter.submit({
                     'FilesNumber': data_files_number,
@@ -205,9 +209,15 @@ try:
                     'WorstExecTimeMS': worst_exec_time,
                     'BestExecTimeMS': best_exec_time,
                     'AverageExecTimeMS': average_exec_time,
-                    'TotalTimeMS': total_exec_time
+                    'TotalTimeMS': total_exec_time,
+                    **statistics,
+                    **resource_usage
                 })
 except IOError as err:
     print("Failed writing report file", args.r, err)
 finally:
-    omnisci_server.terminate()
+    # Sampler reads /proc of server process, so it is stopped before the process exits
+    sampler.stop()
+    server_shutdown_time = omnisci_server.terminate()
+    with open(args.r, "a") as report_file:
+        report.report_server_time(report_file, db_reporter, report.SERVER_SHUTDOWN, int(round(server_shutdown_time * 1000)), FilesNumber=data_files_number)
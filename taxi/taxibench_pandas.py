@@ -4,63 +4,12 @@ import pandas as pd
 import numpy as np
 import argparse
 import pathlib
+import resource
 import time
 import glob
 import sys
 import os
 
-taxi_names = ['trip_id',
-              'vendor_id',
-              'pickup_datetime',
-              'dropoff_datetime',
-              'store_and_fwd_flag',
-              'rate_code_id',
-              'pickup_longitude',
-              'pickup_latitude',
-              'dropoff_longitude',
-              'dropoff_latitude',
-              'passenger_count',
-              'trip_distance',
-              'fare_amount',
-              'extra',
-              'mta_tax',
-              'tip_amount',
-              'tolls_amount',
-              'ehail_fee',
-              'improvement_surcharge',
-              'total_amount',
-              'payment_type',
-              'trip_type',
-              'pickup',
-              'dropoff',
-              'cab_type',
-              'precipitation',
-              'snow_depth',
-              'snowfall',
-              'max_temperature',
-              'min_temperature',
-              'average_wind_speed',
-              'pickup_nyct2010_gid',
-              'pickup_ctlabel',
-              'pickup_borocode',
-              'pickup_boroname',
-              'pickup_ct2010',
-              'pickup_boroct2010',
-              'pickup_cdeligibil',
-              'pickup_ntacode',
-              'pickup_ntaname',
-              'pickup_puma',
-              'dropoff_nyct2010_gid',
-              'dropoff_ctlabel',
-              'dropoff_borocode',
-              'dropoff_boroname',
-              'dropoff_ct2010',
-              'dropoff_boroct2010',
-              'dropoff_cdeligibil',
-              'dropoff_ntacode',
-              'dropoff_ntaname',
-              'dropoff_puma']
-
 #SELECT cab_type,
 #       count(*)
 #FROM trips
@@ -73,8 +22,13 @@ def q1(df):
 #       avg(total_amount)
 #FROM trips
 #GROUP BY passenger_count;
+# Original q2 averages all numeric columns and selects total_amount after it
 def q2(df):
-    return df.groupby('passenger_count',as_index=False).mean()[['passenger_count','total_amount']]
+    return df.groupby('passenger_count',as_index=False).mean(numeric_only=True)[['passenger_count','total_amount']]
+
+# q2 that averages just total_amount, so only two columns are loaded for it
+def q2_selected(df):
+    return df[['passenger_count','total_amount']].groupby('passenger_count',as_index=False).mean()
 
 #SELECT passenger_count,
 #       EXTRACT(year from pickup_datetime) as year,
@@ -83,7 +37,7 @@ def q2(df):
 #GROUP BY passenger_count,
 #         year;
 def q3(df):
-    transformed = df[['passenger_count','pickup_datetime']].transform({'passenger_count':lambda x: x,'pickup_datetime':lambda x:  pd.DatetimeIndex(x).year})
+    transformed = df[['passenger_count','pickup_datetime']].transform({'passenger_count':lambda x: x,'pickup_datetime':lambda x: pd.Series(pd.DatetimeIndex(x).year, index=x.index)})
     return transformed.groupby(['passenger_count','pickup_datetime'])[['passenger_count','pickup_datetime']].count()['passenger_count']
 
 #SELECT passenger_count,
@@ -97,28 +51,169 @@ def q3(df):
 #ORDER BY year,
 #         trips desc;
 def q4(df):
-    transformed = df[['passenger_count','pickup_datetime','trip_distance']].transform({'passenger_count':lambda x: x,'pickup_datetime':lambda x:  pd.DatetimeIndex(x).year,'trip_distance': lambda x: x.round()}).groupby(['passenger_count','pickup_datetime','trip_distance'])
+    transformed = df[['passenger_count','pickup_datetime','trip_distance']].transform({'passenger_count':lambda x: x,'pickup_datetime':lambda x: pd.Series(pd.DatetimeIndex(x).year, index=x.index),'trip_distance': lambda x: x.round()}).groupby(['passenger_count','pickup_datetime','trip_distance'])
     return transformed.size().reset_index().sort_values(by=['pickup_datetime',0],ascending=[True,False])
 
+def pickup_years(df):
+    return pd.DatetimeIndex(df['pickup_datetime']).year.values
+
+# Variants of q3 and q4 that take pickup year from pickup_year column computed
+# once after loading, so they don't include year extraction in query time
+def q3_cached_years(df):
+    return df.groupby(['passenger_count','pickup_year'])['passenger_count'].count()
+
+def q4_cached_years(df):
+    transformed = df[['passenger_count','pickup_year','trip_distance']].transform({'passenger_count':lambda x: x,'pickup_year':lambda x: x,'trip_distance': lambda x: x.round()}).groupby(['passenger_count','pickup_year','trip_distance'])
+    return transformed.size().reset_index().sort_values(by=['pickup_year',0],ascending=[True,False])
+
+def key_values(column):
+    "NumPy array of column values, missing values of nullable integer column are NaN"
+    if column.hasnans:
+        return column.to_numpy(dtype='float64', na_value=np.nan)
+    return column.to_numpy()
+
+def q3_optimized(df):
+    passenger_count = key_values(df['passenger_count'])
+    year = pickup_years(df)
+    (passenger_counts, years), counts = count_by_composite_key([passenger_count, year])
+    index = pd.MultiIndex.from_arrays([passenger_counts.astype(passenger_count.dtype), years.astype(year.dtype)],
+                                      names=['passenger_count', 'pickup_datetime'])
+    return pd.Series(counts, index=index, name='passenger_count')
+
+def q4_optimized(df):
+    passenger_count = key_values(df['passenger_count'])
+    year = pickup_years(df)
+    distance = np.round(df['trip_distance'].values)
+    (passenger_counts, years, distances), counts = count_by_composite_key([passenger_count, year, distance])
+    result = pd.DataFrame({
+        'passenger_count': passenger_counts.astype(passenger_count.dtype),
+        'pickup_datetime': years.astype(year.dtype),
+        'trip_distance': distances.astype(distance.dtype),
+        0: counts
+    })
+    return result.sort_values(by=['pickup_datetime',0],ascending=[True,False])
+
 benchmarks = {
     "MQ01.pd": q1,
-    "MQ02.pd": q2,
+    "MQ02.pd": q2_selected,
     "MQ03.pd": q3,
     "MQ04.pd": q4
 }
 
+optimized_benchmarks = {
+    "MQ03.pd.opt": q3_optimized,
+    "MQ04.pd.opt": q4_optimized
+}
+
+all_columns_benchmarks = {
+    "MQ02.pd.all": q2
+}
+
+cached_years_benchmarks = {
+    "MQ03.pd.years": q3_cached_years,
+    "MQ04.pd.years": q4_cached_years
+}
+
+# Executor of queries on row partitions of loaded dataframe, it is started after loading
+partitioned_executor = None
+
+def q1_partitioned(df):
+    return partitioned_executor.run('q1')
+
+def q2_partitioned(df):
+    return partitioned_executor.run('q2')
+
+def q3_partitioned(df):
+    return partitioned_executor.run('q3')
+
+def q4_partitioned(df):
+    return partitioned_executor.run('q4')
+
+partitioned_benchmarks = {
+    "MQ01.pd.part": q1_partitioned,
+    "MQ02.pd.part": q2_partitioned,
+    "MQ03.pd.part": q3_partitioned,
+    "MQ04.pd.part": q4_partitioned
+}
+
+partitioned_queries = {
+    q1_partitioned: 'q1',
+    q2_partitioned: 'q2',
+    q3_partitioned: 'q3',
+    q4_partitioned: 'q4'
+}
+
+# Queries that are computed together in one pass over datafiles in streaming mode
+stream_benchmarks = {
+    "MQ01.pd.stream": q1,
+    "MQ02.pd.stream": q2_selected,
+    "MQ03.pd.stream": q3,
+    "MQ04.pd.stream": q4
+}
+
+stream_queries = {
+    q1: 'q1',
+    q2_selected: 'q2',
+    q3: 'q3',
+    q4: 'q4'
+}
+
+# Queries that use year of pickup_datetime
+year_queries = [q3, q4, q3_optimized, q4_optimized, q3_cached_years, q4_cached_years, q3_partitioned, q4_partitioned]
+
+# Datafile columns used by queries, only they are loaded
+query_columns = {
+    q1: ['cab_type'],
+    q2_selected: ['passenger_count', 'total_amount'],
+    q3: ['passenger_count', 'pickup_datetime'],
+    q4: ['passenger_count', 'pickup_datetime', 'trip_distance'],
+    q3_optimized: ['passenger_count', 'pickup_datetime'],
+    q4_optimized: ['passenger_count', 'pickup_datetime', 'trip_distance'],
+    q3_cached_years: ['passenger_count', 'pickup_datetime'],
+    q4_cached_years: ['passenger_count', 'pickup_datetime', 'trip_distance'],
+    q1_partitioned: ['cab_type'],
+    q2_partitioned: ['passenger_count', 'total_amount'],
+    q3_partitioned: ['passenger_count', 'pickup_datetime'],
+    q4_partitioned: ['passenger_count', 'pickup_datetime', 'trip_distance']
+}
+
 # Load database reporting functions
 pathToReportDir = os.path.join(pathlib.Path(__file__).parent, "..", "report")
 print(pathToReportDir)
+pathToDatasetDir = os.path.join(pathlib.Path(__file__).parent, "..", "dataset")
 sys.path.insert(1, pathToReportDir)
+sys.path.insert(1, pathToDatasetDir)
 import report
+from parallel_reader import read_datafiles, read_files
+from arrow_dataset import ArrowDataset
+from datasets import taxi_names, taxi_dtypes, read_taxi, read_taxi_chunks
+from measurement import Measurement, add_measurement_arguments
+from memory_profile import MemoryProfiler, add_memory_arguments
+from partitioned_executor import PartitionedExecutor, combine
+import partitioned_executor as partial_queries
+from engines import engines
+from composite_key import count_by_composite_key
+
+# Original q2 averages all numeric columns, so it needs all of them loaded
+query_columns[q2] = [column for column in taxi_names if taxi_dtypes[column] not in ['category', 'str']]
 
 parser = argparse.ArgumentParser(description='Run NY Taxi benchmark using pandas')
 
 parser.add_argument('-r', default="report_pandas.csv", help="Report file name.")
 parser.add_argument('-df', default=1, type=int, help="Number of datafiles to input into database for processing.")
 parser.add_argument('-dp', help="Wildcard pattern of datafiles that should be loaded.")
-parser.add_argument('-i', dest="iterations", default=5, type=int, help="Number of iterations to run every benchmark. Best result is selected.")
+parser.add_argument('-engine', default="pandas", help="Comma separated list of dataframe engines that run queries on loaded data: pandas, " + ", ".join(engines.keys()) + ". Queries of every engine are reported with engine suffix.")
+parser.add_argument('-optimized', action='store_true', help="Run q3 and q4 implemented by counting of composite integer key instead of pandas group by.")
+parser.add_argument('-q2-all-columns', action='store_true', help="Also run original q2 that averages all numeric columns, it is reported as MQ02.pd.all. All numeric columns are loaded for it.")
+parser.add_argument('-cache-years', action='store_true', help="Also run q3 and q4 with pickup year computed once after loading instead of in every query. They are reported as MQ0N.pd.years.")
+parser.add_argument('-i', dest="iterations", default=5, type=int, help="Minimum number of iterations to run every benchmark. Iterations continue until confidence interval of median time is narrow enough.")
+parser.add_argument('-arrow-dir', help="Directory of Arrow dataset. Datafiles are converted to it on first read and memory-mapped from it later.")
+parser.add_argument('-workers', type=int, help="Number of worker processes that execute queries on row partitions of loaded dataframe by merging their partial aggregates. Queries are reported as MQ0N.pd.part with scaling efficiency against serial execution of the same partial aggregation.")
+parser.add_argument('-stream', action='store_true', help="Compute q1-q4 in one pass over datafiles reading them chunk by chunk, only one chunk is held in memory. Every iteration reads datafiles again.")
+parser.add_argument('-chunk-rows', type=int, help="Number of rows in chunk of datafile in streaming mode. By default datafile is one chunk.")
+parser.add_argument('-read-workers', type=int, help="Number of processes that read datafiles in parallel. By default number of CPUs is used.")
+add_measurement_arguments(parser)
+add_memory_arguments(parser)
 
 parser.add_argument("-db-server", default="localhost", help="Host name of MySQL server")
 parser.add_argument("-db-port", default=3306, type=int, help="Port number of MySQL server")
@@ -136,7 +231,77 @@ if args.df <= 0:
     sys.exit(1)
 
 if args.iterations < 1:
-    print("Bad number of iterations specified", args.t)
+    print("Bad number of iterations specified", args.iterations)
+    sys.exit(1)
+
+if args.workers is not None and args.workers < 1:
+    print("Bad number of workers specified", args.workers)
+    sys.exit(1)
+
+if args.optimized and args.workers is not None:
+    print("Switches -optimized and -workers cannot be used together")
+    sys.exit(1)
+
+engine_names = args.engine.split(',')
+for engine_name in engine_names:
+    if engine_name != "pandas" and engine_name not in engines:
+        print("Unknown engine specified", engine_name)
+        sys.exit(1)
+    if engine_name != "pandas" and not engines[engine_name].available():
+        print("Engine", engine_name, "is not installed, module", engines[engine_name].required_module, "is required")
+        sys.exit(1)
+
+if args.stream and engine_names != ["pandas"]:
+    print("Switch -stream can be used only with pandas engine")
+    sys.exit(1)
+
+if args.chunk_rows is not None and args.chunk_rows < 1:
+    print("Bad number of chunk rows specified", args.chunk_rows)
+    sys.exit(1)
+
+if args.stream and (args.optimized or args.workers is not None):
+    print("Switch -stream cannot be used together with -optimized or -workers")
+    sys.exit(1)
+
+if args.optimized:
+    del benchmarks["MQ03.pd"], benchmarks["MQ04.pd"]
+    benchmarks.update(optimized_benchmarks)
+
+if args.q2_all_columns:
+    benchmarks.update(all_columns_benchmarks)
+
+if args.cache_years:
+    benchmarks.update(cached_years_benchmarks)
+
+if args.workers is not None:
+    benchmarks = partitioned_benchmarks
+
+if args.stream:
+    benchmarks = stream_benchmarks
+
+if "pandas" not in engine_names:
+    benchmarks = {}
+
+# Engines are created after loading, queries of engine use the same columns as pandas queries
+engine_instances = {}
+engine_queries = {}
+
+def engine_query(engine_name, query_name):
+    def query(df):
+        return getattr(engine_instances[engine_name], query_name)()
+    return query
+
+for engine_name in engine_names:
+    if engine_name == "pandas":
+        continue
+    # Engines implement q2 that averages just total_amount
+    for query_number, (query_name, pandas_query) in enumerate([('q1', q1), ('q2', q2_selected), ('q3', q3), ('q4', q4)], 1):
+        query = engine_query(engine_name, query_name)
+        benchmarks["MQ%02d.%s" % (query_number, engines[engine_name].suffix)] = query
+        engine_queries[query] = (engine_name, query_name)
+        query_columns[query] = query_columns[pandas_query]
+        if pandas_query in year_queries:
+            year_queries.append(query)
 
 db_reporter = None
 if args.db_user is not "":
@@ -151,7 +316,16 @@ if args.db_user is not "":
         'WorstExecTimeMS': 'BIGINT UNSIGNED',
         'WorstTotalTimeMS': 'BIGINT UNSIGNED',
         'AverageExecTimeMS': 'BIGINT UNSIGNED',
-        'AverageTotalTimeMS': 'BIGINT UNSIGNED'
+        'AverageTotalTimeMS': 'BIGINT UNSIGNED',
+        'BytesPerRow': 'DOUBLE',
+        'Workers': 'INT UNSIGNED',
+        'SerialMedianExecTimeMS': 'BIGINT UNSIGNED',
+        'ScalingEfficiency': 'DOUBLE',
+        'PeakMemoryMB': 'DOUBLE',
+        'CompileTimeMS': 'BIGINT UNSIGNED',
+        **MemoryProfiler.metrics_fields,
+        'RowsPerSecond': 'DOUBLE',
+        **Measurement.metrics_fields
     }, {
         'ScriptName': 'taxibench_pandas.py',
         'CommitHash': args.commit
@@ -163,49 +337,212 @@ if len(dataFileNames) == 0:
     print("Could not find any data files matching", args.dp)
     sys.exit(2)
 
-print("READING", args.df, "DATAFILES")
+arrow_dataset = None
+if args.arrow_dir is not None:
+    arrow_dataset = ArrowDataset(args.arrow_dir)
+
 dataFilesNumber = len(dataFileNames[:args.df])
-def read_datafile(f):
+def read_datafile(f, columns):
+    print("READING DATAFILE", f)
+    if arrow_dataset is not None:
+        return arrow_dataset.read(f, 'taxi', read_taxi, columns)
+    return read_taxi(f, columns)
+
+def read_chunks(f, columns):
     print("READING DATAFILE", f)
-    return pd.read_csv(f, compression='gzip', header=None, names=taxi_names)
-df_from_each_file = (read_datafile(f) for f in dataFileNames[:args.df])
-concatenated_df = pd.concat(df_from_each_file, ignore_index=True)
+    if arrow_dataset is not None and args.chunk_rows is not None:
+        # Only record batches of current chunk are mapped and converted
+        yield from arrow_dataset.read_chunks(f, 'taxi', read_taxi, args.chunk_rows, columns)
+    elif arrow_dataset is not None:
+        yield arrow_dataset.read(f, 'taxi', read_taxi, columns)
+    else:
+        yield from read_taxi_chunks(f, columns, args.chunk_rows)
+
+def peak_memory_mb():
+    "Peak resident set size of this process in MB"
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+loaded_columns = [column for column in taxi_names if any(column in query_columns[query] for query in benchmarks.values())]
+print("LOADING COLUMNS", loaded_columns)
+read_workers = args.read_workers
+if arrow_dataset is not None:
+    # Datafiles that are not converted yet are converted in parallel, mapping doesn't need it
+    read_files(lambda f: arrow_dataset.convert(f, 'taxi', read_taxi),
+               [f for f in dataFileNames[:args.df] if not arrow_dataset.converted(f, 'taxi', read_taxi)], read_workers)
+    read_workers = 1
+if not args.stream:
+    print("READING", args.df, "DATAFILES")
+    t1 = time.time()
+    concatenated_df = read_datafiles(lambda f: read_datafile(f, loaded_columns), dataFileNames[:args.df], read_workers)
+    print("READING TIME", int(round((time.time() - t1) * 1000)))
+    bytesPerRow = concatenated_df.memory_usage(index=False, deep=True).sum() / max(len(concatenated_df), 1)
+    print("LOADED", len(concatenated_df), "ROWS", "BYTES PER ROW", round(bytesPerRow, 2))
+    # Years of loaded frame are passed to engines and executor, they are not part of their query times
+    years = None
+    if any(query in year_queries for query in benchmarks.values()):
+        years = pickup_years(concatenated_df)
+    if any(query in cached_years_benchmarks.values() for query in benchmarks.values()):
+        concatenated_df['pickup_year'] = years
+    for engine_name in engine_names:
+        if engine_name != "pandas":
+            engine_instances[engine_name] = engines[engine_name](concatenated_df, years)
+    if args.workers is not None:
+        # Worker processes are forked after loading, so they share loaded rows with this process
+        partitioned_executor = PartitionedExecutor(concatenated_df, args.workers, years)
+
+# Times of every query in streaming passes and size of streamed data
+stream_query_times = {query_name: [] for query_name in stream_queries.values()}
+streamed_rows = 0
+streamed_bytes = 0
+
+def run_stream_pass(iteration):
+    """Read datafiles chunk by chunk and combine partial aggregates of every query
+    with partial aggregates of previous chunks, return time of pass"""
+
+    global streamed_rows, streamed_bytes
+    partials = {query_name: None for query_name in stream_queries.values()}
+    query_times = {query_name: 0.0 for query_name in stream_queries.values()}
+    rows = 0
+    chunks_bytes = 0
+    t1 = time.time()
+    for f in dataFileNames[:dataFilesNumber]:
+        for chunk in read_chunks(f, loaded_columns):
+            years = pd.DatetimeIndex(chunk['pickup_datetime']).year.values
+            for query_name in partials:
+                partial, _ = partial_queries.queries[query_name]
+                t2 = time.time()
+                chunk_partial = partial(chunk, years)
+                if partials[query_name] is not None:
+                    chunk_partial = combine([partials[query_name], chunk_partial])
+                partials[query_name] = chunk_partial
+                query_times[query_name] += time.time() - t2
+            rows += len(chunk)
+            chunks_bytes += chunk.memory_usage(index=False, deep=True).sum()
+            # Chunk is freed before next one is read
+            del chunk, years
+    for query_name, partial in partials.items():
+        _, merge = partial_queries.queries[query_name]
+        t2 = time.time()
+        merge([partial])
+        query_times[query_name] += time.time() - t2
+    for query_name, query_time in query_times.items():
+        stream_query_times[query_name].append(int(round(query_time * 1000)))
+    streamed_rows = rows
+    streamed_bytes = chunks_bytes
+    return int(round((time.time() - t1) * 1000))
+
+def run_query(query):
+    query_df = concatenated_df
+    t1 = time.time()
+    query(query_df)
+    t2 = time.time()
+    return int(round((t2 - t1) * 1000))
+
+measurement = Measurement.from_args(args, args.iterations)
+memory_profiler = MemoryProfiler.from_args(args)
+rowsPerSecond = None
+if args.stream:
+    print("STREAMING", dataFilesNumber, "DATAFILES")
+    stream_result = measurement.run(run_stream_pass, "STREAMING PASS")
+    bytesPerRow = streamed_bytes / max(streamed_rows, 1)
+    if stream_result.median:
+        rowsPerSecond = round(streamed_rows / (stream_result.median / 1000), 1)
+    if memory_profiler.enabled:
+        with memory_profiler.profile("STREAMING PASS"):
+            run_stream_pass(0)
+        # Profiled pass is not measured
+        for query_times in stream_query_times.values():
+            query_times.pop()
+    print("STREAMED", streamed_rows, "ROWS", "BYTES PER ROW", round(bytesPerRow, 2), "ROWS PER SECOND", rowsPerSecond,
+          "MEDIAN PASS TIME", stream_result.median, "PEAK MEMORY MB", round(peak_memory_mb(), 1))
 
 try:
     with open(args.r, "w") as report:
         for benchName, query in benchmarks.items():
-            bestExecTime = float("inf")
-            for iii in range(1, args.iterations + 1):
-                print("RUNNING BENCHMARK NUMBER", benchName, "ITERATION NUMBER", iii)
-                query_df = concatenated_df
-                t1 = time.time()
-                query(query_df)
-                t2 = time.time()
-                ttt = int(round((t2 - t1) * 1000))
-                if bestExecTime > ttt:
-                    bestExecTime = ttt
-            print("BENCHMARK", benchName, "EXEC TIME", bestExecTime)
+            if args.stream:
+                result = measurement.analyze(stream_query_times[stream_queries[query]])
+                totalResult = stream_result
+            else:
+                result = measurement.run(lambda iteration: run_query(query), "BENCHMARK " + benchName)
+                totalResult = result
+            bestExecTime = result.best
+            worstExecTime = result.worst
+            averageExecTime = int(round(result.average))
+            bestTotalTime = totalResult.best
+            worstTotalTime = totalResult.worst
+            averageTotalTime = int(round(totalResult.average))
+            statistics = result.report_values()
+            peakMemory = round(peak_memory_mb(), 1)
+            if args.stream:
+                memoryStatistics = memory_profiler.report_values("STREAMING PASS")
+            else:
+                if memory_profiler.enabled:
+                    # Query runs once more, so profiling doesn't affect measured iterations
+                    with memory_profiler.profile(benchName):
+                        run_query(query)
+                memoryStatistics = memory_profiler.report_values(benchName)
+            print("BENCHMARK", benchName, "EXEC TIME", bestExecTime, "MEDIAN EXEC TIME", statistics['MedianExecTimeMS'],
+                  "PEAK MEMORY MB", peakMemory)
+            compileTime = None
+            if query in engine_queries:
+                engine_name, query_name = engine_queries[query]
+                compileTime = engine_instances[engine_name].compile_times.get(query_name)
+                if compileTime is not None:
+                    print("BENCHMARK", benchName, "COMPILE TIME", compileTime)
+            serialExecTime = None
+            scalingEfficiency = None
+            if query in partitioned_queries and result.median is not None:
+                query_name = partitioned_queries[query]
+                serial = measurement.run(lambda iteration: run_query(lambda df: partitioned_executor.run(query_name, serial=True)),
+                                         "SERIAL BENCHMARK " + benchName)
+                if serial.median is not None:
+                    serialExecTime = int(round(serial.median))
+                    speedup = serial.median / max(result.median, 1)
+                    scalingEfficiency = round(speedup / args.workers, 3)
+                    print("BENCHMARK", benchName, "WORKERS", args.workers, "SERIAL MEDIAN EXEC TIME", serialExecTime,
+                          "SPEEDUP", round(speedup, 2), "SCALING EFFICIENCY", scalingEfficiency)
             print(dataFilesNumber, ",",
                   0, ",",
                   benchName, ",",
                   bestExecTime, ",",
-                  bestExecTime, ",",
-                  bestExecTime, ",",
-                  bestExecTime, ",",
-                  bestExecTime, ",",
-                  bestExecTime, ",",
-                  "", '\n', file=report, sep='', end='', flush=True)
+                  bestTotalTime, ",",
+                  worstExecTime, ",",
+                  worstTotalTime, ",",
+                  averageExecTime, ",",
+                  averageTotalTime, ",",
+                  "", ",",
+                  ",".join(str(value) for value in statistics.values()), ",",
+                  round(bytesPerRow, 2), ",",
+                  args.workers or "", ",",
+                  "" if serialExecTime is None else serialExecTime, ",",
+                  "" if scalingEfficiency is None else scalingEfficiency, ",",
+                  peakMemory, ",",
+                  "" if rowsPerSecond is None else rowsPerSecond, ",",
+                  "" if compileTime is None else compileTime, ",",
+                  ",".join("" if value is None else str(value) for value in memoryStatistics.values()), '\n', file=report, sep='', end='', flush=True)
             if db_reporter is not None:
                 db_reporter.submit({
                     'FilesNumber': dataFilesNumber,
                     'FragmentSize': 0,
                     'BenchName': benchName,
                     'BestExecTimeMS': bestExecTime,
-                    'BestTotalTimeMS': bestExecTime,
-                    'WorstExecTimeMS': bestExecTime,
-                    'WorstTotalTimeMS': bestExecTime,
-                    'AverageExecTimeMS': bestExecTime,
-                    'AverageTotalTimeMS': bestExecTime
+                    'BestTotalTimeMS': bestTotalTime,
+                    'WorstExecTimeMS': worstExecTime,
+                    'WorstTotalTimeMS': worstTotalTime,
+                    'AverageExecTimeMS': averageExecTime,
+                    'AverageTotalTimeMS': averageTotalTime,
+                    'BytesPerRow': bytesPerRow,
+                    'Workers': args.workers,
+                    'SerialMedianExecTimeMS': serialExecTime,
+                    'ScalingEfficiency': scalingEfficiency,
+                    'PeakMemoryMB': peakMemory,
+                    'RowsPerSecond': rowsPerSecond,
+                    'CompileTimeMS': compileTime,
+                    **memoryStatistics,
+                    **statistics
                 })
 except IOError as err:
     print("Failed writing report file", args.r, err)
+finally:
+    if partitioned_executor is not None:
+        partitioned_executor.close()
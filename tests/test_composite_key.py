@@ -0,0 +1,44 @@
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(1, os.path.join(pathlib.Path(__file__).parent, "..", "taxi"))
+from composite_key import count_by_composite_key
+
+def groupby_counts(columns):
+    df = pd.DataFrame({i: column for i, column in enumerate(columns)})
+    return df.groupby(list(df.columns)).size()
+
+def check_counts(columns):
+    unique, counts = count_by_composite_key(columns)
+    expected = groupby_counts(columns)
+    assert len(counts) == len(expected)
+    for i, level in enumerate(unique):
+        np.testing.assert_array_equal(level, expected.index.get_level_values(i).to_numpy())
+    np.testing.assert_array_equal(counts, expected.to_numpy())
+
+def test_counts_equal_groupby_size_for_dense_keys():
+    rng = np.random.default_rng(0)
+    check_counts([rng.integers(0, 7, 10000), rng.integers(2009, 2016, 10000), rng.integers(-3, 50, 10000)])
+
+def test_counts_equal_groupby_size_for_sparse_keys():
+    # Key space is larger than 4 keys per row, so keys are counted by np.unique
+    rng = np.random.default_rng(1)
+    check_counts([rng.integers(0, 10**6, 1000), rng.integers(-10**6, 0, 1000)])
+
+def test_counts_equal_groupby_size_when_key_space_overflows_int64():
+    rng = np.random.default_rng(2)
+    check_counts([rng.integers(0, 2**40, 500), rng.integers(0, 2**40, 500)])
+
+def test_rows_with_nan_are_skipped():
+    passenger_count = np.array([1, np.nan, 2, 1, 2, np.nan])
+    year = np.array([2010, 2010, 2011, 2010, 2011, 2012])
+    (passenger_counts, years), counts = count_by_composite_key([passenger_count, year])
+    assert passenger_counts.tolist() == [1, 2]
+    assert years.tolist() == [2010, 2011]
+    assert counts.tolist() == [2, 2]
+    (passenger_counts, years), counts = count_by_composite_key([np.array([np.nan]), np.array([2010])])
+    assert len(passenger_counts) == len(years) == len(counts) == 0
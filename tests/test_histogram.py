@@ -0,0 +1,49 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(1, os.path.join(pathlib.Path(__file__).parent, "..", "report"))
+from histogram import LatencyHistogram
+
+def test_percentiles_have_bounded_relative_error():
+    histogram = LatencyHistogram(precision=0.01)
+    for value in range(1, 1001):
+        histogram.record(value)
+    assert histogram.count == 1000
+    assert (histogram.min, histogram.max) == (1, 1000)
+    for percent, exact in [(50, 500), (95, 950), (99, 990), (99.9, 999)]:
+        assert histogram.percentile(percent) == pytest.approx(exact, rel=0.01)
+    assert histogram.percentile(100) == pytest.approx(1000, rel=0.01)
+
+def test_percentiles_are_clamped_to_recorded_range():
+    histogram = LatencyHistogram()
+    histogram.record(42, count=10)
+    assert histogram.percentile(0) == 42
+    assert histogram.percentile(99.9) == 42
+    assert LatencyHistogram().percentile(50) is None
+
+def test_serialize_round_trip():
+    histogram = LatencyHistogram()
+    for value in [0.0001, 1, 5, 5, 250, 12345]:
+        histogram.record(value)
+    text = histogram.serialize()
+    assert "," not in text
+    restored = LatencyHistogram.deserialize(text)
+    assert restored.serialize() == text
+    assert restored.counts == histogram.counts
+    assert restored.count == histogram.count
+    assert (restored.min, restored.max) == (histogram.min, histogram.max)
+    assert restored.report_values() == histogram.report_values()
+    empty = LatencyHistogram.deserialize(LatencyHistogram().serialize())
+    assert empty.count == 0 and empty.min is None
+
+def test_merge_equals_recording_all_values():
+    first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for value in range(1, 100):
+        (first if value % 2 else second).record(value)
+        combined.record(value)
+    assert first.merge(second).serialize() == combined.serialize()
+    with pytest.raises(ValueError):
+        first.merge(LatencyHistogram(precision=0.1))
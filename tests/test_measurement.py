@@ -0,0 +1,48 @@
+import os
+import pathlib
+import sys
+
+sys.path.insert(1, os.path.join(pathlib.Path(__file__).parent, "..", "report"))
+from measurement import Measurement, percentile
+
+def test_percentile_interpolates_between_ranks():
+    values = [10, 20, 30, 40]
+    assert percentile(values, 0) == 10
+    assert percentile(values, 50) == 25
+    assert percentile(values, 100) == 40
+    assert percentile([7], 90) == 7
+
+def test_median_confidence_interval_of_known_sample():
+    # For n=100 and 95% confidence order statistics of ranks 40 and 60 bound the median
+    result = Measurement(confidence=0.95).analyze(list(range(1, 101)))
+    assert result.warmup == 0
+    assert len(result.accepted) == 100
+    assert result.median == 50.5
+    assert (result.ci_low, result.ci_high) == (41, 61)
+    assert result.best == 1 and result.worst == 100
+
+def test_warmup_and_outliers_are_rejected():
+    times = [500, 300, 100, 101, 99, 100, 102, 98, 100, 1000, 100]
+    result = Measurement(max_warmup=3).analyze(times)
+    assert result.warmup == 2
+    assert 9 not in result.accepted
+    assert result.outliers == 1
+    assert result.median == 100
+    assert result.first == 500
+
+def test_run_stops_when_interval_is_narrow():
+    measurement = Measurement(min_iterations=5, max_iterations=100, target_ci=0.05, time_budget=60)
+    result = measurement.run(lambda iteration: 100)
+    assert result.iterations == 5
+    assert result.ci_relative_width() == 0.0
+
+def test_run_stops_at_failed_iteration():
+    result = Measurement(min_iterations=5).run(lambda iteration: None if iteration == 3 else 100)
+    assert result.iterations == 2
+    assert result.error == "Iteration 3 failed"
+
+def test_histogram_excludes_warmup_and_outliers():
+    times = [500, 300, 100, 101, 99, 100, 102, 98, 100, 1000, 100]
+    result = Measurement(max_warmup=3).analyze(times)
+    assert result.histogram.count == len(result.accepted)
+    assert result.histogram.max < 1000